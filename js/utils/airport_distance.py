@@ -0,0 +1,103 @@
+import os
+import csv
+import json
+import functools
+import numpy as np
+from model_registry import MODELS_DIR
+
+DISTANCES_CSV = os.path.join(MODELS_DIR, 'top30_airport_distances.csv')
+AIRPORTS_GEOJSON = os.path.normpath(os.path.join(MODELS_DIR, '..', 'assets', 'airports.geojson'))
+
+# 地球平均半径 (英里)
+EARTH_RADIUS_MILES = 3958.8
+
+# 无法确定距离时的返回值 (与原 get_airport_distance 的行为一致)
+DEFAULT_DISTANCE = 1.0
+
+
+class AirportDistanceIndex:
+    """
+    Airport-pair distances in miles.
+
+    Pairs listed in top30_airport_distances.csv are answered from a symmetric
+    hash index built once at load time. Other pairs use the great-circle
+    (haversine) distance between the airport coordinates in airports.geojson,
+    rounded to whole miles like the CSV. Unknown airports get DEFAULT_DISTANCE.
+
+    Parameters:
+    csv_path (str): Path of the known pair distances
+    geojson_path (str): Path of the airport points (IATA property, [lon, lat] coordinates)
+    """
+
+    def __init__(self, csv_path=DISTANCES_CSV, geojson_path=AIRPORTS_GEOJSON):
+        self.pairs = {}
+        with open(csv_path, mode='r') as file:
+            for row in csv.DictReader(file):
+                if row['Distance']:
+                    distance = float(row['Distance'])
+                    self.pairs[(row['Origin'], row['Destination'])] = distance
+                    self.pairs[(row['Destination'], row['Origin'])] = distance
+
+        with open(geojson_path, mode='r') as file:
+            features = json.load(file)['features']
+        # 跳过没有坐标的机场 (例如 ISN 的坐标为 null)
+        features = [feature for feature in features if None not in feature['geometry']['coordinates']]
+        self.airports = {feature['properties']['IATA']: i for i, feature in enumerate(features)}
+        coordinates = np.radians(np.array([feature['geometry']['coordinates'] for feature in features], dtype=np.float64))
+        self.lon = coordinates[:, 0]
+        self.lat = coordinates[:, 1]
+
+    def great_circle(self, origins, destinations):
+        """
+        Vectorized haversine distance in miles (not rounded).
+
+        Returns:
+        ndarray: Distances, NaN where either airport is unknown
+        """
+        o = np.array([self.airports.get(code, -1) for code in origins], dtype=np.intp)
+        d = np.array([self.airports.get(code, -1) for code in destinations], dtype=np.intp)
+        known = (o >= 0) & (d >= 0)
+        o, d = np.where(known, o, 0), np.where(known, d, 0)
+
+        a = (np.sin((self.lat[d] - self.lat[o]) / 2) ** 2 +
+             np.cos(self.lat[o]) * np.cos(self.lat[d]) * np.sin((self.lon[d] - self.lon[o]) / 2) ** 2)
+        distance = 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+        return np.where(known, distance, np.nan)
+
+    def distances(self, origins, destinations, default=DEFAULT_DISTANCE):
+        """
+        Distances for arrays of origin and destination IATA codes.
+
+        Returns:
+        ndarray: One distance per pair; default where an airport is unknown or origin == destination
+        """
+        result = np.array([self.pairs.get((o, d), np.nan) for o, d in zip(origins, destinations)], dtype=np.float64)
+        missing = np.flatnonzero(np.isnan(result))
+        if len(missing):
+            origins = [origins[i] for i in missing]
+            destinations = [destinations[i] for i in missing]
+            computed = np.round(self.great_circle(origins, destinations))
+            computed[np.isnan(computed) | (computed == 0)] = default
+            result[missing] = computed
+        return result
+
+    def distance(self, origin, destination, default=DEFAULT_DISTANCE):
+        """Distance for one pair, see distances()."""
+        distance = self.pairs.get((origin, destination))
+        if distance is not None:
+            return distance
+        return float(self.distances([origin], [destination], default)[0])
+
+
+@functools.lru_cache(maxsize=None)
+def get_index():
+    """The process-wide AirportDistanceIndex, loaded on first use."""
+    return AirportDistanceIndex()
+
+
+def get_distance(origin, destination):
+    return get_index().distance(origin, destination)
+
+
+def get_distances(origins, destinations):
+    return get_index().distances(list(origins), list(destinations))
@@ -0,0 +1,174 @@
+import re
+import json
+import functools
+import numpy as np
+from airport_distance import AIRPORTS_GEOJSON, EARTH_RADIUS_MILES
+
+# 每个前缀节点保存的最多候选机场数 (按旅客量排序)
+MAX_SUGGESTIONS = 20
+
+# 接口允许的最大返回数量和搜索半径
+MAX_RESULTS = 50
+MAX_RADIUS_MILES = 3000.0
+
+
+def _unit_vectors(lat, lon):
+    lat, lon = np.radians(lat), np.radians(lon)
+    return np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+
+def _chord_to_miles(chord):
+    # 单位球上的弦长换算为大圆距离
+    return 2 * EARTH_RADIUS_MILES * np.arcsin(np.minimum(np.asarray(chord) / 2, 1.0))
+
+
+class AirportIndex:
+    """
+    Nearest-airport and prefix search over airports.geojson, built once.
+
+    Airports are stored as unit vectors in a KD-tree, so the straight-line
+    (chord) distance between two points orders them the same way as the
+    great-circle distance. The prefix trie covers IATA codes and every word
+    of the airport names, and each node keeps its MAX_SUGGESTIONS best
+    airports ranked by enplanements (TOT_ENP), so a search only walks the
+    prefix. Searches the node list cannot answer in full (more results than
+    it holds, or several words) scan all airports busiest first.
+
+    Parameters:
+    geojson_path (str): Path of the airport points (IATA, AIRPT_NAME, TOT_ENP properties)
+    """
+
+    def __init__(self, geojson_path=AIRPORTS_GEOJSON):
+        with open(geojson_path, mode='r') as file:
+            features = json.load(file)['features']
+        # 跳过没有坐标的机场 (例如 ISN 的坐标为 null)
+        features = [feature for feature in features if None not in feature['geometry']['coordinates']]
+        self.airports = [{
+            "iata": feature['properties']['IATA'],
+            "name": feature['properties']['AIRPT_NAME'],
+            "enplanements": feature['properties']['TOT_ENP'] or 0,
+            "lat": feature['geometry']['coordinates'][1],
+            "lon": feature['geometry']['coordinates'][0]
+        } for feature in features]
+
+        from scipy.spatial import cKDTree
+
+        self.tree = cKDTree(_unit_vectors([a['lat'] for a in self.airports], [a['lon'] for a in self.airports]))
+        self.trie = self._build_trie()
+
+    def _build_trie(self):
+        # 节点: {字符: 子节点, None: 候选机场下标列表}
+        root = {None: []}
+        ranked = self.ranked = sorted(range(len(self.airports)), key=lambda i: -self.airports[i]['enplanements'])
+        self.terms = [{a['iata'].lower()} | set(re.findall(r'[a-z0-9]+', a['name'].lower())) for a in self.airports]
+        for i in ranked:
+            for term in self.terms[i]:
+                node = root
+                for char in term:
+                    node = node.setdefault(char, {None: []})
+                    # 按旅客量从高到低插入，同一机场的多个词可能共享前缀
+                    if len(node[None]) < MAX_SUGGESTIONS and (not node[None] or node[None][-1] != i):
+                        node[None].append(i)
+        return root
+
+    def _result(self, i, distance=None):
+        airport = dict(self.airports[i])
+        if distance is not None:
+            airport['distance_miles'] = round(float(distance), 1)
+        return airport
+
+    def nearest(self, lat, lon, k=5):
+        """
+        Returns:
+        list: The k airports closest to (lat, lon), nearest first, with distance_miles
+        """
+        k = min(k, len(self.airports))
+        chords, indices = self.tree.query(_unit_vectors([lat], [lon])[0], k=k)
+        chords, indices = np.atleast_1d(chords), np.atleast_1d(indices)
+        return [self._result(i, d) for i, d in zip(indices, _chord_to_miles(chords))]
+
+    def within(self, lat, lon, radius_miles, limit=MAX_RESULTS):
+        """
+        Returns:
+        list: Airports within radius_miles of (lat, lon), nearest first (at most limit), with distance_miles
+        """
+        point = _unit_vectors([lat], [lon])[0]
+        chord = 2 * np.sin(min(radius_miles / EARTH_RADIUS_MILES, np.pi) / 2)
+        indices = self.tree.query_ball_point(point, chord)
+        distances = _chord_to_miles(np.linalg.norm(self.tree.data[indices] - point, axis=1)) if indices else []
+        order = np.argsort(distances, kind='stable')[:limit]
+        return [self._result(indices[i], distances[i]) for i in order]
+
+    def search(self, prefix, limit=10):
+        """
+        Returns:
+        list: Airports whose IATA code or a word of whose name starts with prefix, busiest first
+        """
+        terms = re.findall(r'[a-z0-9]+', prefix.lower())
+        if not terms:
+            return []
+        node = self.trie
+        for char in terms[0]:
+            node = node.get(char)
+            if node is None:
+                return []
+        # 节点只保存最繁忙的 MAX_SUGGESTIONS 个机场，列表已满时可能被截断
+        complete = len(node[None]) < MAX_SUGGESTIONS
+        if len(terms) == 1 and (complete or limit <= len(node[None])):
+            return [self._result(i) for i in node[None][:limit]]
+        # 多个词时每个词都必须是该机场某个词的前缀；候选列表被截断时按旅客量顺序扫描全部机场 (数量只有几百个)
+        candidates = node[None] if complete else self.ranked
+        matches = [i for i in candidates
+                   if all(any(t.startswith(term) for t in self.terms[i]) for term in terms)]
+        return [self._result(i) for i in matches[:limit]]
+
+
+@functools.lru_cache(maxsize=None)
+def get_airport_index():
+    """The process-wide AirportIndex, built on first use."""
+    return AirportIndex()
+
+
+def search_airports(params):
+    """
+    Answers GET /airports/search from query-string parameters.
+
+    Parameters:
+    params (dict): 'q' (prefix of an IATA code or of words in the airport name), optional 'limit'
+
+    Returns:
+    tuple: (payload dict, HTTP status)
+    """
+    if 'q' not in params:
+        return {'error': "Missing parameter 'q'"}, 400
+    try:
+        limit = max(1, min(int(params.get('limit', 10)), MAX_RESULTS))
+    except ValueError as e:
+        return {'error': f"Invalid parameter: {e}"}, 400
+    return {'airports': get_airport_index().search(params['q'], limit)}, 200
+
+
+def nearest_airports(params):
+    """
+    Answers GET /airports/nearest from query-string parameters.
+
+    Parameters:
+    params (dict): 'lat' and 'lon', plus either 'k' (number of nearest airports, default 5)
+        or 'radius' (all airports within that many miles)
+
+    Returns:
+    tuple: (payload dict, HTTP status)
+    """
+    try:
+        lat, lon = float(params['lat']), float(params['lon'])
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+            return {'error': "'lat' must be in [-90, 90] and 'lon' in [-180, 180]"}, 400
+        if 'radius' in params:
+            radius = max(0.0, min(float(params['radius']), MAX_RADIUS_MILES))
+            return {'airports': get_airport_index().within(lat, lon, radius)}, 200
+        k = max(1, min(int(params.get('k', 5)), MAX_RESULTS))
+        return {'airports': get_airport_index().nearest(lat, lon, k)}, 200
+    except KeyError as e:
+        return {'error': f"Missing parameter {e}"}, 400
+    except ValueError as e:
+        return {'error': f"Invalid parameter: {e}"}, 400
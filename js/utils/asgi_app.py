@@ -0,0 +1,225 @@
+import os
+import json
+import time
+import asyncio
+import logging
+from urllib.parse import parse_qsl
+from concurrent.futures import ThreadPoolExecutor
+import warmup
+import shared_models
+import prediction_service
+from prediction_service import predict_single, submit_single, predict_batch, MAX_BATCH_SIZE
+from model_registry import registry
+from airport_index import search_airports, nearest_airports
+import metrics
+
+# 推理线程池大小。sklearn 的 predict_proba 和 torch 的前向传播在计算时会释放 GIL，
+# 共享的只读模型可以被多个线程同时使用，模型加载由注册表的按键锁保护
+INFERENCE_THREADS = int(os.environ.get('INFERENCE_THREADS', min(4, os.cpu_count() or 1)))
+
+# 同时等待或正在执行的推理请求上限，超出时直接返回 503 而不是无限排队
+INFERENCE_QUEUE_MAX = int(os.environ.get('INFERENCE_QUEUE_MAX', INFERENCE_THREADS * 16))
+
+executor = ThreadPoolExecutor(max_workers=INFERENCE_THREADS, thread_name_prefix='inference')
+_in_flight = 0
+
+CORS_HEADERS = [
+    (b'access-control-allow-origin', b'*'),
+    (b'access-control-allow-headers', b'Content-Type'),
+    (b'access-control-allow-methods', b'GET, POST, OPTIONS')
+]
+
+
+async def _read_json(receive):
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            break
+    return json.loads(body) if body else None
+
+
+async def _send_json(send, payload, status=200):
+    # 字符串响应 (/metrics) 以 Prometheus 文本格式发送，其余为 JSON
+    if isinstance(payload, str):
+        body, content_type = payload.encode(), metrics.CONTENT_TYPE.encode()
+    else:
+        body, content_type = json.dumps(payload).encode(), b'application/json'
+    headers = [(b'content-type', content_type), (b'content-length', str(len(body)).encode())] + CORS_HEADERS
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+def _in_pool(fn, *args):
+    return asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+
+
+async def _bounded(make_awaitable):
+    """Awaits make_awaitable(), or returns None without calling it if INFERENCE_QUEUE_MAX requests are already in flight."""
+    global _in_flight
+    if _in_flight >= INFERENCE_QUEUE_MAX:
+        return None
+    _in_flight += 1
+    try:
+        return await make_awaitable()
+    finally:
+        _in_flight -= 1
+
+
+async def predict_cancellation(data):
+    flight_data = data.get('flightData', {}) if isinstance(data, dict) else None
+    if not isinstance(flight_data, dict):
+        return {'error': "'flightData' must be an object"}, 400
+    if prediction_service.batcher is not None:
+        # 微批处理器有自己的工作线程，直接等待它的 Future，不占用推理线程
+        make_awaitable = lambda: asyncio.wrap_future(submit_single(flight_data))
+    else:
+        make_awaitable = lambda: _in_pool(predict_single, flight_data)
+    try:
+        result = await _bounded(make_awaitable)
+    except ValueError as e:
+        # 无法解析的航班数据 (例如非数字的距离)
+        return {'error': f"Invalid flight data: {str(e)}"}, 400
+    except Exception as e:
+        logging.error(f"预测错误: {e}")
+        return {'error': str(e)}, 500
+    if result is None:
+        return {'error': 'Server busy, try again later'}, 503
+    return result, 200
+
+
+async def predict_batch_endpoint(data):
+    flights = data.get('flights') if isinstance(data, dict) else None
+    if not isinstance(flights, list):
+        return {'error': "'flights' must be a list of flightData objects"}, 400
+    if len(flights) > MAX_BATCH_SIZE:
+        return {'error': f"At most {MAX_BATCH_SIZE} flights per request"}, 413
+    try:
+        results = await _bounded(lambda: _in_pool(predict_batch, flights))
+    except Exception as e:
+        logging.error(f"批量预测错误: {e}")
+        return {'error': str(e)}, 500
+    if results is None:
+        return {'error': 'Server busy, try again later'}, 503
+    return {'results': results}, 200
+
+
+async def run_python(data):
+    try:
+        user_input = data.get('input', '')
+        return {'output': f"{user_input.replace(',', ' >> ')}"}, 200
+    except Exception as e:
+        logging.error(f"Error occurred: {e}")
+        return {'error': str(e)}, 500
+
+
+async def health(_):
+    # 存活检查: 不访问模型，进程启动后立即可用 (就绪状态见 /ready)
+    return {'status': 'ok'}, 200
+
+
+async def ready(_):
+    status = warmup.get_status()
+    return status, (200 if status['ready'] else 503)
+
+
+async def memory_report(_):
+    report = shared_models.memory_report()
+    report['registry'] = registry.stats()
+    report['inference_pool'] = {'threads': INFERENCE_THREADS, 'in_flight': _in_flight, 'queue_max': INFERENCE_QUEUE_MAX}
+    return report, 200
+
+
+async def airports_search(params):
+    return search_airports(params)
+
+
+async def airports_nearest(params):
+    return nearest_airports(params)
+
+
+async def batch_stats(_):
+    if prediction_service.batcher is None:
+        return {'enabled': False}, 200
+    return dict(prediction_service.batcher.stats(), enabled=True), 200
+
+
+async def cache_stats(_):
+    if prediction_service.cache is None:
+        return {'enabled': False}, 200
+    return dict(prediction_service.cache.stats(), enabled=True), 200
+
+
+async def metrics_endpoint(_):
+    return metrics.render(), 200
+
+
+ROUTES = {
+    ('POST', '/predict-cancellation'): predict_cancellation,
+    ('POST', '/predict-batch'): predict_batch_endpoint,
+    ('POST', '/run-python'): run_python,
+    ('GET', '/health'): health,
+    ('GET', '/ready'): ready,
+    ('GET', '/memory-report'): memory_report,
+    ('GET', '/batch-stats'): batch_stats,
+    ('GET', '/cache-stats'): cache_stats,
+    ('GET', '/metrics'): metrics_endpoint,
+    ('GET', '/airports/search'): airports_search,
+    ('GET', '/airports/nearest'): airports_nearest
+}
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            # 与 example.py 相同: PRELOAD_MODELS=1 时在启动前同步加载，否则后台预热
+            if os.environ.get('PRELOAD_MODELS') == '1':
+                shared_models.preload()
+            else:
+                warmup.start_warmup()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            executor.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    """
+    ASGI application serving the same routes as example.py.
+
+    Requests are parsed and answered on the event loop, and every model call
+    runs on a bounded thread pool, so a slow forward pass or model load never
+    blocks other connections. Run it with an ASGI server, e.g.
+    `uvicorn asgi_app:app --app-dir js/utils`.
+    """
+    if scope['type'] == 'lifespan':
+        return await _lifespan(receive, send)
+    if scope['type'] != 'http':
+        return
+
+    if scope['method'] == 'OPTIONS':
+        await send({'type': 'http.response.start', 'status': 204, 'headers': CORS_HEADERS})
+        await send({'type': 'http.response.body', 'body': b''})
+        return
+
+    started = time.perf_counter()
+    handler = ROUTES.get((scope['method'], scope['path']))
+    if handler is None:
+        payload, status = {'error': 'Not found'}, 404
+    else:
+        try:
+            # POST 处理函数接收 JSON 请求体，GET 处理函数接收查询参数
+            if scope['method'] == 'POST':
+                data = await _read_json(receive)
+            else:
+                data = dict(parse_qsl(scope.get('query_string', b'').decode()))
+        except ValueError as e:
+            payload, status = {'error': f"Invalid JSON: {e}"}, 400
+        else:
+            payload, status = await handler(data)
+    await _send_json(send, payload, status)
+    # 未知路径统一记为 unmatched，避免产生无限多的标签
+    metrics.HTTP_SECONDS.observe(time.perf_counter() - started, scope['path'] if handler else 'unmatched', str(status))
@@ -0,0 +1,594 @@
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import tempfile
+import filecmp
+import multiprocessing
+from collections import deque
+import numpy as np
+from lazy_imports import LazyModule
+from pred_cancelled_prob import (load_cancellation_model, create_cancellation_features, get_cancellation_model_path,
+                                 CANCELLATION_FEATURES)
+from pred_dep_delay import predict_delay
+from pred_arr_delay import predict_arrival_delay, DEFAULT_MODEL_DIR as ARR_DELAY_MODEL_DIR
+from prediction_service import get_model_year
+from prediction_grid import OUTPUTS
+from airport_distance import get_distances
+from feature_kernels import days_since_epoch, valid_dates
+import shared_models
+
+pd = LazyModule('pandas')
+
+# 每个数据块的行数；峰值内存由块大小决定，与输入文件大小无关
+DEFAULT_CHUNK_SIZE = 50_000
+
+# BTS 原始列名 -> 模型列名 (输入中已有模型列名时优先使用模型列名)
+COLUMN_ALIASES = {
+    'ORIGIN': 'ORIGIN_IATA',
+    'DEST': 'DEST_IATA',
+    'MKT_UNIQUE_CARRIER': 'MKT_AIRLINE',
+    'MKT_CARRIER': 'MKT_AIRLINE',
+    'CRS_DEP_TIME': 'SCH_DEP_TIME',
+    'DAY_OF_MONTH': 'DAY'
+}
+
+# 模型使用的输入列，以及可以由它们推导的原始列
+INPUT_COLUMNS = ['YEAR', 'MONTH', 'DAY', 'WEEK', 'MKT_AIRLINE', 'ORIGIN_IATA', 'DEST_IATA', 'DISTANCE',
+                 'SCH_DEP_TIME', 'DEP_TIME', 'PRCP', 'EXTREME_WEATHER', 'DEST_PRCP', 'DEST_EXTREME_WEATHER']
+DERIVED_FROM = ['FL_DATE', 'DAY_OF_WEEK'] + list(COLUMN_ALIASES)
+
+# 机场和航空公司代码列 (含 BTS 原始列名)，读取时保持字典编码 / pandas Categorical，
+# 特征工程和预处理直接使用编码而不是逐行比较字符串
+DICTIONARY_COLUMNS = ['MKT_AIRLINE', 'ORIGIN_IATA', 'DEST_IATA', 'ORIGIN', 'DEST', 'MKT_UNIQUE_CARRIER', 'MKT_CARRIER']
+
+# 以这些扩展名结尾的输入输出路径按 Parquet 读写，其余按 CSV
+PARQUET_EXTENSIONS = ('.parquet', '.pq')
+
+# 默认随预测结果一起写出的输入列
+KEEP_COLUMNS = ['YEAR', 'MONTH', 'DAY', 'MKT_AIRLINE', 'ORIGIN_IATA', 'DEST_IATA', 'SCH_DEP_TIME']
+
+# 与预测网格相同的输出列名，外加到达延误和每行的错误信息
+ARRIVAL_COLUMNS = ['arrival_predicted', 'arrival_probability', 'arrival_minutes', 'arrival_ci_lower', 'arrival_ci_upper']
+OUTPUT_COLUMNS = OUTPUTS + ARRIVAL_COLUMNS + ['error']
+
+
+def normalize_records(chunk):
+    """
+    Maps a chunk of BTS-style flight records to the model input columns.
+
+    Accepts the model column names directly (YEAR, MONTH, DAY, WEEK, MKT_AIRLINE, ORIGIN_IATA,
+    DEST_IATA, DISTANCE, SCH_DEP_TIME/DEP_TIME, PRCP, EXTREME_WEATHER) or the raw BTS names
+    (FL_DATE, DAY_OF_MONTH, DAY_OF_WEEK, MKT_UNIQUE_CARRIER, ORIGIN, DEST, CRS_DEP_TIME).
+    DEP_TIME is only used when there is no scheduled time; like the service, the models get
+    the scheduled time for both, since the actual one is unknown (NaN) for cancelled flights.
+    Missing weekdays are computed from the date, missing or zero distances are looked up like
+    in the service, missing weather is 0, and years after 2024 are clamped to 2024.
+    Rows whose date is missing or invalid are left out, so the rest of the chunk can still
+    be scored.
+
+    Parameters:
+    chunk (DataFrame): Raw records
+
+    Returns:
+    DataFrame: Model inputs for the rows with a valid date, indexed like chunk
+
+    Raises:
+    ValueError: If the date, airline, airports or departure time columns cannot be found
+    """
+    flights = pd.DataFrame(index=chunk.index)
+    for column in INPUT_COLUMNS:
+        if column in chunk.columns:
+            flights[column] = chunk[column]
+    for alias, column in COLUMN_ALIASES.items():
+        if column not in flights.columns and alias in chunk.columns:
+            flights[column] = chunk[alias]
+
+    if not {'YEAR', 'MONTH', 'DAY'} <= set(flights.columns):
+        if 'FL_DATE' not in chunk.columns:
+            raise ValueError("Input needs YEAR, MONTH and DAY (or DAY_OF_MONTH) columns, or FL_DATE")
+        dates = pd.to_datetime(chunk['FL_DATE'], errors='coerce', format='mixed')
+        for column, values in (('YEAR', dates.dt.year), ('MONTH', dates.dt.month), ('DAY', dates.dt.day)):
+            if column not in flights.columns:
+                flights[column] = values
+    if 'SCH_DEP_TIME' not in flights.columns and 'DEP_TIME' not in flights.columns:
+        raise ValueError("Input needs a departure time column (SCH_DEP_TIME, CRS_DEP_TIME or DEP_TIME)")
+    missing = [column for column in ('MKT_AIRLINE', 'ORIGIN_IATA', 'DEST_IATA') if column not in flights.columns]
+    if missing:
+        raise ValueError(f"Input is missing columns: {', '.join(missing)}")
+
+    # 日期缺失或无效的行 (无法解析的 FL_DATE、2月30日等) 不参与评分，score_chunk 在 error 列中标记
+    for column in ('YEAR', 'MONTH', 'DAY'):
+        flights[column] = pd.to_numeric(flights[column], errors='coerce')
+    valid = valid_dates(flights['YEAR'], flights['MONTH'], flights['DAY'])
+    if not valid.all():
+        flights = flights[valid].copy()
+    flights['MONTH'] = flights['MONTH'].astype(int)
+    flights['DAY'] = flights['DAY'].astype(int)
+
+    # 与 normalize_flight 相同: 年份上限为 2024，出发时间同时用作计划和实际出发时间。
+    # BTS 的实际出发时间 DEP_TIME 是事后数据 (取消的航班为空)，有计划时间时一律不用
+    flights['YEAR'] = np.minimum(flights['YEAR'].astype(int), 2024)
+    if 'SCH_DEP_TIME' not in flights.columns:
+        flights['SCH_DEP_TIME'] = flights['DEP_TIME']
+    flights['DEP_TIME'] = flights['SCH_DEP_TIME']
+    flights['SCH_DEP_TIME'] = flights['SCH_DEP_TIME'].astype(float)
+    flights['DEP_TIME'] = flights['DEP_TIME'].astype(float)
+
+    if 'WEEK' not in flights.columns:
+        day_of_week = chunk['DAY_OF_WEEK'].reindex(flights.index) if 'DAY_OF_WEEK' in chunk.columns else None
+        if day_of_week is not None and day_of_week.notna().all():
+            # BTS: 1=Monday, ..., 7=Sunday -> 0=Sunday, ..., 6=Saturday
+            flights['WEEK'] = day_of_week.astype(int) % 7
+        else:
+            # 日期已经过检查；1970-01-01 是星期四
+            flights['WEEK'] = (days_since_epoch(flights['YEAR'], flights['MONTH'], flights['DAY']) + 4) % 7
+
+    distance = flights['DISTANCE'].to_numpy(dtype=float) if 'DISTANCE' in flights.columns else np.zeros(len(flights))
+    unknown = np.flatnonzero(np.isnan(distance) | (distance == 0))
+    if len(unknown):
+        distance = distance.copy()
+        distance[unknown] = get_distances(flights['ORIGIN_IATA'].to_numpy()[unknown],
+                                          flights['DEST_IATA'].to_numpy()[unknown])
+    flights['DISTANCE'] = distance
+
+    for column in ('PRCP', 'EXTREME_WEATHER'):
+        flights[column] = flights[column].fillna(0) if column in flights.columns else 0
+    flights['EXTREME_WEATHER'] = flights['EXTREME_WEATHER'].astype(int)
+    return flights
+
+
+def _score_year(year, flights, out):
+    # 与 prediction_service._predict_year 相同的模型选择: 取消和到达延误使用最接近的模型年份，
+    # 出发延误使用航班年份本身；某个阶段失败时该阶段的输出为 NaN，错误写入 error 列
+    model_year = get_model_year(year)
+    errors = []
+
+    try:
+        model = load_cancellation_model(get_cancellation_model_path(model_year))
+        # 特征函数原地添加列，浅拷贝即可
+        features = create_cancellation_features(flights.copy(deep=False))
+        out.loc[flights.index, 'cancellation_probability'] = model.predict_proba(features[CANCELLATION_FEATURES])[:, 1]
+    except Exception as e:
+        errors.append(f"cancellation: {e}")
+
+    try:
+        delay_probs, delay_times, ci_lower, ci_upper = predict_delay(flights.assign(YEAR=int(year)))
+        out.loc[flights.index, 'delay_probability'] = delay_probs[:, 0]
+        out.loc[flights.index, 'predicted_delay_minutes'] = delay_times[:, 0]
+        out.loc[flights.index, 'delay_ci_lower'] = ci_lower[:, 0]
+        out.loc[flights.index, 'delay_ci_upper'] = ci_upper[:, 0]
+    except Exception as e:
+        errors.append(f"dep_delay: {e}")
+        delay_times = None
+
+    if delay_times is not None:
+        try:
+            results = predict_arrival_delay(ARR_DELAY_MODEL_DIR, flights.assign(DEP_DELAY=delay_times[:, 0].astype(float)),
+                                            year=model_year)
+            if isinstance(results, dict) and 'error' in results:
+                raise RuntimeError(results['error'])
+            results = [results] if isinstance(results, dict) else results
+            for column, key in zip(ARRIVAL_COLUMNS, ('delay_predicted', 'delay_probability', 'delay_minutes',
+                                                     'delay_lower_bound', 'delay_upper_bound')):
+                out.loc[flights.index, column] = [float(result[key]) for result in results]
+        except Exception as e:
+            errors.append(f"arrival: {e}")
+
+    if errors:
+        out.loc[flights.index, 'error'] = '; '.join(errors)
+
+
+def score_chunk(chunk, keep=KEEP_COLUMNS):
+    """
+    Runs the cancellation, dep-delay and arrival-delay models over one chunk of records.
+    Each model runs once per flight year present in the chunk.
+
+    Parameters:
+    chunk (DataFrame): Raw records (see normalize_records)
+    keep (list): Input columns copied to the output, where present
+
+    Returns:
+    DataFrame: keep columns followed by OUTPUT_COLUMNS, one row per input row in the same order;
+        rows with an invalid date have empty predictions and error 'invalid date'
+    """
+    flights = normalize_records(chunk)
+    skipped = ~chunk.index.isin(flights.index)
+
+    def kept(column):
+        if column not in flights.columns:
+            return chunk[column]
+        # 跳过的行在输出中为空；整数列改用可空整数，免得 YEAR 等在 CSV 中变成 2024.0
+        values = flights[column]
+        if skipped.any() and pd.api.types.is_integer_dtype(values):
+            values = values.astype('Int64')
+        return values
+
+    out = pd.DataFrame({column: kept(column) for column in keep if column in flights.columns or column in chunk.columns},
+                       index=chunk.index)
+    for column in OUTPUT_COLUMNS[:-1]:
+        out[column] = np.nan
+    out['error'] = ''
+    out.loc[skipped, 'error'] = 'invalid date'
+    for year, group in flights.groupby('YEAR', sort=False):
+        _score_year(int(year), group, out)
+    return out
+
+
+class Progress:
+    """
+    Checkpoint of a bulk-scoring run, stored next to the output file as <output>.progress.json.
+    It records how many input rows have been fully written and how many output bytes (CSV)
+    or part files (Parquet) they occupy, so a resumed run can drop a partially written chunk
+    and continue from there.
+    """
+
+    def __init__(self, output_path):
+        self.path = output_path + '.progress.json'
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path) as file:
+            return json.load(file)
+
+    def save(self, input_path, rows_done, position, chunk_size):
+        # 先写临时文件再原子替换，避免中断时留下损坏的检查点
+        with open(self.path + '.tmp', 'w') as file:
+            json.dump({"input": os.path.abspath(input_path), "rows_done": rows_done,
+                       **position, "chunk_size": chunk_size}, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(self.path + '.tmp', self.path)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def _init_worker():
+    # 每个 worker 单线程运行 torch 和 BLAS，避免 进程数 x 线程数 超过核心数
+    if 'torch' in sys.modules:
+        sys.modules['torch'].set_num_threads(1)
+    from threadpoolctl import threadpool_limits
+    threadpool_limits(1)
+
+
+def _score_in_worker(chunk, keep):
+    # 返回结果和该 worker 当前的内存分布 (共享/私有)，用于确认模型没有被复制
+    return score_chunk(chunk, keep), shared_models.memory_report()
+
+
+def scored_chunks(chunks, keep=KEEP_COLUMNS, workers=1, worker_memory=None):
+    """
+    Scores chunks and yields (chunk, result) pairs in input order.
+
+    With workers > 1, every model is loaded once in this process (shared_models.preload) and
+    a pool of forked workers inherits them copy-on-write, so no worker unpickles a forest or
+    a ResNet. At most 2 * workers chunks are in flight, which keeps memory bounded, and
+    results are yielded in input order even when a later chunk finishes first.
+
+    Parameters:
+    chunks (iterable): Raw record DataFrames
+    keep (list): Input columns copied to the output
+    workers (int): Number of worker processes
+    worker_memory (dict): If given, filled with pid -> latest memory_report() of each worker
+        (of this process when workers <= 1)
+
+    Returns:
+    generator: (chunk, result DataFrame) pairs
+    """
+    if workers <= 1:
+        for chunk in chunks:
+            yield chunk, score_chunk(chunk, keep)
+        if worker_memory is not None:
+            report = shared_models.memory_report()
+            worker_memory[report.get('pid')] = report
+        return
+
+    shared_models.preload()
+    if 'torch' in sys.modules:
+        sys.modules['torch'].set_num_threads(1)
+    # fork 使 worker 继承已加载的模型；spawn/forkserver 会在每个 worker 中重新加载
+    with multiprocessing.get_context('fork').Pool(workers, initializer=_init_worker) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append((chunk, pool.apply_async(_score_in_worker, (chunk, keep))))
+            while len(pending) >= 2 * workers:
+                yield _collect(pending.popleft(), worker_memory)
+        while pending:
+            yield _collect(pending.popleft(), worker_memory)
+
+
+def _collect(entry, worker_memory):
+    chunk, async_result = entry
+    result, report = async_result.get()
+    if worker_memory is not None and 'pid' in report:
+        worker_memory[report['pid']] = report
+    return chunk, result
+
+
+def _usecols(column):
+    return column in INPUT_COLUMNS or column in DERIVED_FROM or column in KEEP_COLUMNS
+
+
+def is_parquet(path):
+    return path.lower().endswith(PARQUET_EXTENSIONS)
+
+
+def _csv_chunks(input_path, chunk_size, start_row, wanted):
+    return pd.read_csv(input_path, chunksize=chunk_size, skiprows=range(1, start_row + 1),
+                       usecols=lambda column: _usecols(column) or column in wanted,
+                       dtype={column: 'category' for column in DICTIONARY_COLUMNS})
+
+
+def _batch_frames(batches, chunk_size):
+    # 按 chunk_size 重新切分 Arrow 批次，使数据块边界与行组无关，续跑时得到与 CSV 相同的数据块。
+    # split_blocks 让没有缺失值的数值列以零拷贝方式成为 DataFrame 列 (只读的 NumPy 视图)，
+    # 前提是数据块位于一个批次之内；字典编码的列成为 Categorical
+    import pyarrow as pa
+
+    pending, rows = [], 0
+    for batch in batches:
+        while batch.num_rows:
+            take = min(chunk_size - rows, batch.num_rows)
+            pending.append(batch.slice(0, take))
+            rows += take
+            batch = batch.slice(take)
+            if rows == chunk_size:
+                yield pa.Table.from_batches(pending).to_pandas(split_blocks=True)
+                pending, rows = [], 0
+    if rows:
+        yield pa.Table.from_batches(pending).to_pandas(split_blocks=True)
+
+
+def _parquet_chunks(input_path, chunk_size, start_row, wanted):
+    import pyarrow.parquet as pq
+
+    columns = [name for name in pq.read_schema(input_path).names if _usecols(name) or name in wanted]
+    parquet = pq.ParquetFile(input_path, read_dictionary=[name for name in columns if name in DICTIONARY_COLUMNS])
+    # 跳过 start_row 之前的整个行组，剩余的行从第一个批次中切掉
+    row_groups, skip = [], start_row
+    for i in range(parquet.num_row_groups):
+        rows = parquet.metadata.row_group(i).num_rows
+        if not row_groups and skip >= rows:
+            skip -= rows
+        else:
+            row_groups.append(i)
+
+    def batches():
+        nonlocal skip
+        for batch in parquet.iter_batches(batch_size=chunk_size, row_groups=row_groups, columns=columns):
+            if skip:
+                dropped = min(skip, batch.num_rows)
+                batch, skip = batch.slice(dropped), skip - dropped
+            yield batch
+
+    return _batch_frames(batches(), chunk_size)
+
+
+def _arrow_chunks(table, chunk_size, wanted):
+    import pyarrow as pa
+
+    table = table.select([name for name in table.column_names if _usecols(name) or name in wanted])
+    for i, name in enumerate(table.column_names):
+        if name in DICTIONARY_COLUMNS and not pa.types.is_dictionary(table.schema.field(i).type):
+            table = table.set_column(i, name, table.column(i).dictionary_encode())
+    return _batch_frames(table.to_batches(max_chunksize=chunk_size), chunk_size)
+
+
+def _output_schema(schema):
+    # 固定字典编码的索引宽度 (pandas 按类别数选择 int8/int16)，使所有数据块的 schema 一致
+    import pyarrow as pa
+
+    return pa.schema([field.with_type(pa.dictionary(pa.int32(), field.type.value_type))
+                      if pa.types.is_dictionary(field.type) else field for field in schema],
+                     metadata=schema.metadata)
+
+
+def _to_arrow(result, schema=None):
+    import pyarrow as pa
+
+    table = pa.Table.from_pandas(result, preserve_index=False)
+    return table.cast(schema) if schema is not None else table.cast(_output_schema(table.schema))
+
+
+class _CsvOutput:
+    def __init__(self, output_path, checkpoint):
+        if checkpoint is not None:
+            # 丢弃检查点之后写入的不完整数据块
+            with open(output_path, 'r+b') as file:
+                file.truncate(checkpoint['output_bytes'])
+        self.file = open(output_path, 'a' if checkpoint is not None else 'w', newline='')
+
+    def write(self, result):
+        result.to_csv(self.file, header=self.file.tell() == 0, index=False)
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        return {"output_bytes": self.file.tell()}
+
+    def close(self):
+        self.file.close()
+
+
+class _ParquetOutput:
+    """
+    Parquet dataset directory with one part-NNNNN.parquet file per chunk, readable as one
+    table with pd.read_parquet or pyarrow.parquet.read_table. Part files are written under a
+    temporary name and renamed, so every part that exists is complete.
+    """
+
+    def __init__(self, output_path, checkpoint):
+        import pyarrow.parquet as pq
+
+        self.path = output_path
+        self.parts = checkpoint['output_parts'] if checkpoint is not None else 0
+        os.makedirs(output_path, exist_ok=True)
+        # 删除检查点之后写入的部分文件；全新运行时删除上一次运行的全部部分文件
+        for name in os.listdir(output_path):
+            if name.startswith('part-') and int(name[5:10]) >= self.parts:
+                os.remove(os.path.join(output_path, name))
+        self.schema = pq.read_schema(self._part(0)) if self.parts else None
+
+    def _part(self, i):
+        return os.path.join(self.path, f'part-{i:05d}.parquet')
+
+    def write(self, result):
+        import pyarrow.parquet as pq
+
+        table = _to_arrow(result, self.schema)
+        self.schema = table.schema
+        path = self._part(self.parts)
+        with open(path + '.tmp', 'wb') as file:
+            pq.write_table(table, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(path + '.tmp', path)
+        self.parts += 1
+        return {"output_parts": self.parts}
+
+    def close(self):
+        pass
+
+
+def score_file(input_path, output_path, chunk_size=DEFAULT_CHUNK_SIZE, start_row=0, resume=False, keep=KEEP_COLUMNS,
+               workers=1):
+    """
+    Scores a CSV or Parquet file chunk by chunk and streams the results to output_path.
+    Only the columns the models need (and the keep columns) are read, and the airline and
+    airport columns stay dictionary-encoded (Categorical) through the feature code. With
+    several workers, chunks are scored in parallel and written in input order (see
+    scored_chunks). Parquet needs pyarrow.
+
+    Parameters:
+    input_path (str): BTS-style CSV with a header row, or a Parquet file (.parquet/.pq)
+    output_path (str): Output CSV, or a Parquet dataset directory if it ends in .parquet/.pq;
+        a checkpoint is kept next to it until the run finishes
+    chunk_size (int): Rows per chunk
+    start_row (int): Number of data rows to skip before scoring (ignored with resume)
+    resume (bool): Continue an interrupted run from its checkpoint
+    keep (list): Input columns copied to the output
+    workers (int): Number of worker processes
+
+    Returns:
+    dict: Rows scored in this run, elapsed seconds, and the last memory report of each worker
+
+    Raises:
+    ValueError: If resume is set and the checkpoint belongs to another input file
+    """
+    progress = Progress(output_path)
+    checkpoint = progress.load() if resume else None
+    if checkpoint is not None:
+        if checkpoint['input'] != os.path.abspath(input_path):
+            raise ValueError(f"Checkpoint {progress.path} belongs to {checkpoint['input']}")
+        start_row = checkpoint['rows_done']
+        logging.info(f"Resuming at row {start_row}")
+    elif resume:
+        logging.info("No checkpoint found, starting from the beginning")
+
+    wanted = set(keep)
+    reader = (_parquet_chunks if is_parquet(input_path) else _csv_chunks)(input_path, chunk_size, start_row, wanted)
+    output = (_ParquetOutput if is_parquet(output_path) else _CsvOutput)(output_path, checkpoint)
+    rows_done, scored = start_row, 0
+    worker_memory = {}
+    started = time.perf_counter()
+    try:
+        for chunk, result in scored_chunks(reader, keep, workers, worker_memory):
+            position = output.write(result)
+            rows_done += len(chunk)
+            scored += len(chunk)
+            progress.save(input_path, rows_done, position, chunk_size)
+            logging.info(f"Scored rows up to {rows_done} ({scored / (time.perf_counter() - started):.0f} rows/s)")
+    finally:
+        output.close()
+    progress.clear()
+    return {"rows": scored, "seconds": time.perf_counter() - started, "workers": list(worker_memory.values())}
+
+
+def score_table(table, keep=KEEP_COLUMNS, chunk_size=DEFAULT_CHUNK_SIZE, workers=1):
+    """
+    Scores an in-memory Arrow table, e.g. one handed over by an upstream columnar job.
+    Only the needed columns are converted to pandas, string airline and airport columns
+    are dictionary-encoded first, and numeric columns without nulls are passed zero-copy.
+
+    Parameters:
+    table (pyarrow.Table): Records with the columns described in normalize_records
+    keep (list): Input columns copied to the output
+    chunk_size (int): Rows per chunk
+    workers (int): Number of worker processes
+
+    Returns:
+    pyarrow.Table: keep columns followed by OUTPUT_COLUMNS, one row per input row in the same order
+    """
+    import pyarrow as pa
+
+    tables, schema = [], None
+    for _, result in scored_chunks(_arrow_chunks(table, chunk_size, set(keep)), keep, workers):
+        tables.append(_to_arrow(result, schema))
+        schema = tables[-1].schema
+    return pa.concat_tables(tables) if tables else pa.table({})
+
+
+def scaling_benchmark(input_path, worker_counts, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Scores input_path with each worker count and checks that every output is identical to
+    the first one.
+
+    Returns:
+    list: One dict per worker count with rows/s, speedup and efficiency relative to the first
+        count, whether the output matched, and the mean shared and private memory per worker
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        reference = None
+        for workers in worker_counts:
+            output_path = os.path.join(directory, f'scores_{workers}.csv')
+            summary = score_file(input_path, output_path, chunk_size, workers=workers)
+            rows_per_s = summary['rows'] / summary['seconds']
+            reference = reference or (output_path, rows_per_s, workers)
+            speedup = rows_per_s / reference[1] * reference[2]
+            memory = summary['workers']
+            results.append({
+                "workers": workers,
+                "rows_per_s": round(rows_per_s, 1),
+                "speedup": round(speedup, 2),
+                "efficiency": round(speedup / workers, 2),
+                "identical_output": filecmp.cmp(reference[0], output_path, shallow=False),
+                "worker_shared_mb": round(np.mean([m['shared'] for m in memory]) / 2 ** 20, 1) if memory and 'shared' in memory[0] else None,
+                "worker_private_mb": round(np.mean([m['private'] for m in memory]) / 2 ** 20, 1) if memory and 'private' in memory[0] else None
+            })
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Score a CSV or Parquet file of flight records with all three models "
+                                                 "in bounded memory")
+    parser.add_argument('input', help="BTS-style CSV with a header row, or a .parquet file")
+    parser.add_argument('output', nargs='?', help="Output CSV, or a Parquet dataset directory if it ends in .parquet "
+                                                  "(not needed with --scaling)")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--start-row', type=int, default=0, help="Skip this many data rows")
+    parser.add_argument('--resume', action='store_true', help="Continue an interrupted run from its checkpoint")
+    parser.add_argument('--keep', nargs='*', default=KEEP_COLUMNS, help="Input columns copied to the output")
+    parser.add_argument('--workers', type=int, default=1, help="Worker processes sharing the preloaded models")
+    parser.add_argument('--scaling', type=int, nargs='+', metavar='WORKERS',
+                        help="Instead of writing output, benchmark these worker counts on the input")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    if args.scaling:
+        logging.getLogger().setLevel(logging.WARNING)
+        print(f"{os.cpu_count()} CPUs")
+        for result in scaling_benchmark(args.input, args.scaling, args.chunk_size):
+            print(f"{result['workers']:3d} workers {result['rows_per_s']:10.1f} rows/s  speedup {result['speedup']:5.2f}  "
+                  f"efficiency {result['efficiency']:5.2f}  identical {result['identical_output']}  "
+                  f"per-worker shared {result['worker_shared_mb']} MB private {result['worker_private_mb']} MB")
+        sys.exit(0)
+    if args.output is None:
+        parser.error("the output path is required")
+
+    summary = score_file(args.input, args.output, args.chunk_size, args.start_row, args.resume, args.keep, args.workers)
+    rows, elapsed = summary['rows'], summary['seconds']
+    print(f"Scored {rows} rows in {elapsed:.1f} s ({rows / elapsed if elapsed else 0:.0f} rows/s) -> {args.output}")
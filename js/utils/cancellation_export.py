@@ -0,0 +1,40 @@
+import argparse
+import joblib
+from forest_compiler import compile_forest, check_parity, get_compiled_path
+from pred_cancelled_prob import get_cancellation_model_path, CANCELLATION_FEATURES, create_cancellation_features
+from synthetic_flights import generate_flights
+
+
+def export_year(year, samples=20000):
+    """
+    Compiles the cancellation forest of one year and saves it next to the model
+    after checking it against sklearn on synthetic flights.
+
+    The compiled forest is pickled from here rather than from forest_compiler's own
+    command line, so the stored class path is forest_compiler.CompiledForest, not __main__.
+
+    Parameters:
+    year (int): Model year
+    samples (int): Synthetic flights used for the parity check
+
+    Raises:
+    ValueError: If the forest cannot be compiled or does not match sklearn
+    """
+    model_path = get_cancellation_model_path(year)
+    pipeline = joblib.load(model_path)
+    compiled = compile_forest(pipeline)
+    flights = create_cancellation_features(generate_flights(samples, year=year))
+    max_diff = check_parity(pipeline, compiled, flights[CANCELLATION_FEATURES])
+    joblib.dump(compiled, get_compiled_path(model_path))
+    print(f"{year}: {compiled.n_trees} trees of depth {compiled.max_depth}, "
+          f"wrote {get_compiled_path(model_path)} (max abs diff {max_diff:.2e})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compile the cancellation random forests into flat node arrays")
+    parser.add_argument('--years', type=int, nargs='+', default=[2021, 2023, 2024])
+    parser.add_argument('--samples', type=int, default=20000, help="Synthetic flights used for the parity check")
+    args = parser.parse_args()
+
+    for year in args.years:
+        export_year(year, args.samples)
@@ -0,0 +1,299 @@
+import os
+import argparse
+from typing import Optional
+import torch
+import torch.nn as nn
+import numpy as np
+from model_registry import MODELS_DIR
+from dep_delay_nets import FlightDelayClassifier, FlightDelayRegressor
+from pred_dep_delay import load_network, load_compiled_preprocessor
+from preprocessor_compiler import to_dense
+
+DEP_DELAY_DIR = os.path.join(MODELS_DIR, 'dep_delay_nn')
+
+
+def fold_linear_bn(linear, bn):
+    """
+    Folds an eval-mode BatchNorm1d into the Linear layer that precedes it.
+
+    BN(Wx + b) = s * (Wx + b - mean) + beta, with s = gamma / sqrt(var + eps),
+    which is the Linear layer with weight s * W and bias s * (b - mean) + beta.
+    """
+    scale = bn.weight / torch.sqrt(bn.running_var + bn.eps)
+    folded = nn.Linear(linear.in_features, linear.out_features)
+    with torch.no_grad():
+        folded.weight.copy_(linear.weight * scale[:, None])
+        folded.bias.copy_((linear.bias - bn.running_mean) * scale + bn.bias)
+    return folded
+
+
+class FoldedResidualBlock(nn.Module):
+    """ResidualBlock with its BatchNorms folded and dropout removed."""
+
+    def __init__(self, block):
+        super(FoldedResidualBlock, self).__init__()
+        self.fc1 = fold_linear_bn(block.fc1, block.bn1)
+        self.fc2 = fold_linear_bn(block.fc2, block.bn2)
+
+    def forward(self, x):
+        out = torch.relu(self.fc1(x))
+        return torch.relu(self.fc2(out) + x)
+
+
+class FoldedBottleneckBlock(nn.Module):
+    """BottleneckResidualBlock with its BatchNorms folded and dropout removed."""
+
+    def __init__(self, block):
+        super(FoldedBottleneckBlock, self).__init__()
+        self.fc1 = fold_linear_bn(block.fc1, block.bn1)
+        self.fc2 = fold_linear_bn(block.fc2, block.bn2)
+        self.fc3 = fold_linear_bn(block.fc3, block.bn3)
+
+    def forward(self, x):
+        out = torch.relu(self.fc1(x))
+        out = torch.relu(self.fc2(out))
+        return torch.relu(self.fc3(out) + x)
+
+
+class FoldedDelayNet(nn.Module):
+    """
+    Inference-only version of FlightDelayClassifier / FlightDelayRegressor.
+
+    Every Linear -> BatchNorm1d pair is folded into a single Linear and the
+    dropouts are removed, so the network computes the same outputs as the
+    original in eval mode with fewer modules to dispatch.
+    """
+
+    def __init__(self, model):
+        super(FoldedDelayNet, self).__init__()
+        # 分类器使用 ReLU + Sigmoid，回归器使用 LeakyReLU(0.1)
+        self.negative_slope = 0.1 if isinstance(model, FlightDelayRegressor) else 0.0
+        self.apply_sigmoid = isinstance(model, FlightDelayClassifier)
+
+        self.embedding = fold_linear_bn(model.embedding[0], model.embedding[1])
+        self.res_block1 = FoldedResidualBlock(model.res_block1)
+        self.res_block2 = FoldedResidualBlock(model.res_block2)
+        self.res_block3 = FoldedResidualBlock(model.res_block3)
+        self.bottleneck = FoldedBottleneckBlock(model.bottleneck)
+        self.head = fold_linear_bn(model.prediction[0], model.prediction[1])
+        self.output = model.prediction[4]
+
+    def forward(self, x):
+        x = nn.functional.leaky_relu(self.embedding(x), self.negative_slope)
+        x = self.res_block1(x)
+        x = self.res_block2(x)
+        x = self.res_block3(x)
+        x = self.bottleneck(x)
+        x = nn.functional.leaky_relu(self.head(x), self.negative_slope)
+        x = self.output(x)
+        if self.apply_sigmoid:
+            x = torch.sigmoid(x)
+        return x
+
+
+def fold_network(model):
+    """Returns a TorchScript-compiled FoldedDelayNet for an eval-mode classifier or regressor."""
+    folded = FoldedDelayNet(model.eval()).eval()
+    return torch.jit.freeze(torch.jit.script(folded))
+
+
+class FusedDelayNet(nn.Module):
+    """
+    Classifier and regressor evaluated together in one batched pass.
+
+    The folded weights of the two networks are stacked along a leading
+    "head" dimension, so each layer runs as a single batched matmul for both
+    heads instead of two separate traversals. Both networks see the same input,
+    so the first layer is one matmul against the concatenated weights.
+    Given the input as SparseRows (see preprocessor_compiler), the first layer
+    is a matmul over the numeric columns plus an embedding-bag sum of the
+    weight rows of the active one-hot columns.
+
+    Returns:
+    tuple: (delay probability, delay minutes), each of shape (batch, 1)
+    """
+
+    def __init__(self, classifier, regressor):
+        super(FusedDelayNet, self).__init__()
+        clf = FoldedDelayNet(classifier.eval())
+        reg = FoldedDelayNet(regressor.eval())
+
+        def stack(layer_name):
+            first = clf.get_submodule(layer_name)
+            second = reg.get_submodule(layer_name)
+            weight = torch.stack([first.weight.t(), second.weight.t()]).detach()
+            bias = torch.stack([first.bias, second.bias])[:, None, :].detach()
+            return weight, bias
+
+        hidden_dim = clf.embedding.out_features
+        self.hidden_dim = hidden_dim
+        self.embedding_weight = nn.Parameter(torch.cat([clf.embedding.weight, reg.embedding.weight]).t().detach(),
+                                             requires_grad=False)
+        self.embedding_bias = nn.Parameter(torch.cat([clf.embedding.bias, reg.embedding.bias]).detach(),
+                                           requires_grad=False)
+        # 第一层权重末尾补一行 0，供未知类别 (列号 n_features) 取用
+        self.register_buffer('embedding_rows', nn.functional.pad(self.embedding_weight, (0, 0, 0, 1)).detach())
+
+        # 每层按 [分类器, 回归器] 堆叠: weight (2, in, out), bias (2, 1, out)
+        self.layer_names = ['res_block1.fc1', 'res_block1.fc2', 'res_block2.fc1', 'res_block2.fc2',
+                            'res_block3.fc1', 'res_block3.fc2', 'bottleneck.fc1', 'bottleneck.fc2',
+                            'bottleneck.fc3', 'head', 'output']
+        weights = []
+        biases = []
+        for name in self.layer_names:
+            weight, bias = stack(name)
+            weights.append(nn.Parameter(weight, requires_grad=False))
+            biases.append(nn.Parameter(bias, requires_grad=False))
+        self.weights = nn.ParameterList(weights)
+        self.biases = nn.ParameterList(biases)
+
+        # 嵌入层和预测头的激活: 分类器 ReLU (斜率 0)，回归器 LeakyReLU(0.1)
+        self.register_buffer('negative_slope', torch.tensor([clf.negative_slope, reg.negative_slope])[:, None, None])
+
+    def _leaky(self, x):
+        return torch.where(x > 0, x, x * self.negative_slope)
+
+    def forward(self, x, active: Optional[torch.Tensor] = None, numeric_offset: int = 0):
+        """
+        Dense input: x of shape (B, n_features). Sparse input (SparseRows fields): x holds
+        only the numeric columns (B, n_numeric), active the output column index of each
+        categorical feature (B, n_categorical), and numeric_offset where x starts.
+        """
+        batch_size = x.shape[0]
+        if active is None:
+            h = torch.addmm(self.embedding_bias, x, self.embedding_weight)
+        else:
+            # 数值列做稠密乘法，分类列只累加被激活的权重行
+            weight = self.embedding_weight[numeric_offset:numeric_offset + x.shape[1]]
+            h = torch.addmm(self.embedding_bias, x, weight)
+            h = h + nn.functional.embedding_bag(active, self.embedding_rows, mode='sum')
+        # (B, 2 * hidden) -> (2, B, hidden)
+        h = self._leaky(h.view(batch_size, 2, self.hidden_dim).transpose(0, 1).contiguous())
+
+        w = [p for p in self.weights]
+        b = [p for p in self.biases]
+
+        # 三个残差块
+        for i in (0, 2, 4):
+            out = torch.relu(torch.baddbmm(b[i], h, w[i]))
+            h = torch.relu(torch.baddbmm(b[i + 1], out, w[i + 1]) + h)
+
+        # 瓶颈残差块
+        out = torch.relu(torch.baddbmm(b[6], h, w[6]))
+        out = torch.relu(torch.baddbmm(b[7], out, w[7]))
+        h = torch.relu(torch.baddbmm(b[8], out, w[8]) + h)
+
+        # 预测头
+        h = self._leaky(torch.baddbmm(b[9], h, w[9]))
+        out = torch.baddbmm(b[10], h, w[10])
+        return torch.sigmoid(out[0]), out[1]
+
+
+def fuse_networks(classifier, regressor):
+    """Returns a TorchScript-compiled FusedDelayNet for an eval-mode classifier and regressor."""
+    fused = FusedDelayNet(classifier, regressor).eval()
+    return torch.jit.freeze(torch.jit.script(fused))
+
+
+def check_parity(original, folded, n_samples=4096, rtol=1e-5, atol=1e-4, seed=0):
+    """
+    Compares the folded network against the original on random inputs.
+
+    Returns:
+    float: Maximum absolute difference between the two outputs
+
+    Raises:
+    AssertionError: If any output differs by more than atol + rtol * |original|
+    """
+    generator = torch.Generator().manual_seed(seed)
+    x = torch.randn(n_samples, original.embedding[0].in_features, generator=generator)
+    with torch.no_grad():
+        expected = original.eval()(x)
+        actual = folded(x)
+    max_diff = (expected - actual).abs().max().item()
+    assert torch.allclose(actual, expected, rtol=rtol, atol=atol), \
+        f"Folded network differs from original by up to {max_diff}"
+    return max_diff
+
+
+def check_fused_parity(classifier, regressor, fused, n_samples=4096, rtol=1e-5, atol=1e-4, seed=0):
+    """
+    Compares the fused network against the original classifier and regressor on random inputs.
+
+    Returns:
+    float: Maximum absolute difference over both outputs
+
+    Raises:
+    AssertionError: If any output differs by more than atol + rtol * |original|
+    """
+    generator = torch.Generator().manual_seed(seed)
+    x = torch.randn(n_samples, classifier.embedding[0].in_features, generator=generator)
+    max_diff = 0.0
+    with torch.no_grad():
+        for expected, actual in zip((classifier.eval()(x), regressor.eval()(x)), fused(x)):
+            max_diff = max(max_diff, (expected - actual).abs().max().item())
+            assert torch.allclose(actual, expected, rtol=rtol, atol=atol), \
+                f"Fused network differs from original by up to {max_diff}"
+    return max_diff
+
+
+def check_sparse_parity(fused, n_samples=4096, rtol=1e-5, atol=1e-4, seed=0):
+    """
+    Compares the sparse and dense inputs of a fused network on random rows laid out like
+    the dep-delay preprocessor output, including unknown categories.
+
+    Returns:
+    float: Maximum absolute difference over both outputs
+
+    Raises:
+    AssertionError: If any output differs by more than atol + rtol * |dense output|
+    """
+    preprocessor = load_compiled_preprocessor()
+    rng = np.random.default_rng(seed)
+    data = {column: rng.normal(size=n_samples) for column in preprocessor.numeric_columns}
+    for j, column in enumerate(preprocessor.categorical_columns):
+        values = np.array(list(preprocessor.category_index[j]) + ['unknown category'], dtype=object)
+        data[column] = values[rng.integers(0, len(values), n_samples)]
+    rows = preprocessor.transform_sparse(data)
+    max_diff = 0.0
+    with torch.no_grad():
+        dense = fused(torch.from_numpy(to_dense(rows)))
+        sparse = fused(torch.from_numpy(rows.numeric), torch.from_numpy(rows.active), rows.numeric_offset)
+        for expected, actual in zip(dense, sparse):
+            max_diff = max(max_diff, (expected - actual).abs().max().item())
+            assert torch.allclose(actual, expected, rtol=rtol, atol=atol), \
+                f"Sparse input differs from dense input by up to {max_diff}"
+    return max_diff
+
+
+def get_folded_path(kind, year):
+    """Path of the exported TorchScript file for kind ('classifier', 'regressor' or 'fused') and year."""
+    return os.path.join(DEP_DELAY_DIR, f'year_{year}', f'models_{year}', f'resnet_{kind}_{year}_folded.pt')
+
+
+def export_year(year):
+    """Folds, scripts and saves both networks of one year, and their fused version, after checking parity."""
+    originals = {}
+    for kind, model_cls in (('classifier', FlightDelayClassifier), ('regressor', FlightDelayRegressor)):
+        state_dict_path = os.path.join(DEP_DELAY_DIR, f'year_{year}', f'models_{year}', f'resnet_{kind}_{year}.pth')
+        original = load_network(model_cls, state_dict_path)
+        folded = fold_network(original)
+        max_diff = check_parity(original, folded)
+        torch.jit.save(folded, get_folded_path(kind, year))
+        print(f"{year} {kind}: exported {get_folded_path(kind, year)} (max abs diff {max_diff:.2e})")
+        originals[kind] = original
+
+    fused = fuse_networks(originals['classifier'], originals['regressor'])
+    max_diff = check_fused_parity(originals['classifier'], originals['regressor'], fused)
+    max_diff = max(max_diff, check_sparse_parity(fused))
+    torch.jit.save(fused, get_folded_path('fused', year))
+    print(f"{year} fused: exported {get_folded_path('fused', year)} (max abs diff {max_diff:.2e})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export BatchNorm-folded and fused TorchScript versions of the dep-delay ResNets")
+    parser.add_argument('--years', type=int, nargs='+', default=[2021, 2022, 2023, 2024])
+    args = parser.parse_args()
+
+    for year in args.years:
+        export_year(year)
@@ -0,0 +1,148 @@
+import torch.nn as nn
+
+
+# 定义ResNet风格的块
+class ResidualBlock(nn.Module):
+    def __init__(self, input_dim, hidden_dim=None):
+        super(ResidualBlock, self).__init__()
+        if hidden_dim is None:
+            hidden_dim = input_dim
+
+        self.fc1 = nn.Linear(input_dim, hidden_dim)
+        self.bn1 = nn.BatchNorm1d(hidden_dim)
+        self.relu = nn.ReLU()
+        self.fc2 = nn.Linear(hidden_dim, input_dim)
+        self.bn2 = nn.BatchNorm1d(input_dim)
+        self.dropout = nn.Dropout(0.2)
+
+    def forward(self, x):
+        identity = x
+
+        out = self.fc1(x)
+        out = self.bn1(out)
+        out = self.relu(out)
+        out = self.dropout(out)
+
+        out = self.fc2(out)
+        out = self.bn2(out)
+
+        out += identity  # Skip connection
+        out = self.relu(out)
+
+        return out
+
+
+class BottleneckResidualBlock(nn.Module):
+    def __init__(self, input_dim, bottleneck_dim):
+        super(BottleneckResidualBlock, self).__init__()
+
+        self.fc1 = nn.Linear(input_dim, bottleneck_dim)
+        self.bn1 = nn.BatchNorm1d(bottleneck_dim)
+        self.fc2 = nn.Linear(bottleneck_dim, bottleneck_dim)
+        self.bn2 = nn.BatchNorm1d(bottleneck_dim)
+        self.fc3 = nn.Linear(bottleneck_dim, input_dim)
+        self.bn3 = nn.BatchNorm1d(input_dim)
+
+        self.relu = nn.ReLU()
+        self.dropout = nn.Dropout(0.2)
+
+    def forward(self, x):
+        identity = x
+
+        out = self.fc1(x)
+        out = self.bn1(out)
+        out = self.relu(out)
+
+        out = self.fc2(out)
+        out = self.bn2(out)
+        out = self.relu(out)
+        out = self.dropout(out)
+
+        out = self.fc3(out)
+        out = self.bn3(out)
+
+        out += identity  # Skip connection
+        out = self.relu(out)
+
+        return out
+
+
+# 定义FlightDelayClassifier
+class FlightDelayClassifier(nn.Module):
+    def __init__(self, input_dim, hidden_dim=256):
+        super(FlightDelayClassifier, self).__init__()
+
+        # Initial embedding layer
+        self.embedding = nn.Sequential(
+            nn.Linear(input_dim, hidden_dim),
+            nn.BatchNorm1d(hidden_dim),
+            nn.ReLU(),
+            nn.Dropout(0.3)
+        )
+
+        # Residual blocks
+        self.res_block1 = ResidualBlock(hidden_dim)
+        self.res_block2 = ResidualBlock(hidden_dim)
+        self.res_block3 = ResidualBlock(hidden_dim)
+
+        # Bottleneck residual block for dimensionality reduction
+        self.bottleneck = BottleneckResidualBlock(hidden_dim, hidden_dim // 2)
+
+        # Final prediction layers
+        self.prediction = nn.Sequential(
+            nn.Linear(hidden_dim, 64),
+            nn.BatchNorm1d(64),
+            nn.ReLU(),
+            nn.Dropout(0.2),
+            nn.Linear(64, 1),
+            nn.Sigmoid()
+        )
+
+    def forward(self, x):
+        x = self.embedding(x)
+        x = self.res_block1(x)
+        x = self.res_block2(x)
+        x = self.res_block3(x)
+        x = self.bottleneck(x)
+        x = self.prediction(x)
+        return x
+
+
+# 定义FlightDelayRegressor
+class FlightDelayRegressor(nn.Module):
+    def __init__(self, input_dim, hidden_dim=256):
+        super(FlightDelayRegressor, self).__init__()
+
+        # Initial embedding layer
+        self.embedding = nn.Sequential(
+            nn.Linear(input_dim, hidden_dim),
+            nn.BatchNorm1d(hidden_dim),
+            nn.LeakyReLU(0.1),
+            nn.Dropout(0.3)
+        )
+
+        # Residual blocks
+        self.res_block1 = ResidualBlock(hidden_dim)
+        self.res_block2 = ResidualBlock(hidden_dim)
+        self.res_block3 = ResidualBlock(hidden_dim)
+
+        # Bottleneck residual block
+        self.bottleneck = BottleneckResidualBlock(hidden_dim, hidden_dim // 2)
+
+        # Final prediction layers
+        self.prediction = nn.Sequential(
+            nn.Linear(hidden_dim, 64),
+            nn.BatchNorm1d(64),
+            nn.LeakyReLU(0.1),
+            nn.Dropout(0.2),
+            nn.Linear(64, 1)
+        )
+
+    def forward(self, x):
+        x = self.embedding(x)
+        x = self.res_block1(x)
+        x = self.res_block2(x)
+        x = self.res_block3(x)
+        x = self.bottleneck(x)
+        x = self.prediction(x)
+        return x
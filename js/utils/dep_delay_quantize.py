@@ -0,0 +1,110 @@
+import os
+import json
+import time
+import argparse
+import platform
+import numpy as np
+import torch
+import torch.nn as nn
+from dep_delay_nets import FlightDelayClassifier, FlightDelayRegressor
+from pred_dep_delay import load_network, get_network_path, prepare_features
+from dep_delay_export import FoldedDelayNet, fold_network, DEP_DELAY_DIR
+from synthetic_flights import generate_flights
+
+REPORT_PATH = os.path.join(DEP_DELAY_DIR, 'quantization_report.json')
+
+
+def quantize_network(model):
+    """
+    Returns a TorchScript int8 version of an eval-mode classifier or regressor.
+
+    BatchNorm is folded into the linear layers first, then every nn.Linear is
+    dynamically quantized: weights are stored as int8 and activations are
+    quantized on the fly per batch.
+    """
+    folded = FoldedDelayNet(model.eval()).eval()
+    quantized = torch.ao.quantization.quantize_dynamic(folded, {nn.Linear}, dtype=torch.qint8)
+    return torch.jit.script(quantized)
+
+
+def get_quantized_path(kind, year):
+    """Path of the int8 TorchScript file for kind ('classifier' or 'regressor') and year."""
+    return os.path.join(DEP_DELAY_DIR, f'year_{year}', f'models_{year}', f'resnet_{kind}_{year}_int8.pt')
+
+
+def _latency_us(model, batch_size, repeats=200):
+    x = torch.randn(batch_size, 139)
+    with torch.no_grad():
+        for _ in range(20):
+            model(x)
+        start = time.perf_counter()
+        for _ in range(repeats):
+            model(x)
+    return (time.perf_counter() - start) / repeats * 1e6
+
+
+def compare_year(year, n_samples=20000, seed=0):
+    """
+    Exports the int8 networks of one year and compares them with the float32 originals
+    on synthetic flights run through the real feature pipeline.
+
+    Latency is reported for the original network, the float32 BN-folded TorchScript
+    graph (DEP_DELAY_MODEL_FORMAT=folded) and the int8 network. The int8 network is
+    folded as well, so the gain from quantization itself is float32_folded vs int8.
+
+    Returns:
+    dict: Accuracy and latency figures for the classifier and the regressor
+    """
+    X = torch.FloatTensor(prepare_features(generate_flights(n_samples, year=year, seed=seed)))
+    report = {}
+    for kind, model_cls in (('classifier', FlightDelayClassifier), ('regressor', FlightDelayRegressor)):
+        original = load_network(model_cls, get_network_path(kind, year))
+        folded = fold_network(original)
+        quantized = quantize_network(original)
+        torch.jit.save(quantized, get_quantized_path(kind, year))
+
+        with torch.no_grad():
+            expected = original(X).numpy().ravel()
+            actual = quantized(X).numpy().ravel()
+        diff = np.abs(expected - actual)
+
+        stats = {
+            "mean_abs_diff": float(diff.mean()),
+            "max_abs_diff": float(diff.max()),
+            "float32_latency_us": {},
+            "float32_folded_latency_us": {},
+            "int8_latency_us": {}
+        }
+        if kind == 'classifier':
+            # 以 0.5 为阈值的分类结果一致率
+            stats["label_agreement"] = float(((expected >= 0.5) == (actual >= 0.5)).mean())
+        for batch_size in (1, 256):
+            stats["float32_latency_us"][batch_size] = round(_latency_us(original, batch_size), 1)
+            stats["float32_folded_latency_us"][batch_size] = round(_latency_us(folded, batch_size), 1)
+            stats["int8_latency_us"][batch_size] = round(_latency_us(quantized, batch_size), 1)
+        report[kind] = stats
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export int8 dynamically quantized dep-delay ResNets and compare them with float32")
+    parser.add_argument('--years', type=int, nargs='+', default=[2021, 2022, 2023, 2024])
+    parser.add_argument('--samples', type=int, default=20000, help="Synthetic flights used for the accuracy comparison")
+    parser.add_argument('--report', default=REPORT_PATH)
+    args = parser.parse_args()
+
+    report = {
+        "samples": args.samples,
+        "torch_version": torch.__version__,
+        "torch_threads": torch.get_num_threads(),
+        "quantized_engine": torch.backends.quantized.engine,
+        "machine": platform.machine(),
+        "years": {}
+    }
+    for year in args.years:
+        report["years"][year] = compare_year(year, args.samples)
+        print(f"{year}: {json.dumps(report['years'][year])}")
+
+    with open(args.report, 'w') as file:
+        json.dump(report, file, indent=2)
+    print(f"Report written to {args.report}")
@@ -0,0 +1,284 @@
+import math
+import logging
+import bisect
+import argparse
+import datetime
+import functools
+import numpy as np
+from lazy_imports import LazyModule
+from model_registry import registry
+from feature_kernels import TIME_BLOCKS, DAY_NAMES
+from preprocessor_compiler import CompiledPreprocessor
+from metrics import STAGE_SECONDS
+from pred_cancelled_prob import CANCELLATION_FEATURES, WEEKDAY_NUMBERS, ENGINE, load_cancellation_model
+from pred_dep_delay import (HUB_AIRPORTS, WEST_COAST_AIRPORTS, EAST_COAST_AIRPORTS, CENTRAL_AIRPORTS,
+                            DISTANCE_BINS, DISTANCE_LABELS, MAX_DISTANCE, RAIN_BINS,
+                            load_compiled_preprocessor, create_advanced_time_features, create_advanced_day_features)
+from pred_arr_delay import (ARRIVAL_CATEGORICAL_FEATURES, ARRIVAL_NUMERIC_FEATURES,
+                            FLIGHT_DISTANCE_BINS, FLIGHT_DISTANCE_LABELS)
+
+pd = LazyModule('pandas')
+
+HUBS, WEST_COAST, EAST_COAST, CENTRAL = (frozenset(group) for group in
+                                        (HUB_AIRPORTS, WEST_COAST_AIRPORTS, EAST_COAST_AIRPORTS, CENTRAL_AIRPORTS))
+
+# 按出发小时和星期预先计算的特征列
+HOUR_COLUMNS = ['HOUR_SIN', 'HOUR_COS', 'HALFDAY_SIN', 'HALFDAY_COS', 'QUARTER_DAY_SIN', 'QUARTER_DAY_COS',
+                'IS_MORNING_PEAK', 'IS_EVENING_PEAK', 'TIME_BLOCK']
+DAY_COLUMNS = ['DAY_SIN', 'DAY_COS', 'WEEKDAY_SIN', 'WEEKDAY_COS', 'WORKWEEK_SIN', 'WORKWEEK_COS',
+               'DAY_NAME', 'IS_WEEKEND']
+
+# 2024-05-05 是星期日，之后六天依次为星期一到星期六；2023-02-29 不存在，用于得到日期无效时的默认值
+_WEEK_DATES = [(2024, 5, 5 + week) for week in range(7)] + [(2023, 2, 29)]
+
+
+@functools.lru_cache(maxsize=None)
+def _hour_table():
+    # 用 pandas 路径本身计算 0-23 点的时间特征，保证与逐行计算的结果逐位相同
+    features = create_advanced_time_features(pd.DataFrame({'SCH_DEP_TIME': np.arange(24) * 100.0}))
+    return features[HOUR_COLUMNS].to_dict('records')
+
+
+@functools.lru_cache(maxsize=None)
+def _day_table():
+    # 第 0-6 行对应星期日到星期六，第 7 行是日期无效时的默认值
+    rows = []
+    for year, month, day in _WEEK_DATES:
+        features = create_advanced_day_features(pd.DataFrame({'YEAR': [year], 'MONTH': [month], 'DAY': [day]}))
+        rows.append(features[DAY_COLUMNS].to_dict('records')[0])
+    return rows
+
+
+def _is_missing(value):
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+
+def cancellation_features(prediction_data):
+    """
+    The cancellation model inputs for one normalized flight, with the same values
+    as create_cancellation_features.
+
+    Returns:
+    dict: CANCELLATION_FEATURES plus IS_REDEYE, IS_WEEKEND, IS_MORNING_PEAK and IS_EVENING_PEAK
+    """
+    dep_time = prediction_data['DEP_TIME']
+    row = dict(prediction_data)
+    if isinstance(row['WEEK'], str):
+        # 与 create_cancellation_features 相同: 星期名称换成数字，其他字符串为缺失值
+        row['WEEK'] = WEEKDAY_NUMBERS.get(row['WEEK'], np.nan)
+    row.update(IS_REDEYE=int(0 <= dep_time < 600),
+               IS_WEEKEND=int(row['WEEK'] in (0, 6)),
+               IS_MORNING_PEAK=int(700 <= dep_time < 1000),
+               IS_EVENING_PEAK=int(1600 <= dep_time < 1900),
+               DEST_PRCP=0.0,
+               DEST_EXTREME_WEATHER=0)
+    return row
+
+
+def predict_cancellation_rows(model_path, rows):
+    """
+    Same as predict_cancellation_batch for rows from cancellation_features, without a DataFrame.
+
+    Returns:
+    list or dict: One result dict per row, or a dict with an "error" key
+    """
+    try:
+        model = load_cancellation_model(model_path)
+    except Exception as e:
+        return {"error": f"Failed to load model: {str(e)}"}
+
+    columns = {name: [row[name] for row in rows] for name in CANCELLATION_FEATURES}
+    try:
+        if ENGINE == 'compiled':
+            cancellation_probs = model.predict_proba(columns)[:, 1]
+        else:
+            # sklearn 流水线: 预处理编译为查找表，森林本身仍由 sklearn 计算
+            preprocessor = registry.get('cancelled_prob_preprocessor_compiled', model_path,
+                                        lambda: CompiledPreprocessor(model.steps[0][1]), paths=[model_path])
+            cancellation_probs = model.steps[-1][1].predict_proba(preprocessor.transform(columns, dtype=np.float32))[:, 1]
+    except Exception as e:
+        return {"error": f"Prediction failed: {str(e)}"}
+
+    return [
+        {
+            "cancellation_probability": float(prob),
+            "is_redeye": bool(row['IS_REDEYE']),
+            "is_weekend": bool(row['IS_WEEKEND']),
+            "is_morning_peak": bool(row['IS_MORNING_PEAK']),
+            "is_evening_peak": bool(row['IS_EVENING_PEAK'])
+        }
+        for prob, row in zip(cancellation_probs, rows)
+    ]
+
+
+def dep_delay_features(prediction_data, month, day):
+    """
+    The columns the dep-delay preprocessor reads, for one normalized flight, with
+    the same values as the feature functions in pred_dep_delay.
+
+    Returns:
+    dict: Feature name -> value, or None if the flight needs the pandas path
+        (departure outside 00:00-23:59, a year outside 1700-2200, or precipitation
+        outside the rain bins)
+    """
+    dep_time = prediction_data['DEP_TIME']
+    year = prediction_data['YEAR']
+    prcp = prediction_data['PRCP']
+    distance = prediction_data['DISTANCE']
+    if not (0 <= dep_time < 2400 and 1700 <= year <= 2200 and RAIN_BINS[0] < prcp <= RAIN_BINS[-1]):
+        return None
+
+    row = dict(_hour_table()[int(dep_time // 100)])
+    try:
+        week = (datetime.date(year, month, day).weekday() + 1) % 7
+    except (TypeError, ValueError):
+        week = 7
+    row.update(_day_table()[week])
+
+    origin, dest = prediction_data['ORIGIN_IATA'], prediction_data['DEST_IATA']
+    hub_origin, hub_dest = int(origin in HUBS), int(dest in HUBS)
+    west_origin, east_origin = int(origin in WEST_COAST), int(origin in EAST_COAST)
+    west_dest, east_dest = int(dest in WEST_COAST), int(dest in EAST_COAST)
+
+    rain_severity = bisect.bisect_left(RAIN_BINS, prcp) - 1
+    weather_score = rain_severity + prediction_data['EXTREME_WEATHER'] * 3
+    row.update(
+        DISTANCE=distance,
+        PRCP=prcp,
+        MKT_AIRLINE=prediction_data['MKT_AIRLINE'],
+        ORIGIN_IATA=origin,
+        DEST_IATA=dest,
+        EXTREME_WEATHER=prediction_data['EXTREME_WEATHER'],
+        IS_REDEYE=int(0 <= dep_time < 600),
+        IS_MAJOR_HUB_ORIGIN=hub_origin,
+        IS_MAJOR_HUB_DEST=hub_dest,
+        IS_HUB_TO_HUB=hub_origin & hub_dest,
+        IS_WEST_COAST_ORIGIN=west_origin,
+        IS_EAST_COAST_ORIGIN=east_origin,
+        IS_CENTRAL_ORIGIN=int(origin in CENTRAL),
+        IS_WEST_COAST_DEST=west_dest,
+        IS_EAST_COAST_DEST=east_dest,
+        IS_CENTRAL_DEST=int(dest in CENTRAL),
+        IS_TRANSCON=(west_origin & east_dest) | (east_origin & west_dest),
+        DISTANCE_CAT=DISTANCE_LABELS[bisect.bisect_left(DISTANCE_BINS, distance) - 1] if distance > 0 else None,
+        NORMALIZED_DISTANCE=distance / MAX_DISTANCE,
+        LOG_DISTANCE=np.log1p(distance),
+        RAIN_SEVERITY=rain_severity,
+        WEATHER_SCORE=weather_score,
+        HUB_WEATHER_IMPACT=hub_origin * weather_score,
+        PEAK_WEATHER_IMPACT=(row['IS_MORNING_PEAK'] | row['IS_EVENING_PEAK']) * weather_score
+    )
+    return row
+
+
+def dep_delay_vectors(flights, dtype=np.float32, sparse=False):
+    """
+    Maps flights straight to the dep-delay network input, without pandas.
+
+    Parameters:
+    flights (list): (prediction_data, month, day) tuples from normalize_flight
+    dtype: Output dtype (the networks run in float32)
+    sparse (bool): Return the SparseRows form instead of the dense array
+
+    Returns:
+    ndarray or SparseRows: Array of shape (n, 139), equal to prepare_features on the
+        same flights cast to dtype, or None if any flight needs the pandas path
+    """
+    with STAGE_SECONDS.time('dep_delay_features'):
+        rows = []
+        for prediction_data, month, day in flights:
+            row = dep_delay_features(prediction_data, month, day)
+            if row is None:
+                return None
+            rows.append(row)
+    with STAGE_SECONDS.time('dep_delay_transform'):
+        preprocessor = load_compiled_preprocessor()
+        columns = {name: [row[name] for row in rows]
+                   for name in preprocessor.numeric_columns + preprocessor.categorical_columns}
+        if sparse:
+            return preprocessor.transform_sparse(columns, dtype=dtype)
+        return preprocessor.transform(columns, dtype=dtype)
+
+
+def arrival_features(prediction_data, dep_delay):
+    """
+    The arrival model input row for one normalized flight, with the same values as
+    pred_arr_delay.prepare_arrival_features.
+
+    Parameters:
+    prediction_data (dict): Normalized flight from normalize_flight
+    dep_delay (float): Predicted departure delay in minutes
+
+    Returns:
+    dict: ARRIVAL_CATEGORICAL_FEATURES and ARRIVAL_NUMERIC_FEATURES, or None if the
+        flight needs the pandas path (missing or non-positive distance, missing
+        numeric values, or a non-numeric WEEK)
+    """
+    dep_time, distance, week = prediction_data['DEP_TIME'], prediction_data['DISTANCE'], prediction_data['WEEK']
+    prcp = prediction_data['PRCP']
+    if _is_missing(dep_time) or _is_missing(prcp) or _is_missing(dep_delay) or _is_missing(distance) \
+            or not distance > 0 or not isinstance(week, (int, float)):
+        return None
+
+    # 估计到达时间 (平均飞行速度 500 英里/小时)
+    dep_hour = dep_time // 100
+    est_arr_decimal_hour = (dep_hour + (dep_time % 100) / 60 + distance / 500) % 24
+    arr_hour = int(est_arr_decimal_hour)
+
+    origin, dest = prediction_data['ORIGIN_IATA'], prediction_data['DEST_IATA']
+    return {
+        'DAY_NAME': DAY_NAMES[int(week)] if week in range(7) else 'Monday',
+        'ARR_TIME_BLOCK': TIME_BLOCKS[arr_hour] if 0 <= arr_hour < 24 else 'Mid-Day (9-12)',
+        'MKT_AIRLINE': prediction_data['MKT_AIRLINE'],
+        'ORIGIN_IATA': 'unknown' if _is_missing(origin) else origin,
+        'DEST_IATA': 'unknown' if _is_missing(dest) else dest,
+        'FLIGHT_DISTANCE_CAT': FLIGHT_DISTANCE_LABELS[bisect.bisect_left(FLIGHT_DISTANCE_BINS, distance) - 1],
+        'IS_LATE_NIGHT_ARR': int(est_arr_decimal_hour >= 22 or est_arr_decimal_hour < 6),
+        'IS_WEEKEND': int(week in (0, 6)),
+        'IS_MORNING_RUSH_ARR': int(8 <= arr_hour <= 10),
+        'IS_EVENING_RUSH_ARR': int(17 <= arr_hour <= 19),
+        'EXTREME_WEATHER': prediction_data['EXTREME_WEATHER'],
+        'DEST_EXTREME_WEATHER': 0,
+        'DISTANCE': distance,
+        'PRCP': prcp,
+        'DEST_PRCP': 0.0,
+        'DEP_DELAY': dep_delay
+    }
+
+
+def measure_latency(repeats=200):
+    """
+    Returns:
+    dict: Median seconds of _predict_year for one flight with the fast path on and off
+    """
+    import time
+    import prediction_service
+    flight = prediction_service.normalize_flight({"from": "JFK", "to": "LAX", "airline": "AA", "depTime": 1345,
+                                                  "week": 3, "year": 2024, "time": "2024-05-15T13:45:00Z",
+                                                  "rainfall": 0.1})
+    saved = prediction_service.FAST_PATH_MAX_FLIGHTS
+    latency = {}
+    try:
+        for name, max_flights in [('pandas', 0), ('fast_path', 1)]:
+            prediction_service.FAST_PATH_MAX_FLIGHTS = max_flights
+            prediction_service._predict_year(2024, [flight])  # 预热
+            timings = []
+            for _ in range(repeats):
+                started = time.perf_counter()
+                prediction_service._predict_year(2024, [flight])
+                timings.append(time.perf_counter() - started)
+            latency[name] = float(np.median(timings))
+    finally:
+        prediction_service.FAST_PATH_MAX_FLIGHTS = saved
+    return latency
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time a single-flight prediction with the fast path on and off")
+    parser.add_argument('--repeats', type=int, default=200, help="timed single-flight predictions per path")
+    args = parser.parse_args()
+
+    # 到达延误模型缺失时每次预测都会记录警告
+    logging.disable(logging.WARNING)
+    for name, seconds in measure_latency(args.repeats).items():
+        print(f"{name:10s} {seconds * 1000:8.2f} ms per single-flight prediction")
@@ -0,0 +1,68 @@
+import time
+import argparse
+import tracemalloc
+import pred_dep_delay
+import pred_arr_delay
+from synthetic_flights import generate_flights
+
+DEP_DELAY_COLUMNS = ['SCH_DEP_TIME', 'ORIGIN_IATA', 'DEST_IATA', 'DISTANCE', 'PRCP',
+                     'MONTH', 'DAY', 'YEAR', 'MKT_AIRLINE', 'EXTREME_WEATHER']
+
+
+def dep_delay_features(flights):
+    # 与 pred_dep_delay.prepare_features 相同的特征阶段 (不含预处理器)
+    df = pred_dep_delay.create_redeye_indicator(flights.copy(deep=False))
+    df = pred_dep_delay.create_advanced_time_features(df)
+    df = pred_dep_delay.create_advanced_day_features(df)
+    df = pred_dep_delay.create_airport_features(df)
+    return pred_dep_delay.create_weather_features(df)
+
+
+def arr_delay_features(flights):
+    # 与 predict_arrival_delay 相同: 入口处复制一次，再生成特征
+    return pred_arr_delay.create_features_for_prediction(flights.copy(deep=False))
+
+
+def measure(fn, *args):
+    """
+    Returns:
+    tuple: (seconds, peak bytes allocated above the starting point while fn ran)
+    """
+    tracemalloc.start()
+    started = time.perf_counter()
+    fn(*args)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def run(rows, seed=0):
+    """
+    Times the dep-delay and arrival-delay feature stages on synthetic flights.
+
+    Returns:
+    dict: Stage name -> {"seconds", "peak_mb"}
+    """
+    flights = generate_flights(rows, seed=seed)
+    dep_input = flights[DEP_DELAY_COLUMNS].copy()
+    arr_input = dep_input.assign(WEEK=flights['WEEK'], DEP_DELAY=10.0)
+
+    results = {}
+    for name, fn, data in [('dep_delay_features', dep_delay_features, dep_input),
+                           ('arr_delay_features', arr_delay_features, arr_input),
+                           ('dep_delay_prepare_features', pred_dep_delay.prepare_features, dep_input)]:
+        fn(data.iloc[:1000])  # 预热 (加载预处理器等)
+        seconds, peak = measure(fn, data)
+        results[name] = {"seconds": round(seconds, 3), "peak_mb": round(peak / 2 ** 20, 1)}
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the feature engineering of the delay predictors")
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    for name, result in run(args.rows, args.seed).items():
+        print(f"{name:28s} {result['seconds']:8.3f} s {result['peak_mb']:10.1f} MB peak")
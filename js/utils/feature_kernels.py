@@ -0,0 +1,150 @@
+from statistics import NormalDist
+import numpy as np
+from lazy_imports import LazyModule
+
+pd = LazyModule('pandas')
+
+# 小时 (0-23) -> 三小时时间段，出发和到达延误模型使用相同的划分
+TIME_BLOCKS = np.array(
+    ['Late Night (0-3)'] * 3 + ['Early Morning (3-6)'] * 3 + ['Morning (6-9)'] * 3 +
+    ['Mid-Day (9-12)'] * 3 + ['Afternoon (12-15)'] * 3 + ['Evening (15-18)'] * 3 +
+    ['Night (18-21)'] * 3 + ['Late Night (21-24)'] * 3, dtype=object)
+
+# 星期 (0=Sunday, 1=Monday, ..., 6=Saturday) -> 名称
+DAY_NAMES = np.array(['Sunday', 'Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday'], dtype=object)
+
+_DAYS_IN_MONTH = np.array([0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])
+
+
+def lookup(table, keys, missing=np.nan):
+    """
+    Replaces Series.map(dict) for dicts keyed by 0..len(table)-1.
+
+    Parameters:
+    table (ndarray): Value for each integer key
+    keys (array-like): Keys; NaN, non-integer and out-of-range keys get missing, as with map + fillna
+    missing: Value for keys outside the table
+
+    Returns:
+    ndarray: One value per key
+    """
+    keys = np.asarray(keys, dtype=float)
+    valid = (keys >= 0) & (keys < len(table)) & (keys == np.floor(keys))
+    values = table[np.where(valid, keys, 0).astype(np.intp)]
+    if not valid.all():
+        values = np.where(valid, values, missing)
+    return values
+
+
+def split_hhmm(times):
+    """
+    Splits HHMM times into hours and minutes. The values and dtype equal
+    times // 100 and times % 100, but when every time is a whole number the
+    split uses integer arithmetic, which is several times faster than float
+    floor division.
+
+    Returns:
+    tuple: (hours, minutes) arrays
+    """
+    times = np.asarray(times)
+    if times.dtype.kind == 'f' and np.isfinite(times).all() and (times == np.floor(times)).all() \
+            and (np.abs(times) < 2 ** 52).all():
+        whole = times.astype(np.int64)
+        hours = whole // 100
+        return hours.astype(times.dtype), (whole - hours * 100).astype(times.dtype)
+    return times // 100, times % 100
+
+
+def tabulate(fn, keys, size):
+    """
+    Returns fn(keys) for an elementwise fn. When every key is a whole number in
+    [0, size), fn is evaluated once on range(size) and the result is gathered,
+    which gives the same values as evaluating it on every row.
+
+    Parameters:
+    fn (callable): Elementwise NumPy expression, e.g. lambda h: np.sin(2 * np.pi * h / 24)
+    keys (ndarray): Integer or float keys
+    size (int): Number of possible keys
+
+    Returns:
+    ndarray: fn applied to every key
+    """
+    keys = np.asarray(keys)
+    if len(keys) > size and keys.min() >= 0 and keys.max() < size and \
+            (keys.dtype.kind in 'iu' or (keys == np.floor(keys)).all()):
+        return fn(np.arange(size, dtype=keys.dtype))[keys.astype(np.intp)]
+    return fn(keys)
+
+
+def memberships(values, *groups):
+    """
+    Series.isin for columns with few distinct values (airport codes). The
+    column is factorized once and each membership test runs on the distinct
+    values only.
+
+    values may also be a categorical Series (e.g. dictionary-encoded columns
+    read from Parquet), whose codes are used directly.
+
+    Returns:
+    list: One boolean mask per group, False for missing values
+    """
+    if isinstance(getattr(values, 'dtype', None), pd.CategoricalDtype):
+        codes, uniques = values.cat.codes.to_numpy(), values.cat.categories.to_numpy()
+    else:
+        codes, uniques = pd.factorize(values)
+    # 末尾的 False 对应缺失值的编码 -1
+    return [np.append(np.isin(uniques, members), False)[codes] for members in groups]
+
+
+def valid_dates(year, month, day):
+    """
+    Marks which (year, month, day) triples are proleptic Gregorian dates that
+    days_since_epoch accepts.
+
+    Returns:
+    ndarray: bool per date, False for missing, non-integer, invalid, or out-of-range
+        (before 1700 or after 2200) dates
+    """
+    year, month, day = (np.asarray(column, dtype=float) for column in (year, month, day))
+    # 先在浮点上检查范围，再转换为整数，避免 NaN 和超大值的转换警告
+    valid = ((year >= 1700) & (year <= 2200) & (month >= 1) & (month <= 12) & (day >= 1) & (day <= 31) &
+             (year == np.floor(year)) & (month == np.floor(month)) & (day == np.floor(day)))
+    y, m, d = (np.where(valid, column, 1).astype(np.int64) for column in (year, month, day))
+    leap = ((y % 4 == 0) & (y % 100 != 0)) | (y % 400 == 0)
+    return valid & (d <= _DAYS_IN_MONTH[m] + (leap & (m == 2)))
+
+
+def days_since_epoch(year, month, day):
+    """
+    Days since 1970-01-01 of proleptic Gregorian dates, computed with integer
+    arithmetic instead of pd.to_datetime.
+
+    Returns:
+    ndarray: int64 day numbers, or None if any date is missing, non-integer,
+        invalid, or outside the years pandas can represent
+    """
+    if not valid_dates(year, month, day).all():
+        return None
+    y, m, d = (np.asarray(column, dtype=float).astype(np.int64) for column in (year, month, day))
+
+    # 以三月为一年之始，闰日落在年末
+    y = y - (m <= 2)
+    era = y // 400
+    year_of_era = y - era * 400
+    day_of_year = (153 * (m + np.where(m > 2, -3, 9)) + 2) // 5 + d - 1
+    day_of_era = year_of_era * 365 + year_of_era // 4 - year_of_era // 100 + day_of_year
+    return era * 146097 + day_of_era - 719468
+
+
+# 常用置信水平的双侧 z 值 (与 scipy.stats.norm.ppf 的结果逐位相同)，请求路径上不再需要导入 scipy.stats
+Z_VALUES = {0.8: 1.2815515655446004, 0.9: 1.6448536269514722, 0.95: 1.959963984540054,
+            0.98: 2.3263478740408408, 0.99: 2.5758293035489004}
+
+
+def z_value(confidence):
+    """
+    Two-sided standard normal quantile for a confidence level, e.g. 1.96 for 0.95.
+    Other levels use statistics.NormalDist, which agrees with scipy to a few ulps.
+    """
+    z = Z_VALUES.get(confidence)
+    return z if z is not None else NormalDist().inv_cdf(1 - (1 - confidence) / 2)
@@ -0,0 +1,154 @@
+import os
+import numpy as np
+from preprocessor_compiler import CompiledPreprocessor
+
+# 行数不超过该值时所有树同步遍历，否则逐棵树遍历（节点表常驻缓存，大批量更快）
+LOCKSTEP_MAX_ROWS = 512
+
+# 可编译的最大树深度: 每棵树展开为 2^depth 个叶子
+MAX_COMPILED_DEPTH = 12
+
+
+class CompiledForest:
+    """
+    A fitted sklearn Pipeline(ColumnTransformer, RandomForestClassifier)
+    flattened into contiguous node arrays.
+
+    Every tree is expanded into a complete binary tree of the forest's
+    maximum depth and stored level by level (node i has children 2i+1 and
+    2i+2). Leaves above the bottom level are repeated down to it, with
+    an infinite threshold so every row passes straight through. Traversal is
+    then pure index arithmetic with no child pointers to look up and no check
+    for finished trees. Small batches advance through all trees in lockstep
+    (a handful of NumPy calls in total); large batches walk one tree at a time
+    so each tree's node table stays in cache.
+
+    Parameters:
+    pipeline (Pipeline): Fitted pipeline whose first step is a ColumnTransformer
+        and whose last step is a RandomForestClassifier
+
+    Raises:
+    ValueError: If the preprocessing cannot be compiled or the trees are deeper than MAX_COMPILED_DEPTH
+    """
+
+    def __init__(self, pipeline):
+        self.preprocessor = CompiledPreprocessor(pipeline.steps[0][1])
+        forest = pipeline.steps[-1][1]
+        self.classes_ = forest.classes_
+
+        trees = [estimator.tree_ for estimator in forest.estimators_]
+        self.max_depth = max(tree.max_depth for tree in trees)
+        if self.max_depth > MAX_COMPILED_DEPTH:
+            raise ValueError(f"Trees of depth {self.max_depth} are too deep to compile")
+        self.n_trees = len(trees)
+        self.n_internal = 2 ** self.max_depth - 1
+        self.n_leaves = 2 ** self.max_depth
+
+        # 每棵树: 内部节点 (n_trees, n_internal)，叶子概率 (n_trees, n_leaves, n_classes)
+        self.feature = np.zeros((self.n_trees, self.n_internal), dtype=np.intp)
+        self.threshold = np.zeros((self.n_trees, self.n_internal), dtype=np.float64)
+        self.leaf_value = np.zeros((self.n_trees, self.n_leaves, len(self.classes_)), dtype=np.float64)
+
+        for t, tree in enumerate(trees):
+            # 与 sklearn 的 predict_proba 一致: 每个节点的类别权重归一化为概率
+            value = tree.value[:, 0, :]
+            value = value / value.sum(axis=1, keepdims=True)
+
+            nodes = np.zeros(1, dtype=np.intp)  # 当前层每个位置对应的原始节点
+            for depth in range(self.max_depth):
+                is_leaf = tree.children_left[nodes] == -1
+                start = 2 ** depth - 1
+                self.feature[t, start:start + len(nodes)] = np.where(is_leaf, 0, tree.feature[nodes])
+                self.threshold[t, start:start + len(nodes)] = np.where(is_leaf, np.inf, tree.threshold[nodes])
+                children = np.empty(2 * len(nodes), dtype=np.intp)
+                children[0::2] = np.where(is_leaf, nodes, tree.children_left[nodes])
+                children[1::2] = np.where(is_leaf, nodes, tree.children_right[nodes])
+                nodes = children
+            self.leaf_value[t] = value[nodes]
+
+        self.feature = self.feature.ravel()
+        self.threshold = self.threshold.ravel()
+        self.leaf_value = self.leaf_value.reshape(-1, len(self.classes_))
+
+    def _traverse_lockstep(self, X):
+        n_rows, n_features = X.shape
+        flat_X = X.ravel()
+        row_base = (np.arange(n_rows) * n_features)[:, None]
+        tree_base = np.arange(self.n_trees) * self.n_internal
+
+        position = np.zeros((n_rows, self.n_trees), dtype=np.intp)
+        for _ in range(self.max_depth):
+            node = tree_base + position
+            feature = self.feature.take(node)
+            # NaN 与 sklearn 一样走右子树
+            go_right = ~(flat_X.take(row_base + feature) <= self.threshold.take(node))
+            position = 2 * position + 1 + go_right
+
+        leaf = np.arange(self.n_trees) * self.n_leaves + (position - self.n_internal)
+        return self.leaf_value[leaf].mean(axis=1)
+
+    def _traverse_per_tree(self, X):
+        n_rows = len(X)
+        # 按列存储，使同一特征的取值连续
+        flat_X = np.ascontiguousarray(X.T).ravel()
+        rows = np.arange(n_rows)
+        feature = self.feature.reshape(self.n_trees, -1)
+        threshold = self.threshold.reshape(self.n_trees, -1)
+        leaf_value = self.leaf_value.reshape(self.n_trees, self.n_leaves, -1)
+
+        total = np.zeros((n_rows, leaf_value.shape[2]))
+        for t in range(self.n_trees):
+            position = np.zeros(n_rows, dtype=np.intp)
+            for _ in range(self.max_depth):
+                x = flat_X.take(feature[t].take(position) * n_rows + rows)
+                position = 2 * position + 1 + ~(x <= threshold[t].take(position))
+            total += leaf_value[t].take(position - self.n_internal, axis=0)
+        return total / self.n_trees
+
+    def predict_proba_transformed(self, X):
+        """Class probabilities for already preprocessed rows of shape (n, n_features)."""
+        # sklearn 的树在 float32 上比较阈值
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        if len(X) <= LOCKSTEP_MAX_ROWS:
+            return self._traverse_lockstep(X)
+        return self._traverse_per_tree(X)
+
+    def predict_proba(self, data):
+        """
+        Same as Pipeline.predict_proba.
+
+        Parameters:
+        data (DataFrame or dict): Raw feature columns by name
+
+        Returns:
+        ndarray: Array of shape (n, n_classes)
+        """
+        return self.predict_proba_transformed(self.preprocessor.transform(data, dtype=np.float32))
+
+
+def compile_forest(pipeline):
+    """Compiles a fitted preprocessing + random forest pipeline into a CompiledForest."""
+    return CompiledForest(pipeline)
+
+
+def get_compiled_path(model_path):
+    """Path where the compiled version of a .joblib forest is stored."""
+    return os.path.splitext(model_path)[0] + '.compiled.joblib'
+
+
+def check_parity(pipeline, compiled, data, atol=1e-9):
+    """
+    Compares compiled and sklearn probabilities on the given rows.
+
+    Returns:
+    float: Maximum absolute difference
+
+    Raises:
+    ValueError: If the difference exceeds atol
+    """
+    expected = pipeline.predict_proba(data)
+    actual = compiled.predict_proba(data)
+    max_diff = float(np.abs(expected - actual).max())
+    if not max_diff <= atol:
+        raise ValueError(f"Compiled forest differs from sklearn by {max_diff}")
+    return max_diff
@@ -0,0 +1,28 @@
+import importlib
+
+
+class LazyModule:
+    """
+    Stand-in for a module that is imported on first attribute access, e.g.
+    `pd = LazyModule('pandas')`. Lets the servers and command-line tools start
+    (and answer /health) without paying for pandas until a prediction needs it.
+
+    After the import the module's namespace is copied onto the stand-in, so later
+    attribute lookups are plain dictionary hits. importlib.import_module holds the
+    module import lock, so concurrent first accesses from several threads (warm-up
+    and request threads) all see the fully imported module.
+
+    Parameters:
+    name (str): Module name, e.g. 'pandas'
+    """
+
+    def __init__(self, name):
+        self.__dict__['_lazy_name'] = name
+
+    def __getattr__(self, attr):
+        module = importlib.import_module(self._lazy_name)
+        self.__dict__.update(module.__dict__)
+        return getattr(module, attr)
+
+    def __repr__(self):
+        return f"<lazy module {self._lazy_name!r}>"
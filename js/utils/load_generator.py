@@ -0,0 +1,366 @@
+import json
+import time
+import argparse
+import itertools
+import threading
+import http.client
+from datetime import date
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from synthetic_flights import generate_flights
+
+
+def synthetic_searches(n, years=(2024,), seed=0, batch_fraction=0.0, batch_size=50):
+    """
+    Builds request sequences shaped like what js/user/input.js sends for one search:
+    POST /run-python with "FROM,TO", then POST /predict-cancellation with the flightData
+    object (distance 0, airline taken from the flight number, a datetime-local time string).
+
+    Parameters:
+    n (int): Number of distinct searches
+    years (tuple): Flight years to draw from (years after 2024 are clamped by the service)
+    seed (int): Random seed
+    batch_fraction (float): Share of searches replaced by one POST /predict-batch request
+    batch_size (int): Flights per /predict-batch request
+
+    Returns:
+    list: One list of (method, path, body) requests per search
+    """
+    rng = np.random.default_rng(seed)
+    flights = generate_flights(n * batch_size if batch_fraction > 0 else n, year=years[0], seed=seed)
+    flights['YEAR'] = rng.choice(list(years), len(flights))
+    # 换了年份后星期几也会变；WEEK 必须与 time 的日期一致 (0=Sunday)，否则请求落不到预测网格上
+    flights['WEEK'] = [(date(year, month, day).weekday() + 1) % 7
+                       for year, month, day in zip(flights['YEAR'], flights['MONTH'], flights['DAY'])]
+    rows = flights.to_dict('records')
+
+    def flight_data(row):
+        dep_time = int(row['DEP_TIME'])
+        flight_number = f"{row['MKT_AIRLINE']}{rng.integers(1, 10000)}"
+        return {
+            "from": row['ORIGIN_IATA'],
+            "to": row['DEST_IATA'],
+            "time": f"{row['YEAR']}-{row['MONTH']:02d}-{row['DAY']:02d}T{dep_time // 100:02d}:{dep_time % 100:02d}",
+            "flightNumber": flight_number,
+            "airline": flight_number[:2],
+            "depTime": dep_time,
+            "year": int(row['YEAR']),
+            "week": int(row['WEEK']),
+            "distance": 0,
+            "extremeWeather": int(row['EXTREME_WEATHER']),
+            "rainfall": float(row['PRCP'])
+        }
+
+    searches = []
+    for i in range(n):
+        if rng.random() < batch_fraction:
+            batch = [flight_data(row) for row in rows[i * batch_size:(i + 1) * batch_size]]
+            searches.append([('POST', '/predict-batch', {'flights': batch})])
+            continue
+        data = flight_data(rows[i])
+        searches.append([('POST', '/run-python', {'input': f"{data['from']},{data['to']}"}),
+                         ('POST', '/predict-cancellation', {'flightData': data})])
+    return searches
+
+
+def load_trace(path):
+    """
+    Reads a recorded request log: one JSON object per line, either a single request
+    {"t": 1.25, "method": "POST", "path": "/predict-cancellation", "body": {...}}
+    or a sequence sent one after another {"t": 1.25, "requests": [{...}, ...]}.
+    "t" is the send time in seconds from the start of the trace; "method" defaults to POST.
+
+    Returns:
+    list: (t, [(method, path, body), ...]) tuples sorted by t; t is None when the line has none
+    """
+    entries = []
+    with open(path) as file:
+        for line in file:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            requests = record.get('requests', [record])
+            entries.append((record.get('t'), [(r.get('method', 'POST'), r['path'], r.get('body')) for r in requests]))
+    if all(t is not None for t, _ in entries):
+        entries.sort(key=lambda entry: entry[0])
+    return entries
+
+
+def save_trace(path, searches, rate):
+    """Writes searches as a trace, sent at a fixed rate, in the format read by load_trace."""
+    with open(path, 'w') as file:
+        for i, requests in enumerate(searches):
+            record = {"t": round(i / rate, 6), "requests": [{"method": m, "path": p, "body": b} for m, p, b in requests]}
+            file.write(json.dumps(record) + '\n')
+
+
+class Client:
+    """
+    Minimal keep-alive HTTP client with one connection per thread.
+
+    Parameters:
+    base_url (str): e.g. http://127.0.0.1:5000
+    timeout (float): Socket timeout in seconds
+    """
+
+    def __init__(self, base_url, timeout=30.0):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def request(self, method, path, body=None):
+        """
+        Returns:
+        tuple: (HTTP status, response body bytes)
+
+        Raises:
+        OSError or http.client.HTTPException: If the connection fails
+        """
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        payload = json.dumps(body).encode() if body is not None else None
+        headers = {'Content-Type': 'application/json'} if payload is not None else {}
+        try:
+            connection.request(method, path, body=payload, headers=headers)
+            response = connection.getresponse()
+            data = response.read()
+            if response.getheader('Connection', '').lower() == 'close':
+                connection.close()
+                self._local.connection = None
+            return response.status, data
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            self._local.connection = None
+            raise
+
+
+class Recorder:
+    """Thread-safe list of completed requests: (finish time, path, latency seconds, status or error name)."""
+
+    def __init__(self):
+        self.samples = []
+        self._lock = threading.Lock()
+
+    def add(self, finished, path, latency, status):
+        with self._lock:
+            self.samples.append((finished, path, latency, status))
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.samples)
+
+
+def _send(client, recorder, requests, scheduled=None):
+    # 依次发送一次搜索中的请求。开环模式下第一个请求的延迟从计划发送时间算起，
+    # 这样服务端饱和时排队等待的时间也计入延迟 (避免协调遗漏)
+    for i, (method, path, body) in enumerate(requests):
+        started = scheduled if (scheduled is not None and i == 0) else time.perf_counter()
+        try:
+            status, _ = client.request(method, path, body)
+        except Exception as e:
+            status = type(e).__name__
+        finished = time.perf_counter()
+        recorder.add(finished, path, finished - started, status)
+
+
+def run_open_loop(client, recorder, work, rate, duration, max_workers=64):
+    """
+    Sends work items at a fixed rate (open loop) for duration seconds, cycling through work.
+    Items are handed to a pool of max_workers threads; when all are busy, items wait and
+    their waiting time counts towards the latency.
+
+    Parameters:
+    work (list): Request sequences
+    rate (float): Work items per second
+    """
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='load') as pool:
+        start = time.perf_counter()
+        i = 0
+        while True:
+            scheduled = start + i / rate
+            if scheduled - start >= duration:
+                break
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(_send, client, recorder, work[i % len(work)], scheduled)
+            i += 1
+
+
+def run_closed_loop(client, recorder, work, concurrency, duration):
+    """Runs concurrency threads that each send work items back to back for duration seconds."""
+    deadline = time.perf_counter() + duration
+    counter = itertools.count()
+    lock = threading.Lock()
+
+    def worker():
+        while time.perf_counter() < deadline:
+            with lock:
+                i = next(counter)
+            _send(client, recorder, work[i % len(work)])
+
+    threads = [threading.Thread(target=worker, name=f'load-{n}') for n in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def run_replay(client, recorder, trace, speed=1.0, max_workers=64):
+    """Sends every trace entry at its recorded time divided by speed (entries without a time are sent at once)."""
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='load') as pool:
+        start = time.perf_counter()
+        for t, requests in trace:
+            scheduled = start + (t or 0.0) / speed
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(_send, client, recorder, requests, scheduled)
+
+
+class RssSampler(threading.Thread):
+    """Polls GET /memory-report every interval seconds and keeps (time, rss, pss) of the worker that answered."""
+
+    def __init__(self, client, interval=1.0):
+        super().__init__(name='rss-sampler', daemon=True)
+        self.client = client
+        self.interval = interval
+        self.samples = []
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.is_set():
+            try:
+                status, data = self.client.request('GET', '/memory-report')
+                if status == 200:
+                    report = json.loads(data)
+                    self.samples.append((time.perf_counter(), report.get('rss'), report.get('pss')))
+            except Exception:
+                pass
+            self._stopped.wait(self.interval)
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+
+def _latency_summary(latencies):
+    if not latencies:
+        return {"p50_ms": None, "p95_ms": None, "p99_ms": None, "max_ms": None}
+    ms = np.array(latencies) * 1000.0
+    summary = {f"{name}_ms": round(float(np.percentile(ms, q)), 3) for name, q in (("p50", 50), ("p95", 95), ("p99", 99))}
+    summary["max_ms"] = round(float(ms.max()), 3)
+    return summary
+
+
+def summarize(samples, started, finished, rss_samples=(), interval=1.0):
+    """
+    Returns:
+    dict: Overall and per-path throughput, latency percentiles, error rate and status counts,
+        plus a timeline with one entry per interval (completions, errors, p50/p99, server RSS)
+    """
+    elapsed = finished - started
+
+    def describe(subset):
+        errors = sum(1 for _, _, _, status in subset if not (isinstance(status, int) and status < 400))
+        statuses = {}
+        for _, _, _, status in subset:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        return dict({
+            "requests": len(subset),
+            "throughput_rps": round(len(subset) / elapsed, 2) if elapsed > 0 else 0.0,
+            "error_rate": round(errors / len(subset), 4) if subset else 0.0,
+            "statuses": statuses
+        }, **_latency_summary([latency for _, _, latency, _ in subset]))
+
+    summary = describe(samples)
+    summary["duration_s"] = round(elapsed, 3)
+    summary["paths"] = {path: describe([s for s in samples if s[1] == path]) for path in sorted({s[1] for s in samples})}
+
+    timeline = []
+    for index in range(int(np.ceil(elapsed / interval))):
+        low, high = started + index * interval, started + (index + 1) * interval
+        window = [s for s in samples if low <= s[0] < high]
+        rss = [(r, p) for t, r, p in rss_samples if low <= t < high]
+        timeline.append(dict({
+            "t": round(index * interval, 3),
+            "completed": len(window),
+            "errors": sum(1 for _, _, _, status in window if not (isinstance(status, int) and status < 400)),
+            "server_rss_mb": round(rss[-1][0] / 2 ** 20, 1) if rss and rss[-1][0] else None,
+            "server_pss_mb": round(rss[-1][1] / 2 ** 20, 1) if rss and rss[-1][1] else None
+        }, **{key: value for key, value in _latency_summary([s[2] for s in window]).items() if key in ("p50_ms", "p99_ms")}))
+    summary["timeline"] = timeline
+    return summary
+
+
+def run_step(client, mode, value, work, duration, interval=1.0, max_workers=64):
+    """
+    Runs one load step and returns its summary.
+
+    Parameters:
+    mode (str): 'rate' (value = work items per second), 'concurrency' (value = threads)
+        or 'replay' (value = speed factor, work = trace entries)
+    """
+    recorder = Recorder()
+    sampler = RssSampler(client, interval)
+    sampler.start()
+    started = time.perf_counter()
+    if mode == 'rate':
+        run_open_loop(client, recorder, work, value, duration, max_workers)
+    elif mode == 'concurrency':
+        run_closed_loop(client, recorder, work, int(value), duration)
+    else:
+        run_replay(client, recorder, work, value, max_workers)
+    finished = time.perf_counter()
+    sampler.stop()
+    return dict({mode: value}, **summarize(recorder.snapshot(), started, finished, sampler.samples, interval))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Drive the prediction service with synthetic or recorded load")
+    parser.add_argument('--url', default='http://127.0.0.1:5000')
+    load = parser.add_mutually_exclusive_group(required=True)
+    load.add_argument('--rate', type=float, nargs='+', help="Open-loop searches per second; several values run as steps")
+    load.add_argument('--concurrency', type=int, nargs='+', help="Closed-loop client threads; several values run as steps")
+    load.add_argument('--replay', help="Trace file to replay (see load_trace)")
+    parser.add_argument('--speed', type=float, default=1.0, help="Replay speed factor")
+    parser.add_argument('--duration', type=float, default=30.0, help="Seconds per step")
+    parser.add_argument('--searches', type=int, default=1000, help="Distinct synthetic searches (fewer means more cache hits)")
+    parser.add_argument('--years', type=int, nargs='+', default=[2024])
+    parser.add_argument('--batch-fraction', type=float, default=0.0, help="Share of searches sent as one /predict-batch request")
+    parser.add_argument('--batch-size', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-workers', type=int, default=64, help="Sender threads in open-loop and replay mode")
+    parser.add_argument('--interval', type=float, default=1.0, help="Timeline and RSS sampling interval in seconds")
+    parser.add_argument('--timeout', type=float, default=30.0)
+    parser.add_argument('--record', help="Also write the synthetic searches as a trace file, sent at the first --rate")
+    parser.add_argument('--output', help="Write the full report as JSON")
+    args = parser.parse_args()
+
+    client = Client(args.url, args.timeout)
+    if args.replay:
+        steps = [('replay', args.speed, load_trace(args.replay))]
+    else:
+        work = synthetic_searches(args.searches, tuple(args.years), args.seed, args.batch_fraction, args.batch_size)
+        if args.record:
+            save_trace(args.record, work, (args.rate or [10.0])[0])
+        steps = [('rate', rate, work) for rate in args.rate] if args.rate else \
+            [('concurrency', concurrency, work) for concurrency in args.concurrency]
+
+    report = {"url": args.url, "duration_s": args.duration, "steps": []}
+    for mode, value, work in steps:
+        summary = run_step(client, mode, value, work, args.duration, args.interval, args.max_workers)
+        report["steps"].append(summary)
+        rss = [entry["server_rss_mb"] for entry in summary["timeline"] if entry["server_rss_mb"] is not None]
+        print(f"{mode}={value:<8g} {summary['throughput_rps']:9.2f} req/s  p50 {summary['p50_ms'] or 0:9.2f} ms  "
+              f"p95 {summary['p95_ms'] or 0:9.2f} ms  p99 {summary['p99_ms'] or 0:9.2f} ms  "
+              f"errors {summary['error_rate']:7.2%}  server RSS {max(rss) if rss else float('nan'):8.1f} MB", flush=True)
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+        print(f"Report written to {args.output}")
@@ -0,0 +1,175 @@
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+
+# 延迟直方图的桶上界 (秒)，覆盖从快速路径的亚毫秒级到冷启动加载模型的数秒
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_metrics = []
+_collectors = []
+
+
+def _format_labels(labelnames, labelvalues, extra=()):
+    pairs = list(zip(labelnames, labelvalues)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """
+    Monotonically increasing count, one per combination of label values.
+
+    Parameters:
+    name (str): Metric name, e.g. 'flight_prediction_errors_total'
+    documentation (str): HELP text
+    labelnames (tuple): Label names; inc() takes one value per name, in order
+    """
+
+    type = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def samples(self):
+        """
+        Returns:
+        list: (sample name, labels string, value) tuples
+        """
+        with self._lock:
+            values = dict(self._values)
+        return [(self.name, _format_labels(self.labelnames, labels), value) for labels, value in sorted(values.items())]
+
+
+class Histogram:
+    """
+    Distribution of observed values with fixed cumulative buckets, one per
+    combination of label values. Observing costs one bisect and one lock.
+
+    Parameters:
+    name (str): Metric name, e.g. 'flight_prediction_stage_seconds'
+    documentation (str): HELP text
+    labelnames (tuple): Label names; observe() and time() take one value per name, in order
+    buckets (tuple): Increasing bucket upper bounds; +Inf is added automatically
+    """
+
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}  # 标签值 -> [各桶计数 (非累计), 总和]
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def observe(self, value, *labelvalues):
+        bucket = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labelvalues)
+            if entry is None:
+                entry = self._values[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][bucket] += 1
+            entry[1] += value
+
+    @contextmanager
+    def time(self, *labelvalues):
+        """Observes the wall-clock seconds spent in the with block, also when it raises."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labelvalues)
+
+    def samples(self):
+        """
+        Returns:
+        list: (sample name, labels string, value) tuples for the _bucket, _sum and _count series
+        """
+        with self._lock:
+            values = {labels: (list(counts), total) for labels, (counts, total) in self._values.items()}
+        samples = []
+        for labels, (counts, total) in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                samples.append((self.name + '_bucket',
+                                _format_labels(self.labelnames, labels, [('le', _format_value(bound))]), cumulative))
+            samples.append((self.name + '_sum', _format_labels(self.labelnames, labels), total))
+            samples.append((self.name + '_count', _format_labels(self.labelnames, labels), cumulative))
+        return samples
+
+
+def register_collector(collect):
+    """
+    Adds metrics that are read at scrape time instead of being updated on every
+    event, e.g. cache counters or model memory that another module already tracks.
+
+    Parameters:
+    collect (callable): Returns a list of (name, type, documentation, samples) tuples, where
+        type is 'counter' or 'gauge' and samples is a list of (labels dict, value) pairs
+    """
+    _collectors.append(collect)
+    return collect
+
+
+def render():
+    """
+    Renders every metric in the Prometheus text exposition format (version 0.0.4).
+
+    Returns:
+    str: The /metrics response body
+    """
+    lines = []
+    for metric in list(_metrics):
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+        lines.extend(f"{name}{labels} {_format_value(value)}" for name, labels, value in metric.samples())
+    for collect in list(_collectors):
+        for name, metric_type, documentation, samples in collect():
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            lines.extend(f"{name}{_format_labels(list(labels), list(labels.values()))} {_format_value(value)}"
+                         for labels, value in samples)
+    return '\n'.join(lines) + '\n'
+
+
+# Prometheus 文本格式的 Content-Type
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# 预测流水线各阶段的耗时。stage 取值:
+#   cancellation, dep_delay, arrival: _predict_year 中的三个模型阶段 (含模型加载)
+#   dep_delay_features, dep_delay_transform, dep_delay_forward: 出发延误的特征工程、预处理器和网络前向传播
+#   arrival_features, arrival_forward: 到达延误的特征工程和随机森林预测
+STAGE_SECONDS = Histogram('flight_prediction_stage_seconds', 'Time spent in each stage of the prediction pipeline',
+                          ['stage'])
+
+MODEL_LOAD_SECONDS = Histogram('model_load_seconds', 'Time spent loading a model artifact into the registry',
+                               ['family'])
+
+# source: grid (预测网格) 或 model (运行模型)；缓存命中见 prediction_cache_lookups_total
+PREDICTIONS = Counter('flight_predictions_total', 'Flights answered from the prediction grid or by the models',
+                      ['source'])
+
+ERRORS = Counter('flight_prediction_errors_total',
+                 'Prediction stages that failed for a group of flights', ['stage'])
+
+HTTP_SECONDS = Histogram('http_request_seconds', 'HTTP request latency by route and status code', ['route', 'status'])
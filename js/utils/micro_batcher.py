@@ -0,0 +1,135 @@
+import os
+import time
+import queue
+import threading
+from collections import deque
+from concurrent.futures import Future
+
+# 最近多少个请求的排队延迟用于计算分位数
+RECENT_SAMPLES = 2048
+
+# 批大小直方图的桶上界
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+
+class MicroBatcher:
+    """
+    Collects items submitted concurrently by many threads and runs them through
+    one batched call.
+
+    A background worker waits for the first item, then keeps collecting until
+    either max_batch_size items are queued or window_ms has passed since that
+    first item, and calls batch_fn once on the collected list. Every caller gets
+    its own result (or the batch's exception) through a Future.
+
+    Parameters:
+    batch_fn (callable): Takes a list of items and returns a list of results in the same order
+    window_ms (float): How long to wait for more items after the first one
+    max_batch_size (int): Run the batch as soon as it reaches this size
+    """
+
+    def __init__(self, batch_fn, window_ms=2.0, max_batch_size=64):
+        self.batch_fn = batch_fn
+        self.window = window_ms / 1000.0
+        self.max_batch_size = max_batch_size
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker_pid = None
+
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._items = 0
+        self._errors = 0
+        self._batch_size_counts = [0] * (len(BATCH_SIZE_BUCKETS) + 1)
+        self._queue_delays = deque(maxlen=RECENT_SAMPLES)
+        self._batch_sizes = deque(maxlen=RECENT_SAMPLES)
+
+    def _ensure_worker(self):
+        # 线程不会被 fork 继承，因此每个进程在第一次提交时启动自己的工作线程
+        if self._worker_pid == os.getpid():
+            return
+        with self._lock:
+            if self._worker_pid != os.getpid():
+                self._queue = queue.Queue()
+                threading.Thread(target=self._run, name='micro-batcher', daemon=True).start()
+                self._worker_pid = os.getpid()
+
+    def submit(self, item):
+        """Queues an item and returns a Future for its result."""
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((item, future, time.perf_counter()))
+        return future
+
+    def __call__(self, item):
+        """Submits an item and waits for its result."""
+        return self.submit(item).result()
+
+    def _collect(self, work_queue):
+        batch = [work_queue.get()]
+        deadline = time.perf_counter() + self.window
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(work_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        work_queue = self._queue
+        while True:
+            batch = self._collect(work_queue)
+            started = time.perf_counter()
+            items = [item for item, _, _ in batch]
+            try:
+                results = self.batch_fn(items)
+                error = None
+            except Exception as e:
+                results, error = None, e
+
+            for i, (_, future, _) in enumerate(batch):
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(results[i])
+            self._record(batch, started, error is not None)
+
+    def _record(self, batch, started, failed):
+        size = len(batch)
+        bucket = next((i for i, bound in enumerate(BATCH_SIZE_BUCKETS) if size <= bound), len(BATCH_SIZE_BUCKETS))
+        with self._stats_lock:
+            self._batches += 1
+            self._items += size
+            self._errors += int(failed)
+            self._batch_size_counts[bucket] += 1
+            self._batch_sizes.append(size)
+            # 排队延迟: 从提交到批处理开始执行
+            self._queue_delays.extend(started - submitted for _, _, submitted in batch)
+
+    def stats(self):
+        """
+        Returns:
+        dict: Batch and item counts, a batch size histogram, and the mean batch size
+            and queueing delay percentiles (in ms) over the most recent items
+        """
+        with self._stats_lock:
+            delays = sorted(self._queue_delays)
+            sizes = list(self._batch_sizes)
+            histogram = dict(zip([str(bound) for bound in BATCH_SIZE_BUCKETS] + ['+Inf'], self._batch_size_counts))
+            stats = {
+                "window_ms": self.window * 1000.0,
+                "max_batch_size": self.max_batch_size,
+                "batches": self._batches,
+                "items": self._items,
+                "failed_batches": self._errors,
+                "queued": self._queue.qsize(),
+                "batch_size_histogram": histogram
+            }
+
+        stats["recent_mean_batch_size"] = sum(sizes) / len(sizes) if sizes else 0.0
+        for name, q in (("p50", 0.50), ("p90", 0.90), ("p99", 0.99)):
+            stats[f"queue_delay_{name}_ms"] = delays[min(int(q * len(delays)), len(delays) - 1)] * 1000.0 if delays else 0.0
+        return stats
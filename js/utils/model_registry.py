@@ -0,0 +1,127 @@
+import os
+import threading
+import logging
+from collections import OrderedDict
+from metrics import MODEL_LOAD_SECONDS, register_collector
+
+# 模型文件根目录 (仓库中的 models/ 文件夹)
+MODELS_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "../../models"))
+
+# 默认内存预算 (MB)，可通过环境变量 MODEL_REGISTRY_MAX_MB 调整
+DEFAULT_MAX_MB = float(os.environ.get('MODEL_REGISTRY_MAX_MB', 1024))
+
+
+class ModelRegistry:
+    """
+    Process-wide, thread-safe cache of loaded model artifacts.
+
+    Artifacts are keyed by (family, key), where family names the model type
+    (e.g. 'cancelled_prob', 'dep_delay_nn') and key is usually the model year.
+    Each artifact is loaded at most once; when the total size exceeds the
+    memory budget, the least recently used entries are evicted.
+
+    Parameters:
+    max_mb (float): Memory budget in megabytes. Artifact sizes are estimated
+        from their size on disk.
+    """
+
+    def __init__(self, max_mb=DEFAULT_MAX_MB):
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self._entries = OrderedDict()  # (family, key) -> (artifact, nbytes)
+        self._lock = threading.Lock()
+        self._key_locks = {}  # 每个键一把锁，避免同一模型被并发重复加载
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, family, key, loader, paths=()):
+        """
+        Returns the cached artifact for (family, key), loading it on first use.
+
+        Parameters:
+        family (str): Model family name
+        key (hashable): Artifact key within the family, usually the model year
+        loader (callable): Zero-argument function that loads the artifact
+        paths (iterable): Files the artifact is loaded from, used to estimate its size
+
+        Returns:
+        object: The loaded artifact
+        """
+        entry_key = (family, key)
+        with self._lock:
+            if entry_key in self._entries:
+                self._entries.move_to_end(entry_key)
+                self.hits += 1
+                return self._entries[entry_key][0]
+            key_lock = self._key_locks.setdefault(entry_key, threading.Lock())
+
+        with key_lock:
+            # 等待锁期间可能已由其他线程加载完成
+            with self._lock:
+                if entry_key in self._entries:
+                    self._entries.move_to_end(entry_key)
+                    self.hits += 1
+                    return self._entries[entry_key][0]
+
+            with MODEL_LOAD_SECONDS.time(family):
+                artifact = loader()
+            nbytes = sum(os.path.getsize(p) for p in paths if os.path.exists(p))
+            logging.debug(f"Loaded model {family}/{key} ({nbytes / 1024 / 1024:.1f} MB)")
+
+            with self._lock:
+                self.misses += 1
+                self._entries[entry_key] = (artifact, nbytes)
+                self._evict(keep=entry_key)
+        return artifact
+
+    def _evict(self, keep):
+        # 超出预算时按 LRU 顺序淘汰，但保留刚加载的条目
+        total = sum(nbytes for _, nbytes in self._entries.values())
+        for entry_key in list(self._entries):
+            if total <= self.max_bytes:
+                break
+            if entry_key == keep:
+                continue
+            _, nbytes = self._entries.pop(entry_key)
+            total -= nbytes
+            self.evictions += 1
+            logging.debug(f"Evicted model {entry_key[0]}/{entry_key[1]} from registry")
+
+    def stats(self):
+        """Returns a dict with cached entries, their sizes, total size and hit/miss/eviction counters."""
+        with self._lock:
+            return {
+                "entries": [f"{family}/{key}" for family, key in self._entries],
+                "entry_bytes": {f"{family}/{key}": nbytes for (family, key), (_, nbytes) in self._entries.items()},
+                "total_bytes": sum(nbytes for _, nbytes in self._entries.values()),
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
+
+    def clear(self):
+        """Drops all cached artifacts."""
+        with self._lock:
+            self._entries.clear()
+
+
+# 进程内共享的注册表实例
+registry = ModelRegistry()
+
+
+@register_collector
+def _collect():
+    # /metrics: 每个已缓存模型的大小，以及注册表的命中/未命中/淘汰计数
+    stats = registry.stats()
+    return [
+        ('model_registry_bytes', 'gauge', 'Estimated size of each cached model artifact',
+         [({'family': name.split('/', 1)[0], 'key': os.path.basename(name.split('/', 1)[1])}, nbytes)
+          for name, nbytes in stats['entry_bytes'].items()]),
+        ('model_registry_budget_bytes', 'gauge', 'Memory budget of the model registry',
+         [({}, stats['max_bytes'])]),
+        ('model_registry_lookups_total', 'counter', 'Model registry lookups by result',
+         [({'result': 'hit'}, stats['hits']), ({'result': 'miss'}, stats['misses'])]),
+        ('model_registry_evictions_total', 'counter', 'Models evicted to stay within the budget',
+         [({}, stats['evictions'])])
+    ]
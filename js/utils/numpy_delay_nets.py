@@ -0,0 +1,143 @@
+import os
+import argparse
+import numpy as np
+from model_registry import MODELS_DIR
+from preprocessor_compiler import SparseRows, to_csr
+
+DEP_DELAY_DIR = os.path.join(MODELS_DIR, 'dep_delay_nn')
+
+# BatchNorm1d 的默认 eps
+BN_EPS = 1e-5
+
+# 稀疏输入不超过该行数时直接按列号取权重行求和，否则用 CSR 矩阵乘法 (避免 (n, 21, hidden) 的中间数组)
+GATHER_MAX_ROWS = 64
+
+
+def get_npz_path(kind, year):
+    """Path of the converted weights for kind ('classifier' or 'regressor') and year."""
+    return os.path.join(DEP_DELAY_DIR, f'year_{year}', f'models_{year}', f'resnet_{kind}_{year}.npz')
+
+
+def _fold(weights, linear, bn):
+    # 将评估模式的 BatchNorm 折叠进前面的线性层，返回 (W^T, b) 以便计算 x @ W^T + b
+    scale = weights[f'{bn}.weight'] / np.sqrt(weights[f'{bn}.running_var'] + BN_EPS)
+    weight = weights[f'{linear}.weight'] * scale[:, None]
+    bias = (weights[f'{linear}.bias'] - weights[f'{bn}.running_mean']) * scale + weights[f'{bn}.bias']
+    return np.ascontiguousarray(weight.T, dtype=np.float32), bias.astype(np.float32)
+
+
+class NumpyDelayNet:
+    """
+    Pure-NumPy eval-mode forward pass of FlightDelayClassifier / FlightDelayRegressor.
+
+    Loads the raw state dict arrays written by convert_year(), folds each
+    BatchNorm1d into its preceding Linear and skips the dropouts, so it needs
+    neither torch nor a GPU at inference time. Given SparseRows, the first
+    layer sums the weight rows of the active one-hot columns instead of
+    multiplying by the mostly zero input.
+
+    Parameters:
+    weights (dict): State dict of the torch network as numpy arrays
+    kind (str): 'classifier' (ReLU + Sigmoid) or 'regressor' (LeakyReLU(0.1))
+    """
+
+    def __init__(self, weights, kind):
+        self.negative_slope = 0.1 if kind == 'regressor' else 0.0
+        self.apply_sigmoid = kind == 'classifier'
+
+        self.embedding = _fold(weights, 'embedding.0', 'embedding.1')
+        # 第一层权重末尾补一行 0，供未知类别 (列号 n_features) 取用
+        self.embedding_rows = np.vstack([self.embedding[0], np.zeros((1, self.embedding[0].shape[1]), np.float32)])
+        self.res_blocks = [(_fold(weights, f'{block}.fc1', f'{block}.bn1'),
+                            _fold(weights, f'{block}.fc2', f'{block}.bn2'))
+                           for block in ('res_block1', 'res_block2', 'res_block3')]
+        self.bottleneck = [_fold(weights, f'bottleneck.fc{i}', f'bottleneck.bn{i}') for i in (1, 2, 3)]
+        self.head = _fold(weights, 'prediction.0', 'prediction.1')
+        self.output = (np.ascontiguousarray(weights['prediction.4.weight'].T, dtype=np.float32),
+                       weights['prediction.4.bias'].astype(np.float32))
+
+    @classmethod
+    def from_npz(cls, path, kind):
+        with np.load(path) as data:
+            return cls({key: data[key] for key in data.files}, kind)
+
+    def _activation(self, x):
+        if self.negative_slope:
+            return np.where(x > 0, x, x * np.float32(self.negative_slope))
+        return np.maximum(x, 0, out=x)
+
+    def _embed_sparse(self, rows):
+        # 数值列做稠密乘法，分类列只累加取值为 1 的那些权重行
+        weight, bias = self.embedding
+        start = rows.numeric_offset
+        h = np.asarray(rows.numeric, dtype=np.float32) @ weight[start:start + rows.numeric.shape[1]]
+        h += bias
+        if len(h) <= GATHER_MAX_ROWS:
+            h += self.embedding_rows[rows.active].sum(axis=1)
+        else:
+            h += to_csr(rows) @ self.embedding_rows
+        return h
+
+    def __call__(self, x):
+        """
+        Parameters:
+        x (ndarray or SparseRows): Preprocessed input of shape (n, 139), or its sparse form
+
+        Returns:
+        ndarray: Output of shape (n, 1), a probability for the classifier and minutes for the regressor
+        """
+        if isinstance(x, SparseRows):
+            h = self._activation(self._embed_sparse(x))
+        else:
+            x = np.asarray(x, dtype=np.float32)
+            weight, bias = self.embedding
+            h = self._activation(x @ weight + bias)
+
+        for (w1, b1), (w2, b2) in self.res_blocks:
+            out = np.maximum(h @ w1 + b1, 0)
+            h = np.maximum(out @ w2 + b2 + h, 0)
+
+        (w1, b1), (w2, b2), (w3, b3) = self.bottleneck
+        out = np.maximum(h @ w1 + b1, 0)
+        out = np.maximum(out @ w2 + b2, 0)
+        h = np.maximum(out @ w3 + b3 + h, 0)
+
+        weight, bias = self.head
+        h = self._activation(h @ weight + bias)
+        weight, bias = self.output
+        out = h @ weight + bias
+        if self.apply_sigmoid:
+            out = 1.0 / (1.0 + np.exp(-out))
+        return out
+
+
+def convert_year(year):
+    """Converts both .pth state dicts of one year to .npz files and checks parity with torch (requires torch)."""
+    import torch
+    from dep_delay_nets import FlightDelayClassifier, FlightDelayRegressor
+    from pred_dep_delay import load_network, get_network_path
+
+    generator = torch.Generator().manual_seed(0)
+    x = torch.randn(4096, 139, generator=generator)
+    for kind, model_cls in (('classifier', FlightDelayClassifier), ('regressor', FlightDelayRegressor)):
+        state_dict = torch.load(get_network_path(kind, year))
+        np.savez(get_npz_path(kind, year),
+                 **{key: value.numpy() for key, value in state_dict.items() if value.dim() > 0})
+
+        original = load_network(model_cls, get_network_path(kind, year))
+        with torch.no_grad():
+            expected = original(x).numpy()
+        actual = NumpyDelayNet.from_npz(get_npz_path(kind, year), kind)(x.numpy())
+        max_diff = float(np.abs(expected - actual).max())
+        assert np.allclose(actual, expected, rtol=1e-5, atol=1e-4), \
+            f"NumPy network differs from torch by up to {max_diff}"
+        print(f"{year} {kind}: wrote {get_npz_path(kind, year)} (max abs diff {max_diff:.2e})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert the dep-delay ResNets to .npz weights for the NumPy inference engine")
+    parser.add_argument('--years', type=int, nargs='+', default=[2021, 2022, 2023, 2024])
+    args = parser.parse_args()
+
+    for year in args.years:
+        convert_year(year)
@@ -1,21 +1,39 @@
-import pandas as pd
+from lazy_imports import LazyModule
 import numpy as np
 import os
-import joblib
-from sklearn.preprocessing import StandardScaler, OneHotEncoder
-from sklearn.impute import SimpleImputer
-from scipy import stats
 import warnings
+from model_registry import registry, MODELS_DIR
+from shared_models import load_joblib
+from metrics import STAGE_SECONDS
+from feature_kernels import TIME_BLOCKS, DAY_NAMES, lookup, z_value
+
+pd = LazyModule('pandas')
+
+# 到达延误随机森林模型目录
+DEFAULT_MODEL_DIR = os.path.join(MODELS_DIR, "arr_delay_rf_models")
 
 warnings.filterwarnings('ignore')
 
+# Features used by the arrival delay models, in training order
+ARRIVAL_CATEGORICAL_FEATURES = ['DAY_NAME', 'ARR_TIME_BLOCK', 'MKT_AIRLINE',
+                                'ORIGIN_IATA', 'DEST_IATA', 'FLIGHT_DISTANCE_CAT',
+                                'IS_LATE_NIGHT_ARR', 'IS_WEEKEND', 'IS_MORNING_RUSH_ARR', 'IS_EVENING_RUSH_ARR',
+                                'EXTREME_WEATHER', 'DEST_EXTREME_WEATHER']
+ARRIVAL_NUMERIC_FEATURES = ['DISTANCE', 'PRCP', 'DEST_PRCP', 'DEP_DELAY']
+
+# Flight distance categories (right-closed bins)
+FLIGHT_DISTANCE_BINS = [0, 300, 600, 1000, 1500, float('inf')]
+FLIGHT_DISTANCE_LABELS = ['Very Short (<300 mi)', 'Short (300-600 mi)', 'Medium (600-1000 mi)',
+                          'Long (1000-1500 mi)', 'Very Long (>1500 mi)']
+
 def predict_arrival_delay(model_dir, flight_data, year=2024, confidence=0.95):
     """
     Predicts flight arrival delay using trained Random Forest models.
 
     Parameters:
     model_dir (str): Directory where models are stored
-    flight_data (dict or DataFrame): Dictionary or DataFrame containing flight information with these keys:
+    flight_data (dict, DataFrame or list): Dictionary or DataFrame containing flight information with these keys
+        (a list holds model input rows already built by fast_path.arrival_features):
         - MKT_AIRLINE: Marketing airline code (str, e.g., 'AA', 'DL', 'UA')
         - ORIGIN_IATA: Origin airport code (str, e.g., 'ATL', 'ORD')
         - DEST_IATA: Destination airport code (str, e.g., 'LAX', 'DFW')
@@ -42,12 +60,6 @@ def predict_arrival_delay(model_dir, flight_data, year=2024, confidence=0.95):
         - is_morning_rush: Whether the arrival is during morning rush (bool)
         - is_evening_rush: Whether the arrival is during evening rush (bool)
     """
-    # Convert single dictionary to DataFrame if needed
-    if isinstance(flight_data, dict):
-        df = pd.DataFrame([flight_data])
-    else:
-        df = flight_data.copy()
-
     # Get model paths
     year_model_dir = os.path.join(model_dir, f'year_{year}')
     class_model_path = os.path.join(year_model_dir, f"arr_delay_class_model_{year}.joblib")
@@ -57,58 +69,45 @@ def predict_arrival_delay(model_dir, flight_data, year=2024, confidence=0.95):
     if not (os.path.exists(class_model_path) and os.path.exists(reg_model_path)):
         return {"error": f"Models for year {year} not found in {year_model_dir}"}
 
-    # Load the models
+    # Load the models (cached in the process-wide model registry)
     try:
-        class_model = joblib.load(class_model_path)
-        reg_model = joblib.load(reg_model_path)
+        class_model = registry.get('arr_delay_class', os.path.normpath(class_model_path),
+                                   lambda: load_joblib(class_model_path), paths=[class_model_path])
+        reg_model = registry.get('arr_delay_reg', os.path.normpath(reg_model_path),
+                                 lambda: load_joblib(reg_model_path), paths=[reg_model_path])
     except Exception as e:
         return {"error": f"Failed to load models: {str(e)}"}
 
-    # Create necessary features for prediction
-    df = create_features_for_prediction(df)
-
-    # Select the features that were used in training
-    cat_features = ['DAY_NAME', 'ARR_TIME_BLOCK', 'MKT_AIRLINE',
-                    'ORIGIN_IATA', 'DEST_IATA', 'FLIGHT_DISTANCE_CAT',
-                    'IS_LATE_NIGHT_ARR', 'IS_WEEKEND', 'IS_MORNING_RUSH_ARR', 'IS_EVENING_RUSH_ARR',
-                    'EXTREME_WEATHER', 'DEST_EXTREME_WEATHER']
+    cat_features = ARRIVAL_CATEGORICAL_FEATURES
+    num_features = ARRIVAL_NUMERIC_FEATURES
 
-    num_features = [
-        'DISTANCE',
-        'PRCP', 'DEST_PRCP',
-        'DEP_DELAY'
-    ]
-
-    # Handle missing values and features
-    for col in cat_features:
-        if col not in df.columns:
-            if col == 'EXTREME_WEATHER' or col == 'DEST_EXTREME_WEATHER':
-                df[col] = 0
+    with STAGE_SECONDS.time('arrival_features'):
+        if isinstance(flight_data, list):
+            # 快速路径: 输入行已经是模型特征，跳过特征工程
+            df = pd.DataFrame(flight_data, columns=cat_features + num_features)
+        else:
+            # Convert single dictionary to DataFrame if needed
+            if isinstance(flight_data, dict):
+                df = pd.DataFrame([flight_data])
             else:
-                df[col] = 'unknown'
-        elif df[col].isnull().sum() > 0:
-            df[col] = df[col].fillna('unknown')
+                # 特征函数原地添加列，浅拷贝即可避免修改调用方的 DataFrame
+                df = flight_data.copy(deep=False)
 
-    for col in num_features:
-        if col not in df.columns:
-            df[col] = 0
-        elif df[col].isnull().sum() > 0:
-            if df[col].notna().any():
-                df[col] = df[col].fillna(df[col].median())
-            else:
-                df[col] = df[col].fillna(0)
+            # Create necessary features for prediction
+            df = prepare_arrival_features(df)
 
     # Create feature set for prediction
     X_pred = df[cat_features + num_features]
 
     # Make predictions
     try:
-        # Classification prediction (delayed or not)
-        delay_prob = class_model.predict_proba(X_pred)[:, 1]
-        delay_predicted = class_model.predict(X_pred)
+        with STAGE_SECONDS.time('arrival_forward'):
+            # Classification prediction (delayed or not)
+            delay_prob = class_model.predict_proba(X_pred)[:, 1]
+            delay_predicted = class_model.predict(X_pred)
 
-        # Regression prediction (delay minutes)
-        delay_minutes = reg_model.predict(X_pred)
+            # Regression prediction (delay minutes)
+            delay_minutes = reg_model.predict(X_pred)
 
         # Calculate confidence intervals using RMSE-based method
         # Define RMSE values based on year (hardcoded values)
@@ -123,7 +122,7 @@ def predict_arrival_delay(model_dir, flight_data, year=2024, confidence=0.95):
         rmse = rmse_values.get(year, 40.0)
 
         # Calculate z-score for the desired confidence level
-        z_score = stats.norm.ppf(1 - (1 - confidence) / 2)
+        z_score = z_value(confidence)
 
         # Calculate margin of error
         margin_of_error = z_score * rmse
@@ -148,8 +147,8 @@ def predict_arrival_delay(model_dir, flight_data, year=2024, confidence=0.95):
             "is_evening_rush": bool(df['IS_EVENING_RUSH_ARR'].iloc[0])
         }
 
-        # If input was a DataFrame with multiple flights, return predictions for all
-        if len(df) > 1 and isinstance(flight_data, pd.DataFrame):
+        # If input was a DataFrame or a list with multiple flights, return predictions for all
+        if len(df) > 1 and isinstance(flight_data, (pd.DataFrame, list)):
             results = []
             for i in range(len(df)):
                 flight_result = {
@@ -174,6 +173,42 @@ def predict_arrival_delay(model_dir, flight_data, year=2024, confidence=0.95):
         return {"error": f"Prediction failed: {str(e)}"}
 
 
+def prepare_arrival_features(df):
+    """
+    Builds the model input columns (ARRIVAL_CATEGORICAL_FEATURES and
+    ARRIVAL_NUMERIC_FEATURES) in place: creates the features and fills
+    missing columns and values
+
+    Args:
+        df: DataFrame with flight data
+
+    Returns:
+        DataFrame with the model input columns
+    """
+    df = create_features_for_prediction(df)
+
+    # Handle missing values and features
+    for col in ARRIVAL_CATEGORICAL_FEATURES:
+        if col not in df.columns:
+            if col == 'EXTREME_WEATHER' or col == 'DEST_EXTREME_WEATHER':
+                df[col] = 0
+            else:
+                df[col] = 'unknown'
+        elif df[col].isnull().sum() > 0:
+            df[col] = df[col].fillna('unknown')
+
+    for col in ARRIVAL_NUMERIC_FEATURES:
+        if col not in df.columns:
+            df[col] = 0
+        elif df[col].isnull().sum() > 0:
+            if df[col].notna().any():
+                df[col] = df[col].fillna(df[col].median())
+            else:
+                df[col] = df[col].fillna(0)
+
+    return df
+
+
 def create_features_for_prediction(df):
     """
     Create the necessary features for arrival delay prediction
@@ -204,9 +239,8 @@ def create_features_for_prediction(df):
             if valid_distance.any():
                 df.loc[valid_distance, 'FLIGHT_DISTANCE_CAT'] = pd.cut(
                     df.loc[valid_distance, 'DISTANCE'],
-                    bins=[0, 300, 600, 1000, 1500, float('inf')],
-                    labels=['Very Short (<300 mi)', 'Short (300-600 mi)', 'Medium (600-1000 mi)',
-                            'Long (1000-1500 mi)', 'Very Long (>1500 mi)']
+                    bins=FLIGHT_DISTANCE_BINS,
+                    labels=FLIGHT_DISTANCE_LABELS
                 )
             # Fill remaining NaN values
             df['FLIGHT_DISTANCE_CAT'] = df['FLIGHT_DISTANCE_CAT'].fillna('Medium (600-1000 mi)')
@@ -214,9 +248,8 @@ def create_features_for_prediction(df):
             # If no NaN values, proceed normally
             df['FLIGHT_DISTANCE_CAT'] = pd.cut(
                 df['DISTANCE'],
-                bins=[0, 300, 600, 1000, 1500, float('inf')],
-                labels=['Very Short (<300 mi)', 'Short (300-600 mi)', 'Medium (600-1000 mi)',
-                        'Long (1000-1500 mi)', 'Very Long (>1500 mi)']
+                bins=FLIGHT_DISTANCE_BINS,
+                labels=FLIGHT_DISTANCE_LABELS
             )
 
     return df
@@ -225,10 +258,8 @@ def create_features_for_prediction(df):
 def create_late_night_arrival_indicator(df):
     """
     Creates a binary indicator for late-night arrivals based on estimated arrival time
+    (modifies df in place and returns it)
     """
-    # Make a copy to avoid modifying the original
-    df = df.copy()
-
     # Initialize IS_LATE_NIGHT_ARR to 0 (not a late-night arrival)
     df['IS_LATE_NIGHT_ARR'] = 0
 
@@ -240,40 +271,37 @@ def create_late_night_arrival_indicator(df):
         except:
             pass
 
-        # 对于有效的出发时间和距离，估算到达时间
-        valid_input = ~df['SCH_DEP_TIME'].isna() & ~df['DISTANCE'].isna()
+        # 对于有效的出发时间和距离，估算到达时间，其余行为缺失值
+        dep_time = df['SCH_DEP_TIME'].to_numpy(dtype=float)
+        distance = df['DISTANCE'].to_numpy(dtype=float)
+        valid_input = ~np.isnan(dep_time) & ~np.isnan(distance)
         if valid_input.any():
             # 计算大致飞行时间（假设平均飞行速度为500英里/小时）
-            df.loc[valid_input, 'EST_FLIGHT_HOURS'] = df.loc[valid_input, 'DISTANCE'] / 500
-            
+            est_flight_hours = np.where(valid_input, distance / 500, np.nan)
+
             # 将出发时间转换为小时
-            df.loc[valid_input, 'DEP_HOUR'] = df.loc[valid_input, 'SCH_DEP_TIME'] // 100
-            df.loc[valid_input, 'DEP_MINUTE'] = df.loc[valid_input, 'SCH_DEP_TIME'] % 100
-            df.loc[valid_input, 'DEP_DECIMAL_HOUR'] = df.loc[valid_input, 'DEP_HOUR'] + df.loc[valid_input, 'DEP_MINUTE'] / 60
-            
+            dep_hour = np.where(valid_input, dep_time // 100, np.nan)
+            dep_minute = np.where(valid_input, dep_time % 100, np.nan)
+            dep_decimal_hour = dep_hour + dep_minute / 60
+
             # 计算预估到达小时（24小时制）
-            df.loc[valid_input, 'EST_ARR_DECIMAL_HOUR'] = (df.loc[valid_input, 'DEP_DECIMAL_HOUR'] + df.loc[valid_input, 'EST_FLIGHT_HOURS']) % 24
-            
+            est_arr_decimal_hour = (dep_decimal_hour + est_flight_hours) % 24
+            df['EST_FLIGHT_HOURS'] = est_flight_hours
+            df['DEP_HOUR'] = dep_hour
+            df['DEP_MINUTE'] = dep_minute
+            df['DEP_DECIMAL_HOUR'] = dep_decimal_hour
+            df['EST_ARR_DECIMAL_HOUR'] = est_arr_decimal_hour
+
             # 识别late-night到达（22:00-06:00）
-            late_night_arr = ((df.loc[valid_input, 'EST_ARR_DECIMAL_HOUR'] >= 22) | 
-                             (df.loc[valid_input, 'EST_ARR_DECIMAL_HOUR'] < 6))
-            df.loc[valid_input & late_night_arr, 'IS_LATE_NIGHT_ARR'] = 1
-            
-            # 添加到达时段
-            df['ARR_TIME_OF_DAY'] = pd.Series(dtype='object')  # 初始化为空
-            
-            # 按估算到达时间分类
-            df.loc[valid_input, 'ARR_TIME_OF_DAY'] = pd.cut(
-                df.loc[valid_input, 'EST_ARR_DECIMAL_HOUR'],
-                bins=[0, 6, 12, 18, 22, 24],
-                labels=['Early Morning (0-6)', 'Morning (6-12)', 'Afternoon (12-18)',
-                        'Evening (18-22)', 'Night (22-24)'],
-                include_lowest=True
-            )
-        
-        # 填充缺失值
-        if 'ARR_TIME_OF_DAY' in df.columns:
-            df['ARR_TIME_OF_DAY'] = df['ARR_TIME_OF_DAY'].fillna('Afternoon (12-18)')
+            late_night_arr = (est_arr_decimal_hour >= 22) | (est_arr_decimal_hour < 6)
+            df['IS_LATE_NIGHT_ARR'] = (valid_input & late_night_arr).astype(np.int64)
+
+            # 按估算到达时间分类 (与 pd.cut(include_lowest=True) 相同的右闭区间)，缺失值填充为下午
+            bins = np.array([0, 6, 12, 18, 22, 24])
+            labels = np.array(['Early Morning (0-6)', 'Morning (6-12)', 'Afternoon (12-18)',
+                               'Evening (18-22)', 'Night (22-24)'], dtype=object)
+            block = np.clip(np.searchsorted(bins, est_arr_decimal_hour, side='left') - 1, 0, len(labels) - 1)
+            df['ARR_TIME_OF_DAY'] = np.where(np.isnan(est_arr_decimal_hour), 'Afternoon (12-18)', labels[block])
     else:
         # 如果没有必要的输入数据，设置默认时间段
         df['ARR_TIME_OF_DAY'] = 'Afternoon (12-18)'
@@ -284,10 +312,8 @@ def create_late_night_arrival_indicator(df):
 def create_arrival_time_block_features(df):
     """
     Creates time block features based on estimated arrival time
+    (modifies df in place and returns it)
     """
-    # Make a copy to avoid modifying the original
-    df = df.copy()
-
     # 检查是否已经有了估计到达小时
     if 'EST_ARR_DECIMAL_HOUR' not in df.columns:
         # 添加默认值
@@ -297,35 +323,20 @@ def create_arrival_time_block_features(df):
         df['IS_EVENING_RUSH_ARR'] = 0
         return df
 
-    # 从估计到达时间提取小时
-    df['ARR_HOUR'] = df['EST_ARR_DECIMAL_HOUR'].apply(lambda x: int(x) if not pd.isna(x) else 12)
-    
-    # 创建时间段（每段3小时）
-    time_blocks = {
-        0: 'Late Night (0-3)', 1: 'Late Night (0-3)', 2: 'Late Night (0-3)',
-        3: 'Early Morning (3-6)', 4: 'Early Morning (3-6)', 5: 'Early Morning (3-6)',
-        6: 'Morning (6-9)', 7: 'Morning (6-9)', 8: 'Morning (6-9)',
-        9: 'Mid-Day (9-12)', 10: 'Mid-Day (9-12)', 11: 'Mid-Day (9-12)',
-        12: 'Afternoon (12-15)', 13: 'Afternoon (12-15)', 14: 'Afternoon (12-15)',
-        15: 'Evening (15-18)', 16: 'Evening (15-18)', 17: 'Evening (15-18)',
-        18: 'Night (18-21)', 19: 'Night (18-21)', 20: 'Night (18-21)',
-        21: 'Late Night (21-24)', 22: 'Late Night (21-24)', 23: 'Late Night (21-24)'
-    }
-
-    # 将小时映射到时间段
-    df['ARR_TIME_BLOCK'] = df['ARR_HOUR'].map(time_blocks)
-
-    # 处理超出0-23范围的小时
-    invalid_hours = ~df['ARR_HOUR'].isin(range(24))
-    if invalid_hours.any():
-        df.loc[invalid_hours, 'ARR_TIME_BLOCK'] = 'Mid-Day (9-12)'  # 无效小时使用默认值
+    # 从估计到达时间提取小时 (向零取整，缺失值为 12)
+    est_arr_decimal_hour = df['EST_ARR_DECIMAL_HOUR'].to_numpy(dtype=float)
+    arr_hour = np.where(np.isnan(est_arr_decimal_hour), 12, np.trunc(est_arr_decimal_hour)).astype(np.int64)
+    df['ARR_HOUR'] = arr_hour
+
+    # 将小时映射到时间段（每段3小时），超出0-23范围的小时使用默认值
+    df['ARR_TIME_BLOCK'] = lookup(TIME_BLOCKS, arr_hour, 'Mid-Day (9-12)')
 
     # 创建高峰时段指标
     # 早高峰（8-10点到达）
-    df['IS_MORNING_RUSH_ARR'] = ((df['ARR_HOUR'] >= 8) & (df['ARR_HOUR'] <= 10)).astype(int)
+    df['IS_MORNING_RUSH_ARR'] = ((arr_hour >= 8) & (arr_hour <= 10)).astype(int)
 
     # 晚高峰（17-19点到达）
-    df['IS_EVENING_RUSH_ARR'] = ((df['ARR_HOUR'] >= 17) & (df['ARR_HOUR'] <= 19)).astype(int)
+    df['IS_EVENING_RUSH_ARR'] = ((arr_hour >= 17) & (arr_hour <= 19)).astype(int)
 
     return df
 
@@ -333,10 +344,8 @@ def create_arrival_time_block_features(df):
 def create_day_features(df):
     """
     Creates day type features from text day names (Sun, Mon, etc.)
+    (modifies df in place and returns it)
     """
-    # Make a copy to avoid modifying the original
-    df = df.copy()
-
     # Check if we have the WEEK column with text day names
     if 'WEEK' in df.columns:
         if isinstance(df['WEEK'].iloc[0], str):
@@ -363,17 +372,12 @@ def create_day_features(df):
 
         elif pd.api.types.is_numeric_dtype(df['WEEK']):
             # If WEEK is numeric, assume it follows 0=Sunday, 1=Monday, etc. format
+            week = df['WEEK'].to_numpy(dtype=float)
             # Create IS_WEEKEND
-            df['IS_WEEKEND'] = df['WEEK'].isin([0, 6]).astype(int)
-
-            # Map day numbers to names for better interpretability
-            day_names = {0: 'Sunday', 1: 'Monday', 2: 'Tuesday', 3: 'Wednesday',
-                         4: 'Thursday', 5: 'Friday', 6: 'Saturday'}
-            df['DAY_NAME'] = df['WEEK'].map(day_names)
+            df['IS_WEEKEND'] = ((week == 0) | (week == 6)).astype(int)
 
-            # Handle any values not in the mapping
-            if df['DAY_NAME'].isnull().any():
-                df['DAY_NAME'] = df['DAY_NAME'].fillna('Monday')
+            # Map day numbers to names for better interpretability (Monday for values outside 0-6)
+            df['DAY_NAME'] = lookup(DAY_NAMES, week, 'Monday')
     else:
         # Default values
         df['DAY_NAME'] = 'Monday'
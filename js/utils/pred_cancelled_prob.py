@@ -1,87 +1,106 @@
-import joblib
-import pandas as pd
+from lazy_imports import LazyModule
 import numpy as np
 import os
-import csv
+from airport_distance import get_distance
+from model_registry import registry, MODELS_DIR
+from shared_models import load_joblib
 
-def predict_flight_cancellation(model_path, flight_data):
+pd = LazyModule('pandas')
+
+def get_cancellation_model_path(year):
     """
-    Predicts flight cancellation probability using a trained Random Forest model.
+    Returns the path of the cancellation model trained on the given year's data.
 
     Parameters:
-    model_path (str): Path to the saved model (.joblib file)
-    flight_data (dict): Dictionary containing flight information with these keys:
-        - YEAR: Flight year (int)
-        - WEEK: Day of week (int, 0=Sunday, 1=Monday, ..., 6=Saturday)
-        - MKT_AIRLINE: Marketing airline code (str, e.g., 'AA', 'DL', 'UA')
-        - ORIGIN_IATA: Origin airport code (str, e.g., 'ATL', 'ORD')
-        - DEST_IATA: Destination airport code (str, e.g., 'LAX', 'DFW')
-        - DISTANCE: Flight distance in miles (float)
-        - DEP_TIME: Departure time in HHMM format (float, e.g., 1430 for 2:30 PM)
-        - ARR_TIME: Arrival time in HHMM format (float, e.g., 1630 for 4:30 PM)
+    year (int): Model year (2021, 2022, 2023 or 2024)
 
     Returns:
-    dict: Containing:
-        - cancellation_probability: Probability of flight cancellation (float)
-        - is_redeye: Whether the flight is classified as a red-eye (bool)
-        - is_weekend: Whether the flight is on a weekend (bool)
-        - is_morning_peak: Whether the flight is during morning peak hours (bool)
-        - is_evening_peak: Whether the flight is during evening peak hours (bool)
+    str: Path to the May{year}_model.joblib file
     """
-    # Load the trained model
-    try:
-        model = joblib.load(model_path)
-    except Exception as e:
-        return {"error": f"Failed to load model: {str(e)}"}
+    return os.path.join(MODELS_DIR, "cancelled_prob", f"May{year}_model.joblib")
 
-    # Create DataFrame from input data
-    flight_df = pd.DataFrame([flight_data])
 
+# Features used by the cancellation models, in training order
+CANCELLATION_FEATURES = ['YEAR', 'WEEK', 'MKT_AIRLINE', 'ORIGIN_IATA', 'DEST_IATA',
+                         'IS_REDEYE', 'IS_WEEKEND', 'IS_MORNING_PEAK', 'IS_EVENING_PEAK',
+                         'EXTREME_WEATHER', 'DEST_EXTREME_WEATHER', 'DISTANCE', 'PRCP', 'DEST_PRCP']
+
+# 字符串形式的 WEEK (星期名称) -> 0=Sunday, ..., 6=Saturday
+WEEKDAY_NUMBERS = {
+    'Sun': 0, 'Sunday': 0,
+    'Mon': 1, 'Monday': 1,
+    'Tue': 2, 'Tuesday': 2,
+    'Wed': 3, 'Wednesday': 3,
+    'Thu': 4, 'Thursday': 4,
+    'Fri': 5, 'Friday': 5,
+    'Sat': 6, 'Saturday': 6
+}
+
+# 推理引擎: 'sklearn' 使用原始 Pipeline; 'compiled' 使用 forest_compiler 展平后的节点数组
+ENGINE = os.environ.get('CANCELLATION_ENGINE', 'sklearn')
+
+
+def load_cancellation_model(model_path):
+    """
+    Returns the cancellation model for model_path from the process-wide model registry.
+
+    With CANCELLATION_ENGINE=compiled this is a CompiledForest, loaded from the
+    file written by cancellation_export.py or compiled in memory if it does not exist.
+    """
+    if ENGINE != 'compiled':
+        return registry.get('cancelled_prob', os.path.normpath(model_path),
+                            lambda: load_joblib(model_path), paths=[model_path])
+
+    from forest_compiler import compile_forest, get_compiled_path
+
+    def load():
+        compiled_path = get_compiled_path(model_path)
+        if os.path.exists(compiled_path):
+            return load_joblib(compiled_path)
+        return compile_forest(load_joblib(model_path))
+
+    return registry.get('cancelled_prob_compiled', os.path.normpath(model_path), load, paths=[model_path])
+
+
+def create_cancellation_features(flight_df):
+    """
+    Adds the red-eye, weekend and peak-hour indicators and the default weather
+    columns used by the cancellation models. Works on any number of rows.
+
+    Parameters:
+    flight_df (DataFrame): Flights with the keys described in predict_flight_cancellation
+
+    Returns:
+    DataFrame: The same DataFrame with the added columns
+    """
     # Convert string day of week to integer if needed
     if 'WEEK' in flight_df.columns and isinstance(flight_df['WEEK'].iloc[0], str):
-        day_map = {
-            'Sun': 0, 'Sunday': 0,
-            'Mon': 1, 'Monday': 1,
-            'Tue': 2, 'Tuesday': 2,
-            'Wed': 3, 'Wednesday': 3,
-            'Thu': 4, 'Thursday': 4,
-            'Fri': 5, 'Friday': 5,
-            'Sat': 6, 'Saturday': 6
-        }
-        flight_df['WEEK'] = flight_df['WEEK'].map(day_map)
+        flight_df['WEEK'] = flight_df['WEEK'].map(WEEKDAY_NUMBERS)
 
     # Determine if flight is a red-eye (between midnight and 6 AM)
-    flight_df['IS_REDEYE'] = 0
-
+    is_redeye = np.zeros(len(flight_df), dtype=bool)
     if 'DEP_TIME' in flight_df.columns:
-        dep_time = flight_df['DEP_TIME'].values[0]
-        if 0 <= dep_time < 600:
-            flight_df['IS_REDEYE'] = 1
-
+        dep_time = flight_df['DEP_TIME'].to_numpy(dtype=float)
+        is_redeye |= (dep_time >= 0) & (dep_time < 600)
     if 'ARR_TIME' in flight_df.columns:
-        arr_time = flight_df['ARR_TIME'].values[0]
-        if 0 <= arr_time < 600:
-            flight_df['IS_REDEYE'] = 1
+        arr_time = flight_df['ARR_TIME'].to_numpy(dtype=float)
+        is_redeye |= (arr_time >= 0) & (arr_time < 600)
+    flight_df['IS_REDEYE'] = is_redeye.astype(int)
 
     # Determine if flight is on a weekend (Sunday=0, Saturday=6)
     flight_df['IS_WEEKEND'] = 0
     if 'WEEK' in flight_df.columns:
-        week_value = flight_df['WEEK'].values[0]
-        if week_value == 0 or week_value == 6:  # Sunday or Saturday
-            flight_df['IS_WEEKEND'] = 1
+        flight_df['IS_WEEKEND'] = flight_df['WEEK'].isin([0, 6]).astype(int)
 
     # Determine if flight is during peak hours
     flight_df['IS_MORNING_PEAK'] = 0
     flight_df['IS_EVENING_PEAK'] = 0
 
     if 'DEP_TIME' in flight_df.columns:
-        dep_time = flight_df['DEP_TIME'].values[0]
         # Morning peak: 7:00 AM to 10:00 AM (700-1000)
-        if 700 <= dep_time < 1000:
-            flight_df['IS_MORNING_PEAK'] = 1
+        flight_df['IS_MORNING_PEAK'] = ((dep_time >= 700) & (dep_time < 1000)).astype(int)
         # Evening peak: 4:00 PM to 7:00 PM (1600-1900)
-        elif 1600 <= dep_time < 1900:
-            flight_df['IS_EVENING_PEAK'] = 1
+        flight_df['IS_EVENING_PEAK'] = ((dep_time >= 1600) & (dep_time < 1900)).astype(int)
 
     # Ensure we have PRCP and EXTREME_WEATHER columns
     if 'PRCP' not in flight_df.columns:
@@ -94,31 +113,82 @@ def predict_flight_cancellation(model_path, flight_data):
     if 'DEST_EXTREME_WEATHER' not in flight_df.columns:
         flight_df['DEST_EXTREME_WEATHER'] = 0
 
-    # Create a subset with only the features used in the model
-    # Match the features used during training (now including the new indicators)
-    required_features = ['YEAR', 'WEEK', 'MKT_AIRLINE', 'ORIGIN_IATA', 'DEST_IATA',
-                         'IS_REDEYE', 'IS_WEEKEND', 'IS_MORNING_PEAK', 'IS_EVENING_PEAK',
-                         'EXTREME_WEATHER', 'DEST_EXTREME_WEATHER', 'DISTANCE', 'PRCP', 'DEST_PRCP']
+    return flight_df
+
+
+def predict_flight_cancellation(model_path, flight_data):
+    """
+    Predicts flight cancellation probability using a trained Random Forest model.
+
+    Parameters:
+    model_path (str): Path to the saved model (.joblib file)
+    flight_data (dict): Dictionary containing flight information with these keys:
+        - YEAR: Flight year (int)
+        - WEEK: Day of week (int, 0=Sunday, 1=Monday, ..., 6=Saturday)
+        - MKT_AIRLINE: Marketing airline code (str, e.g., 'AA', 'DL', 'UA')
+        - ORIGIN_IATA: Origin airport code (str, e.g., 'ATL', 'ORD')
+        - DEST_IATA: Destination airport code (str, e.g., 'LAX', 'DFW')
+        - DISTANCE: Flight distance in miles (float)
+        - DEP_TIME: Departure time in HHMM format (float, e.g., 1430 for 2:30 PM)
+        - ARR_TIME: Arrival time in HHMM format (float, e.g., 1630 for 4:30 PM)
+
+    Returns:
+    dict: Containing:
+        - cancellation_probability: Probability of flight cancellation (float)
+        - is_redeye: Whether the flight is classified as a red-eye (bool)
+        - is_weekend: Whether the flight is on a weekend (bool)
+        - is_morning_peak: Whether the flight is during morning peak hours (bool)
+        - is_evening_peak: Whether the flight is during evening peak hours (bool)
+    """
+    result = predict_cancellation_batch(model_path, pd.DataFrame([flight_data]))
+    return result if isinstance(result, dict) else result[0]
+
+
+def predict_cancellation_batch(model_path, flight_df):
+    """
+    Predicts the cancellation probability of many flights with one model call.
+
+    Parameters:
+    model_path (str): Path to the saved model (.joblib file)
+    flight_df (DataFrame): One row per flight with the keys described in predict_flight_cancellation
+
+    Returns:
+    list or dict: One result dict per row (as returned by predict_flight_cancellation), in input order,
+        or a dict with an "error" key if the whole batch failed
+    """
+    # Load the trained model (cached in the process-wide model registry)
+    try:
+        model = load_cancellation_model(model_path)
+    except Exception as e:
+        return {"error": f"Failed to load model: {str(e)}"}
+
+    flight_df = create_cancellation_features(flight_df)
 
     # Check if all required features are present
-    missing_features = [f for f in required_features if f not in flight_df.columns]
+    missing_features = [f for f in CANCELLATION_FEATURES if f not in flight_df.columns]
     if missing_features:
         return {"error": f"Missing required features: {', '.join(missing_features)}"}
 
-    X = flight_df[required_features]
+    # Create a subset with only the features used in the model
+    X = flight_df[CANCELLATION_FEATURES]
 
     # Make prediction
     try:
         # Get probability of cancellation (class 1)
-        cancellation_prob = model.predict_proba(X)[0, 1]
-
-        return {
-            "cancellation_probability": float(cancellation_prob),
-            "is_redeye": bool(flight_df['IS_REDEYE'].values[0]),
-            "is_weekend": bool(flight_df['IS_WEEKEND'].values[0]),
-            "is_morning_peak": bool(flight_df['IS_MORNING_PEAK'].values[0]),
-            "is_evening_peak": bool(flight_df['IS_EVENING_PEAK'].values[0])
-        }
+        cancellation_probs = model.predict_proba(X)[:, 1]
+
+        return [
+            {
+                "cancellation_probability": float(prob),
+                "is_redeye": bool(is_redeye),
+                "is_weekend": bool(is_weekend),
+                "is_morning_peak": bool(is_morning_peak),
+                "is_evening_peak": bool(is_evening_peak)
+            }
+            for prob, is_redeye, is_weekend, is_morning_peak, is_evening_peak in zip(
+                cancellation_probs, flight_df['IS_REDEYE'], flight_df['IS_WEEKEND'],
+                flight_df['IS_MORNING_PEAK'], flight_df['IS_EVENING_PEAK'])
+        ]
     except Exception as e:
         return {"error": f"Prediction failed: {str(e)}"}
 
@@ -178,23 +248,20 @@ def predict_flight_cancellation(model_path, flight_data):
 
 def get_airport_distance(origin, destination):
     """
-    Reads the distance between two airports from the CSV file.
+    Returns the distance between two airports.
+
+    Pairs listed in top30_airport_distances.csv come from an in-memory index
+    loaded once; other pairs use the great-circle distance between the airport
+    coordinates (see airport_distance.py).
 
     Parameters:
     origin (str): Origin airport IATA code.
     destination (str): Destination airport IATA code.
 
     Returns:
-    float: Distance in miles, or 1 if not found.
+    float: Distance in miles, or 1 if an airport is unknown.
     """
-    csv_path = os.path.normpath(os.path.join(os.path.dirname(__file__), "../../models/top30_airport_distances.csv"))
     try:
-        with open(csv_path, mode='r') as file:
-            reader = csv.DictReader(file)
-            for row in reader:
-                if (row['Origin'] == origin and row['Destination'] == destination) or \
-                   (row['Origin'] == destination and row['Destination'] == origin):
-                    return float(row['Distance']) if row['Distance'] else 1.0
+        return get_distance(origin, destination)
     except Exception as e:
         return 1.0
-    return 1.0
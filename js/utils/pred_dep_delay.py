@@ -1,185 +1,179 @@
+import os
 import numpy as np
-import pandas as pd
-import torch
-import torch.nn as nn
-import joblib
-from scipy import stats
-
-
-# 定义ResNet风格的块
-class ResidualBlock(nn.Module):
-    def __init__(self, input_dim, hidden_dim=None):
-        super(ResidualBlock, self).__init__()
-        if hidden_dim is None:
-            hidden_dim = input_dim
-
-        self.fc1 = nn.Linear(input_dim, hidden_dim)
-        self.bn1 = nn.BatchNorm1d(hidden_dim)
-        self.relu = nn.ReLU()
-        self.fc2 = nn.Linear(hidden_dim, input_dim)
-        self.bn2 = nn.BatchNorm1d(input_dim)
-        self.dropout = nn.Dropout(0.2)
-
-    def forward(self, x):
-        identity = x
-
-        out = self.fc1(x)
-        out = self.bn1(out)
-        out = self.relu(out)
-        out = self.dropout(out)
-
-        out = self.fc2(out)
-        out = self.bn2(out)
-
-        out += identity  # Skip connection
-        out = self.relu(out)
-
-        return out
-
-
-class BottleneckResidualBlock(nn.Module):
-    def __init__(self, input_dim, bottleneck_dim):
-        super(BottleneckResidualBlock, self).__init__()
-
-        self.fc1 = nn.Linear(input_dim, bottleneck_dim)
-        self.bn1 = nn.BatchNorm1d(bottleneck_dim)
-        self.fc2 = nn.Linear(bottleneck_dim, bottleneck_dim)
-        self.bn2 = nn.BatchNorm1d(bottleneck_dim)
-        self.fc3 = nn.Linear(bottleneck_dim, input_dim)
-        self.bn3 = nn.BatchNorm1d(input_dim)
-
-        self.relu = nn.ReLU()
-        self.dropout = nn.Dropout(0.2)
-
-    def forward(self, x):
-        identity = x
-
-        out = self.fc1(x)
-        out = self.bn1(out)
-        out = self.relu(out)
-
-        out = self.fc2(out)
-        out = self.bn2(out)
-        out = self.relu(out)
-        out = self.dropout(out)
-
-        out = self.fc3(out)
-        out = self.bn3(out)
-
-        out += identity  # Skip connection
-        out = self.relu(out)
-
-        return out
-
-
-# 定义FlightDelayClassifier
-class FlightDelayClassifier(nn.Module):
-    def __init__(self, input_dim, hidden_dim=256):
-        super(FlightDelayClassifier, self).__init__()
-
-        # Initial embedding layer
-        self.embedding = nn.Sequential(
-            nn.Linear(input_dim, hidden_dim),
-            nn.BatchNorm1d(hidden_dim),
-            nn.ReLU(),
-            nn.Dropout(0.3)
-        )
-
-        # Residual blocks
-        self.res_block1 = ResidualBlock(hidden_dim)
-        self.res_block2 = ResidualBlock(hidden_dim)
-        self.res_block3 = ResidualBlock(hidden_dim)
-
-        # Bottleneck residual block for dimensionality reduction
-        self.bottleneck = BottleneckResidualBlock(hidden_dim, hidden_dim // 2)
-
-        # Final prediction layers
-        self.prediction = nn.Sequential(
-            nn.Linear(hidden_dim, 64),
-            nn.BatchNorm1d(64),
-            nn.ReLU(),
-            nn.Dropout(0.2),
-            nn.Linear(64, 1),
-            nn.Sigmoid()
-        )
-
-    def forward(self, x):
-        x = self.embedding(x)
-        x = self.res_block1(x)
-        x = self.res_block2(x)
-        x = self.res_block3(x)
-        x = self.bottleneck(x)
-        x = self.prediction(x)
-        return x
-
-
-# 定义FlightDelayRegressor
-class FlightDelayRegressor(nn.Module):
-    def __init__(self, input_dim, hidden_dim=256):
-        super(FlightDelayRegressor, self).__init__()
-
-        # Initial embedding layer
-        self.embedding = nn.Sequential(
-            nn.Linear(input_dim, hidden_dim),
-            nn.BatchNorm1d(hidden_dim),
-            nn.LeakyReLU(0.1),
-            nn.Dropout(0.3)
-        )
-
-        # Residual blocks
-        self.res_block1 = ResidualBlock(hidden_dim)
-        self.res_block2 = ResidualBlock(hidden_dim)
-        self.res_block3 = ResidualBlock(hidden_dim)
-
-        # Bottleneck residual block
-        self.bottleneck = BottleneckResidualBlock(hidden_dim, hidden_dim // 2)
-
-        # Final prediction layers
-        self.prediction = nn.Sequential(
-            nn.Linear(hidden_dim, 64),
-            nn.BatchNorm1d(64),
-            nn.LeakyReLU(0.1),
-            nn.Dropout(0.2),
-            nn.Linear(64, 1)
-        )
-
-    def forward(self, x):
-        x = self.embedding(x)
-        x = self.res_block1(x)
-        x = self.res_block2(x)
-        x = self.res_block3(x)
-        x = self.bottleneck(x)
-        x = self.prediction(x)
-        return x
+from lazy_imports import LazyModule
+from model_registry import registry, MODELS_DIR
+from shared_models import LOAD_MODE, load_joblib, load_torch_state_dict
+from preprocessor_compiler import CompiledPreprocessor, SparseRows, to_dense
+from metrics import STAGE_SECONDS
+from feature_kernels import (TIME_BLOCKS, DAY_NAMES, lookup, memberships, split_hhmm, tabulate, days_since_epoch,
+                             z_value)
+
+pd = LazyModule('pandas')
+
+# 网络格式: 'pth' 使用原始模块; 'folded' 使用折叠了 BatchNorm 的 TorchScript 推理图;
+# 'fused' 将分类器和回归器合并为一次批量前向传播 (由 dep_delay_export.py 导出);
+# 'int8' 使用动态量化的网络 (由 dep_delay_quantize.py 导出)。导出文件不存在时在内存中转换;
+# 'numpy' 使用纯 NumPy 推理引擎和 numpy_delay_nets.py 转换的 .npz 权重，无需安装 torch
+MODEL_FORMAT = os.environ.get('DEP_DELAY_MODEL_FORMAT', 'pth')
+
+# 为 1 时预处理结果以稀疏形式 (数值列 + 每个分类列的 one-hot 列号) 交给网络，'numpy' 和 'fused'
+# 格式的第一层只累加被激活的权重行；其他格式在运行前展开为稠密输入
+SPARSE_INPUT = os.environ.get('DEP_DELAY_SPARSE_INPUT', '0') == '1'
+
+# 所有年份共用 2021 年拟合的预处理器
+PREPROCESSOR_PATH = os.path.join(MODELS_DIR, 'dep_delay_nn', 'year_2021', 'resnet_preprocessor_2021.joblib')
+
+
+def __getattr__(name):
+    # 网络类定义在 dep_delay_nets 中，按需导入，numpy 推理模式下无需安装 torch
+    if name in ('ResidualBlock', 'BottleneckResidualBlock', 'FlightDelayClassifier', 'FlightDelayRegressor'):
+        import dep_delay_nets
+        return getattr(dep_delay_nets, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 # 加载预处理管道和模型
 def load_artifacts(year):
-    base_path = '/Users/apple/Documents/STAT628/Module3/earth-usa/models/dep_delay_nn'
-    
-    preprocessor_path = f'{base_path}/year_2021/resnet_preprocessor_2021.joblib'
-    classifier_path = f'{base_path}/year_{year}/models_{year}/resnet_classifier_{year}.pth'
-    regressor_path = f'{base_path}/year_{year}/models_{year}/resnet_regressor_{year}.pth'
-    
-    # 加载预处理器
-    preprocessor = joblib.load(preprocessor_path)
-
-    # 从笔记本我们知道预处理后特征数量是139
-    input_dim = 139
+    """
+    返回 (preprocessor, classifier, regressor)。各产物只从磁盘加载一次，
+    之后由进程级模型注册表缓存
+    """
+    preprocessor = load_preprocessor()
 
     # 加载分类器
-    classifier_state_dict = torch.load(classifier_path)
-    classifier = FlightDelayClassifier(input_dim=input_dim)
-    classifier.load_state_dict(classifier_state_dict)
+    classifier_path = get_network_path('classifier', year)
+    classifier = registry.get('dep_delay_classifier', year,
+                              lambda: _load_for_inference('classifier', year),
+                              paths=[classifier_path])
 
     # 加载回归器
-    regressor_state_dict = torch.load(regressor_path)
-    regressor = FlightDelayRegressor(input_dim=input_dim)
-    regressor.load_state_dict(regressor_state_dict)
+    regressor_path = get_network_path('regressor', year)
+    regressor = registry.get('dep_delay_regressor', year,
+                             lambda: _load_for_inference('regressor', year),
+                             paths=[regressor_path])
 
     return preprocessor, classifier, regressor
 
 
+def load_preprocessor():
+    """所有年份共用 2021 年拟合的预处理器"""
+    return registry.get('dep_delay_preprocessor', 2021,
+                        lambda: load_joblib(PREPROCESSOR_PATH), paths=[PREPROCESSOR_PATH])
+
+
+def load_compiled_preprocessor():
+    """编译为查找表的预处理器 (CompiledPreprocessor)，用于快速路径和稀疏输入"""
+    return registry.get('dep_delay_preprocessor_compiled', 2021,
+                        lambda: CompiledPreprocessor(load_preprocessor()), paths=[PREPROCESSOR_PATH])
+
+
+def get_network_path(kind, year):
+    """kind 为 'classifier' 或 'regressor'"""
+    return os.path.join(MODELS_DIR, 'dep_delay_nn', f'year_{year}', f'models_{year}', f'resnet_{kind}_{year}.pth')
+
+
+def load_network(model_cls, state_dict_path):
+    """从 .pth 文件构建网络并切换到评估模式"""
+    # 从笔记本我们知道预处理后特征数量是139
+    input_dim = 139
+
+    state_dict = load_torch_state_dict(state_dict_path)
+    model = model_cls(input_dim=input_dim)
+    # mmap 模式下直接使用映射的张量，而不是复制到新分配的参数中
+    model.load_state_dict(state_dict, assign=(LOAD_MODE == 'mmap'))
+    model.eval()
+    return model
+
+
+def _load_for_inference(kind, year):
+    if MODEL_FORMAT == 'numpy':
+        from numpy_delay_nets import NumpyDelayNet, get_npz_path
+        return NumpyDelayNet.from_npz(get_npz_path(kind, year), kind)
+
+    import torch
+    from dep_delay_nets import FlightDelayClassifier, FlightDelayRegressor
+    model_cls = FlightDelayClassifier if kind == 'classifier' else FlightDelayRegressor
+
+    if MODEL_FORMAT == 'pth':
+        return load_network(model_cls, get_network_path(kind, year))
+
+    if MODEL_FORMAT == 'int8':
+        from dep_delay_quantize import get_quantized_path, quantize_network
+        quantized_path = get_quantized_path(kind, year)
+        if os.path.exists(quantized_path):
+            return torch.jit.load(quantized_path)
+        return quantize_network(load_network(model_cls, get_network_path(kind, year)))
+
+    from dep_delay_export import get_folded_path, fold_network
+    folded_path = get_folded_path(kind, year)
+    if os.path.exists(folded_path):
+        return torch.jit.load(folded_path)
+    return fold_network(load_network(model_cls, get_network_path(kind, year)))
+
+
+def load_fused_network(year):
+    """返回分类器与回归器合并后的网络，一次前向传播同时输出延误概率和延误分钟数"""
+    import torch
+    from dep_delay_nets import FlightDelayClassifier, FlightDelayRegressor
+    from dep_delay_export import get_folded_path, fuse_networks
+
+    def load():
+        fused_path = get_folded_path('fused', year)
+        if os.path.exists(fused_path):
+            fused = torch.jit.load(fused_path)
+            # 旧版导出的文件不接受稀疏输入，此时在内存中重新合并
+            if not SPARSE_INPUT or _accepts_sparse(fused):
+                return fused
+        return fuse_networks(load_network(FlightDelayClassifier, get_network_path('classifier', year)),
+                             load_network(FlightDelayRegressor, get_network_path('regressor', year)))
+
+    return registry.get('dep_delay_fused', year, load,
+                        paths=[get_network_path('classifier', year), get_network_path('regressor', year)])
+
+
+def run_networks(year, X):
+    """
+    对预处理后的输入运行分类器和回归器
+
+    Args:
+        year: 模型年份
+        X: 形状为 (n, 139) 的预处理后输入，或其稀疏形式 SparseRows
+
+    Returns:
+        tuple: (延误概率, 延误时间)，均为形状 (n, 1) 的 numpy 数组
+    """
+    if MODEL_FORMAT == 'numpy':
+        _, classifier, regressor = load_artifacts(year)
+        return classifier(X), regressor(X)
+
+    import torch
+    with torch.no_grad():
+        if MODEL_FORMAT == 'fused':
+            fused = load_fused_network(year)
+            if isinstance(X, SparseRows) and _accepts_sparse(fused):
+                delay_prob, delay_time = fused(torch.from_numpy(np.asarray(X.numeric, dtype=np.float32)),
+                                               torch.from_numpy(X.active), X.numeric_offset)
+            else:
+                delay_prob, delay_time = fused(_dense_tensor(X))
+            return delay_prob.numpy(), delay_time.numpy()
+
+        _, classifier, regressor = load_artifacts(year)
+        X_tensor = _dense_tensor(X)
+        return classifier(X_tensor).numpy(), regressor(X_tensor).numpy()
+
+
+def _accepts_sparse(fused):
+    # 支持稀疏输入的合并网络: forward(x, active, numeric_offset)
+    return len(fused.forward.schema.arguments) > 2
+
+
+def _dense_tensor(X):
+    import torch
+    if isinstance(X, SparseRows):
+        return torch.from_numpy(to_dense(X))
+    return torch.from_numpy(np.asarray(X, dtype=np.float32))
+
+
 # 使用硬编码的方式获取每年的RMSE值
 def get_rmse(year):
     """返回对应年份的RMSE值"""
@@ -200,98 +194,84 @@ def get_rmse(year):
 
 
 def create_advanced_time_features(df):
-    df['DEP_HOUR'] = df['SCH_DEP_TIME'] // 100
-    df['DEP_MINUTE'] = df['SCH_DEP_TIME'] % 100
-    df['TIME_MINS'] = df['DEP_HOUR'] * 60 + df['DEP_MINUTE']
-    df['HOUR_SIN'] = np.sin(2 * np.pi * df['DEP_HOUR'] / 24)  # 周期编码
-    df['HOUR_COS'] = np.cos(2 * np.pi * df['DEP_HOUR'] / 24)
+    # 所有列在 NumPy 数组上计算后写入 df (原地修改)，HHMM 用整数运算拆分
+    dep_hour, dep_minute = split_hhmm(df['SCH_DEP_TIME'].to_numpy())
+    time_mins = dep_hour * 60 + dep_minute
+    df['DEP_HOUR'] = dep_hour
+    df['DEP_MINUTE'] = dep_minute
+    df['TIME_MINS'] = time_mins
 
-    # 添加从笔记本中的更多高级时间特征
-    df['NORMALIZED_TIME'] = df['TIME_MINS'] / (24 * 60)
+    # 周期编码 (24小时, 12小时 AM/PM 模式, 6小时一天四个部分)，每个小时只计算一次
+    df['HOUR_SIN'] = tabulate(lambda h: np.sin(2 * np.pi * h / 24), dep_hour, 24)
+    df['HOUR_COS'] = tabulate(lambda h: np.cos(2 * np.pi * h / 24), dep_hour, 24)
 
-    # 12小时周期 (AM/PM 模式)
-    df['HALFDAY_SIN'] = np.sin(2 * np.pi * df['DEP_HOUR'] / 12)
-    df['HALFDAY_COS'] = np.cos(2 * np.pi * df['DEP_HOUR'] / 12)
+    # 添加从笔记本中的更多高级时间特征
+    df['NORMALIZED_TIME'] = time_mins / (24 * 60)
 
-    # 6小时周期 (一天四个部分)
-    df['QUARTER_DAY_SIN'] = np.sin(2 * np.pi * df['DEP_HOUR'] / 6)
-    df['QUARTER_DAY_COS'] = np.cos(2 * np.pi * df['DEP_HOUR'] / 6)
+    df['HALFDAY_SIN'] = tabulate(lambda h: np.sin(2 * np.pi * h / 12), dep_hour, 24)
+    df['HALFDAY_COS'] = tabulate(lambda h: np.cos(2 * np.pi * h / 12), dep_hour, 24)
+    df['QUARTER_DAY_SIN'] = tabulate(lambda h: np.sin(2 * np.pi * h / 6), dep_hour, 24)
+    df['QUARTER_DAY_COS'] = tabulate(lambda h: np.cos(2 * np.pi * h / 6), dep_hour, 24)
 
     # 创建高峰时段指标
-    df['IS_MORNING_PEAK'] = ((df['DEP_HOUR'] >= 7) & (df['DEP_HOUR'] <= 9)).astype(int)
-    df['IS_EVENING_PEAK'] = ((df['DEP_HOUR'] >= 16) & (df['DEP_HOUR'] <= 19)).astype(int)
-
-    # 添加 TIME_BLOCK 特征
-    time_blocks = {
-        0: 'Late Night (0-3)',
-        1: 'Late Night (0-3)',
-        2: 'Late Night (0-3)',
-        3: 'Early Morning (3-6)',
-        4: 'Early Morning (3-6)',
-        5: 'Early Morning (3-6)',
-        6: 'Morning (6-9)',
-        7: 'Morning (6-9)',
-        8: 'Morning (6-9)',
-        9: 'Mid-Day (9-12)',
-        10: 'Mid-Day (9-12)',
-        11: 'Mid-Day (9-12)',
-        12: 'Afternoon (12-15)',
-        13: 'Afternoon (12-15)',
-        14: 'Afternoon (12-15)',
-        15: 'Evening (15-18)',
-        16: 'Evening (15-18)',
-        17: 'Evening (15-18)',
-        18: 'Night (18-21)',
-        19: 'Night (18-21)',
-        20: 'Night (18-21)',
-        21: 'Late Night (21-24)',
-        22: 'Late Night (21-24)',
-        23: 'Late Night (21-24)'
-    }
-    df['TIME_BLOCK'] = df['DEP_HOUR'].map(time_blocks)
+    df['IS_MORNING_PEAK'] = ((dep_hour >= 7) & (dep_hour <= 9)).astype(int)
+    df['IS_EVENING_PEAK'] = ((dep_hour >= 16) & (dep_hour <= 19)).astype(int)
+
+    # 添加 TIME_BLOCK 特征 (查找表，0-23 之外的小时为缺失值)
+    df['TIME_BLOCK'] = lookup(TIME_BLOCKS, dep_hour)
 
     return df
 
 
+# 机场分组
+HUB_AIRPORTS = ['ATL', 'DFW', 'ORD', 'LAX', 'DEN', 'CLT', 'LAS', 'PHX', 'MCO', 'SEA']
+WEST_COAST_AIRPORTS = ['LAX', 'SFO', 'SEA', 'PDX', 'SAN', 'LAS']
+EAST_COAST_AIRPORTS = ['JFK', 'LGA', 'EWR', 'BOS', 'DCA', 'IAD', 'MIA', 'FLL', 'ATL', 'CLT']
+CENTRAL_AIRPORTS = ['ORD', 'MDW', 'DFW', 'IAH', 'DEN', 'MSP', 'DTW', 'STL']
+
+# 距离分类 (右闭区间) 和标准化使用的最大距离 (基于经验设定)
+DISTANCE_BINS = [0, 500, 1000, 1500, 2000, float('inf')]
+DISTANCE_LABELS = ['Very Short', 'Short', 'Medium', 'Long', 'Very Long']
+MAX_DISTANCE = 3000
+
+# 降水类别 0-4 的区间 (右闭区间)
+RAIN_BINS = [-0.01, 0.0, 0.1, 0.5, 1.0, float('inf')]
+
+
 # 机场特征
 def create_airport_features(df):
-    hubs = ['ATL', 'DFW', 'ORD', 'LAX', 'DEN', 'CLT', 'LAS', 'PHX', 'MCO', 'SEA']
-    df['IS_MAJOR_HUB_ORIGIN'] = df['ORIGIN_IATA'].isin(hubs).astype(int)
+    # 每列机场代码只做一次去重，再对四组机场分别判断
+    groups = (HUB_AIRPORTS, WEST_COAST_AIRPORTS, EAST_COAST_AIRPORTS, CENTRAL_AIRPORTS)
+    hub_origin, west_origin, east_origin, central_origin = (
+        mask.astype(int) for mask in memberships(df['ORIGIN_IATA'], *groups))
+    df['IS_MAJOR_HUB_ORIGIN'] = hub_origin
     df['IS_HUB_TO_HUB'] = 0  # 默认值
 
     if 'DEST_IATA' in df.columns:
-        df['IS_MAJOR_HUB_DEST'] = df['DEST_IATA'].isin(hubs).astype(int)
-        df['IS_HUB_TO_HUB'] = (df['IS_MAJOR_HUB_ORIGIN'] & df['IS_MAJOR_HUB_DEST']).astype(int)
+        hub_dest, west_dest, east_dest, central_dest = (
+            mask.astype(int) for mask in memberships(df['DEST_IATA'], *groups))
+        df['IS_MAJOR_HUB_DEST'] = hub_dest
+        df['IS_HUB_TO_HUB'] = hub_origin & hub_dest
 
     # 区域指示器
-    west_coast = ['LAX', 'SFO', 'SEA', 'PDX', 'SAN', 'LAS']
-    east_coast = ['JFK', 'LGA', 'EWR', 'BOS', 'DCA', 'IAD', 'MIA', 'FLL', 'ATL', 'CLT']
-    central = ['ORD', 'MDW', 'DFW', 'IAH', 'DEN', 'MSP', 'DTW', 'STL']
-
-    df['IS_WEST_COAST_ORIGIN'] = df['ORIGIN_IATA'].isin(west_coast).astype(int)
-    df['IS_EAST_COAST_ORIGIN'] = df['ORIGIN_IATA'].isin(east_coast).astype(int)
-    df['IS_CENTRAL_ORIGIN'] = df['ORIGIN_IATA'].isin(central).astype(int)
+    df['IS_WEST_COAST_ORIGIN'] = west_origin
+    df['IS_EAST_COAST_ORIGIN'] = east_origin
+    df['IS_CENTRAL_ORIGIN'] = central_origin
 
     if 'DEST_IATA' in df.columns:
-        df['IS_WEST_COAST_DEST'] = df['DEST_IATA'].isin(west_coast).astype(int)
-        df['IS_EAST_COAST_DEST'] = df['DEST_IATA'].isin(east_coast).astype(int)
-        df['IS_CENTRAL_DEST'] = df['DEST_IATA'].isin(central).astype(int)
+        df['IS_WEST_COAST_DEST'] = west_dest
+        df['IS_EAST_COAST_DEST'] = east_dest
+        df['IS_CENTRAL_DEST'] = central_dest
 
         # 跨大陆航班指示器
-        df['IS_TRANSCON'] = ((df['IS_WEST_COAST_ORIGIN'] & df['IS_EAST_COAST_DEST']) |
-                             (df['IS_EAST_COAST_ORIGIN'] & df['IS_WEST_COAST_DEST'])).astype(int)
+        df['IS_TRANSCON'] = (west_origin & east_dest) | (east_origin & west_dest)
 
     # 创建距离分类特征
     if 'DISTANCE' in df.columns:
-        df['DISTANCE_CAT'] = pd.cut(
-            df['DISTANCE'],
-            bins=[0, 500, 1000, 1500, 2000, float('inf')],
-            labels=['Very Short', 'Short', 'Medium', 'Long', 'Very Long']
-        )
+        df['DISTANCE_CAT'] = pd.cut(df['DISTANCE'], bins=DISTANCE_BINS, labels=DISTANCE_LABELS)
 
         # 对距离进行标准化
-        max_dist = 3000  # 基于经验设定最大距离
-        df['NORMALIZED_DISTANCE'] = df['DISTANCE'] / max_dist
+        df['NORMALIZED_DISTANCE'] = df['DISTANCE'] / MAX_DISTANCE
 
         # 创建对数距离特征
         df['LOG_DISTANCE'] = np.log1p(df['DISTANCE'])
@@ -308,19 +288,18 @@ def create_weather_features(df):
         df: 包含天气信息的DataFrame
 
     Returns:
-        添加了天气特征的DataFrame
+        原地添加了天气特征的DataFrame
     """
-    # 创建一个副本以避免修改原始数据
-    df = df.copy()
-
     # 检查是否有基本天气特征
     if 'PRCP' in df.columns:
-        # 创建降水类别
-        df['RAIN_SEVERITY'] = pd.cut(
-            df['PRCP'],
-            bins=[-0.01, 0.0, 0.1, 0.5, 1.0, float('inf')],
-            labels=[0, 1, 2, 3, 4]
-        ).astype(int)
+        # 创建降水类别 (右闭区间，与 pd.cut 相同)
+        bins = np.array(RAIN_BINS)
+        prcp = df['PRCP'].to_numpy(dtype=float)
+        if ((prcp > bins[0]) & (prcp <= bins[-1])).all():
+            df['RAIN_SEVERITY'] = np.searchsorted(bins, prcp, side='left') - 1
+        else:
+            # 超出区间或缺失的降水量由 pd.cut 处理 (与原实现一样报错)
+            df['RAIN_SEVERITY'] = pd.cut(df['PRCP'], bins=bins, labels=[0, 1, 2, 3, 4]).astype(int)
     else:
         # 如果没有降水数据，创建默认值
         df['RAIN_SEVERITY'] = 0
@@ -353,59 +332,44 @@ def create_advanced_day_features(df):
         df: 包含DAY, MONTH, YEAR等数据的DataFrame
 
     Returns:
-        添加了日期特征的DataFrame
+        原地添加了日期特征的DataFrame
     """
-    # 创建一个副本以避免修改原始数据
-    df = df.copy()
-
-    # 添加 DAY_NAME 特征 - 修正映射，使用日期库的标准（周一-周六为1-6，周日为0）
-    day_map = {
-        1: 'Monday',
-        2: 'Tuesday',
-        3: 'Wednesday',
-        4: 'Thursday',
-        5: 'Friday',
-        6: 'Saturday',
-        0: 'Sunday'
-    }
-
-    # 根据日期信息添加星期几
+    # 根据日期信息添加星期几 (周一-周六为1-6，周日为0)
     if all(col in df.columns for col in ['YEAR', 'MONTH', 'DAY']):
         try:
-            # 创建日期对象
-            df['DATE'] = pd.to_datetime(df[['YEAR', 'MONTH', 'DAY']])
-
-            # 提取星期几 (Python 默认周一为0，周日为6)
-            python_weekday = df['DATE'].dt.weekday  # 0-6 (周一-周日)
-
-            # 转换为所需的格式 (周一-周六为1-6，周日为0)
-            df['DAY_OF_WEEK'] = (python_weekday + 1) % 7  # 转换为周一=1,...,周六=6,周日=0
+            # 有效的整数日期用整数运算求星期，其余情况交给 pd.to_datetime (无效日期时报错并使用默认值)
+            days = days_since_epoch(df['YEAR'], df['MONTH'], df['DAY'])
+            if days is not None:
+                df['DATE'] = days.astype('datetime64[D]').astype('datetime64[ns]')
+                # 1970-01-01 是星期四
+                day_of_week = ((days + 4) % 7).astype(np.int32)
+            else:
+                df['DATE'] = pd.to_datetime(df[['YEAR', 'MONTH', 'DAY']])
+                day_of_week = ((df['DATE'].dt.weekday + 1) % 7).to_numpy()
+            df['DAY_OF_WEEK'] = day_of_week
 
             # 添加星期几名称
-            df['DAY_NAME'] = df['DAY_OF_WEEK'].map(day_map)
+            df['DAY_NAME'] = lookup(DAY_NAMES, day_of_week)
 
             # 创建周末指示器
-            df['IS_WEEKEND'] = ((df['DAY_OF_WEEK'] == 6) | (df['DAY_OF_WEEK'] == 0)).astype(int)
+            is_weekend = ((day_of_week == 6) | (day_of_week == 0)).astype(int)
+            df['IS_WEEKEND'] = is_weekend
 
             # 创建周期性编码
-            df['DAY_SIN'] = np.sin(2 * np.pi * df['DAY_OF_WEEK'] / 7)
-            df['DAY_COS'] = np.cos(2 * np.pi * df['DAY_OF_WEEK'] / 7)
+            df['DAY_SIN'] = tabulate(lambda d: np.sin(2 * np.pi * d / 7), day_of_week, 7)
+            df['DAY_COS'] = tabulate(lambda d: np.cos(2 * np.pi * d / 7), day_of_week, 7)
 
             # 周末/工作日周期
-            df['WEEKDAY_SIN'] = np.sin(np.pi * df['IS_WEEKEND'])
-            df['WEEKDAY_COS'] = np.cos(np.pi * df['IS_WEEKEND'])
-
-            # 工作周特征 (5天周期，用于工作日)
-            workday_map = {1: 0, 2: 1, 3: 2, 4: 3, 5: 4, 6: np.nan, 0: np.nan}  # 映射到0-4
-            df['WORKWEEK_DAY'] = df['DAY_OF_WEEK'].map(workday_map)
+            df['WEEKDAY_SIN'] = tabulate(lambda w: np.sin(np.pi * w), is_weekend, 2)
+            df['WEEKDAY_COS'] = tabulate(lambda w: np.cos(np.pi * w), is_weekend, 2)
 
-            # 将周末填充为工作日的平均值
-            work_day_mean = 2  # 默认为中间值
-            df['WORKWEEK_DAY'] = df['WORKWEEK_DAY'].fillna(work_day_mean)
+            # 工作周特征 (5天周期，用于工作日)，周末填充为工作日的中间值 2
+            workweek_day = lookup(np.array([2, 0, 1, 2, 3, 4, 2], dtype=float), day_of_week, 2.0)
+            df['WORKWEEK_DAY'] = workweek_day
 
             # 工作周期
-            df['WORKWEEK_SIN'] = np.sin(2 * np.pi * df['WORKWEEK_DAY'] / 5)
-            df['WORKWEEK_COS'] = np.cos(2 * np.pi * df['WORKWEEK_DAY'] / 5)
+            df['WORKWEEK_SIN'] = tabulate(lambda w: np.sin(2 * np.pi * w / 5), workweek_day, 5)
+            df['WORKWEEK_COS'] = tabulate(lambda w: np.cos(2 * np.pi * w / 5), workweek_day, 5)
         except Exception as e:
             #print(f"Error creating date features: {e}")
             # 如果无法创建日期，则添加默认值
@@ -442,28 +406,55 @@ def create_redeye_indicator(df):
         df: 包含SCH_DEP_TIME和SCH_ARR_TIME的DataFrame
 
     Returns:
-        添加了IS_REDEYE列的DataFrame
+        原地添加了IS_REDEYE列的DataFrame
     """
-    # 创建一个副本以避免修改原始数据
-    df = df.copy()
-
-    # 初始化IS_REDEYE为0 (非红眼航班)
-    df['IS_REDEYE'] = 0
-
-    # 根据起飞时间 (0-6 AM) 识别红眼航班
+    # 根据起飞或到达时间 (0-6 AM) 识别红眼航班，时间格式为HHMM (例如, 130 = 1:30 AM)
+    is_redeye = np.zeros(len(df), dtype=bool)
     if 'SCH_DEP_TIME' in df.columns:
-        # 时间格式为HHMM (例如, 130 = 1:30 AM, 545 = 5:45 AM)
-        redeye_departure = (df['SCH_DEP_TIME'] >= 0) & (df['SCH_DEP_TIME'] < 600)
-        df.loc[redeye_departure, 'IS_REDEYE'] = 1
-
-    # 根据到达时间 (0-6 AM) 识别红眼航班
+        dep_time = df['SCH_DEP_TIME'].to_numpy()
+        is_redeye |= (dep_time >= 0) & (dep_time < 600)
     if 'SCH_ARR_TIME' in df.columns:
-        redeye_arrival = (df['SCH_ARR_TIME'] >= 0) & (df['SCH_ARR_TIME'] < 600)
-        df.loc[redeye_arrival, 'IS_REDEYE'] = 1
+        arr_time = df['SCH_ARR_TIME'].to_numpy()
+        is_redeye |= (arr_time >= 0) & (arr_time < 600)
+    df['IS_REDEYE'] = is_redeye.astype(np.int64)
 
     return df
 
 
+def prepare_features(new_data, sparse=False):
+    """
+    对原始航班数据执行特征工程和预处理
+
+    Args:
+        new_data: 输入数据DataFrame
+        sparse: 为 True 时由编译后的预处理器返回稀疏形式 (SparseRows)
+
+    Returns:
+        numpy.ndarray 或 SparseRows: 形状为 (n, 139) 的网络输入
+    """
+    # 确保输入数据包含所有必要特征
+    required_features = [
+        'SCH_DEP_TIME', 'ORIGIN_IATA', 'DEST_IATA', 'DISTANCE', 'PRCP',
+        'MONTH', 'DAY', 'YEAR', 'MKT_AIRLINE', 'EXTREME_WEATHER'
+    ]
+    assert all(feat in new_data.columns for feat in required_features), "Missing required features"
+
+    # 应用相同的特征工程。各特征函数原地添加列，这里只做一次浅拷贝，
+    # 调用方的 DataFrame 不会被修改，也不会复制已有列的数据
+    with STAGE_SECONDS.time('dep_delay_features'):
+        processed_data = create_redeye_indicator(new_data.copy(deep=False))
+        processed_data = create_advanced_time_features(processed_data)
+        processed_data = create_advanced_day_features(processed_data)
+        processed_data = create_airport_features(processed_data)
+        processed_data = create_weather_features(processed_data)
+
+    # 预处理数据
+    with STAGE_SECONDS.time('dep_delay_transform'):
+        if sparse:
+            return load_compiled_preprocessor().transform_sparse(processed_data)
+        return load_preprocessor().transform(processed_data)
+
+
 # 生成预测（包括置信区间）- 使用硬编码的RMSE值
 def predict_delay(new_data, confidence=0.95):
     """
@@ -478,47 +469,40 @@ def predict_delay(new_data, confidence=0.95):
         tuple: (延误概率, 延误时间, 延误时间置信区间下界, 延误时间置信区间上界)
     """
     # 加载预处理和模型
-    year = new_data['YEAR'][0]
+    year = int(new_data['YEAR'].iloc[0])
 
-    preprocessor, classifier, regressor = load_artifacts(year)
+    # 特征工程和预处理
+    X_processed = prepare_features(new_data, sparse=SPARSE_INPUT)
 
-    # 确保输入数据包含所有必要特征
-    required_features = [
-        'SCH_DEP_TIME', 'ORIGIN_IATA', 'DEST_IATA', 'DISTANCE', 'PRCP',
-        'MONTH', 'DAY', 'YEAR', 'MKT_AIRLINE', 'EXTREME_WEATHER'
-    ]
-    assert all(feat in new_data.columns for feat in required_features), "Missing required features"
+    return predict_delay_from_features(year, X_processed, confidence)
 
-    # 应用相同的特征工程
-    processed_data = create_redeye_indicator(new_data)
-    processed_data = create_advanced_time_features(processed_data)
-    processed_data = create_advanced_day_features(processed_data)
-    processed_data = create_airport_features(processed_data)
-    processed_data = create_weather_features(processed_data)
 
-    # 预处理数据
-    X_processed = preprocessor.transform(processed_data)
-    X_tensor = torch.FloatTensor(X_processed)
+def predict_delay_from_features(year, X_processed, confidence=0.95):
+    """
+    对已预处理的网络输入进行预测 (predict_delay 的后半部分，供 fast_path 直接调用)
 
-    # 设置模型为评估模式
-    classifier.eval()
-    regressor.eval()
+    Args:
+        year: 模型年份
+        X_processed: 形状为 (n, 139) 的网络输入，或其稀疏形式 SparseRows
+        confidence: 置信区间水平
 
-    # 进行预测
-    with torch.no_grad():
-        delay_prob = classifier(X_tensor).numpy()  # 延误概率
-        delay_time = regressor(X_tensor).numpy()  # 预测延误分钟数
+    Returns:
+        tuple: (延误概率, 延误时间, 延误时间置信区间下界, 延误时间置信区间上界)
+    """
+    # 进行预测: 延误概率和预测延误分钟数
+    with STAGE_SECONDS.time('dep_delay_forward'):
+        delay_prob, delay_time = run_networks(year, X_processed)
 
     # 获取该年份的RMSE值
     rmse = get_rmse(year)
     #print(f"使用{year}年的RMSE值: {rmse}")
 
     # 计算Z值对应的置信区间
-    z_value = stats.norm.ppf(1 - (1 - confidence) / 2)
+    z = z_value(confidence)
 
     # 计算置信区间
-    ci_lower = delay_time - z_value * rmse
-    ci_upper = delay_time + z_value * rmse
+    ci_lower = delay_time - z * rmse
+    ci_upper = delay_time + z * rmse
 
     # 确保下界不为负
     ci_lower = np.maximum(ci_lower, 0)
@@ -0,0 +1,292 @@
+import os
+
+# 默认关闭预测缓存和预测网格，使 handler 的每次请求都真正运行模型；可在命令行环境中覆盖
+os.environ.setdefault('PREDICTION_CACHE_SIZE', '0')
+os.environ.setdefault('PREDICTION_GRID', '0')
+
+import sys
+import json
+import time
+import asyncio
+import argparse
+import logging
+import platform
+import resource
+import subprocess
+import numpy as np
+import asgi_app
+import prediction_service
+from datetime import datetime, timezone
+from pred_cancelled_prob import (predict_flight_cancellation, predict_cancellation_batch, get_airport_distance,
+                                 get_cancellation_model_path, ENGINE as CANCELLATION_ENGINE)
+from pred_dep_delay import predict_delay, MODEL_FORMAT, SPARSE_INPUT
+from pred_arr_delay import predict_arrival_delay, DEFAULT_MODEL_DIR as ARR_DELAY_MODEL_DIR
+from airport_distance import get_distances
+from synthetic_flights import generate_flights
+from lazy_imports import LazyModule
+
+pd = LazyModule('pandas')
+
+ENTRIES = ['cancellation', 'dep_delay', 'arrival', 'distance', 'handler']
+BATCH_SIZES = [1, 10, 100, 1000, 10000, 100000]
+YEARS = [2021, 2022, 2023, 2024]
+
+CANCELLATION_COLUMNS = ['YEAR', 'WEEK', 'MKT_AIRLINE', 'ORIGIN_IATA', 'DEST_IATA', 'DISTANCE', 'DEP_TIME',
+                        'EXTREME_WEATHER', 'PRCP']
+DEP_DELAY_COLUMNS = ['SCH_DEP_TIME', 'ORIGIN_IATA', 'DEST_IATA', 'DISTANCE', 'PRCP',
+                     'MONTH', 'DAY', 'YEAR', 'MKT_AIRLINE', 'EXTREME_WEATHER']
+
+
+def to_flight_data(row):
+    """Turns one generated flight into the flightData object the frontend sends."""
+    return {
+        "from": row['ORIGIN_IATA'],
+        "to": row['DEST_IATA'],
+        "airline": row['MKT_AIRLINE'],
+        "distance": float(row['DISTANCE']),
+        "depTime": float(row['DEP_TIME']),
+        "week": int(row['WEEK']),
+        "year": int(row['YEAR']),
+        "time": f"{int(row['YEAR'])}-{int(row['MONTH']):02d}-{int(row['DAY']):02d}T12:00:00Z",
+        "extremeWeather": int(row['EXTREME_WEATHER']),
+        "rainfall": float(row['PRCP'])
+    }
+
+
+def _call_asgi(method, path, payload):
+    # 直接驱动 ASGI 应用 (不经过网络)，包含 JSON 解析、路由、推理和响应序列化
+    body = json.dumps(payload).encode()
+    messages = [{'type': 'http.request', 'body': body}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {'type': 'http', 'method': method, 'path': path, 'query_string': b''}
+    asyncio.run(asgi_app.app(scope, receive, send))
+    return sent[0]['status'], json.loads(sent[1]['body'])
+
+
+def _entry_call(entry, year, flights):
+    """
+    Returns a function that runs entry on the flights in [start, start + batch_size),
+    or a string explaining why the entry cannot run for this year.
+    """
+    if entry == 'cancellation':
+        model_path = get_cancellation_model_path(year)
+        if not os.path.exists(model_path):
+            return f"no cancellation model for {year}"
+        data = flights[CANCELLATION_COLUMNS]
+        records = data.to_dict('records')
+
+        def run(start, size):
+            if size == 1:
+                return predict_flight_cancellation(model_path, records[start])
+            return predict_cancellation_batch(model_path, data.iloc[start:start + size].copy(deep=False))
+        return run
+
+    if entry == 'dep_delay':
+        data = flights[DEP_DELAY_COLUMNS]
+        return lambda start, size: predict_delay(data.iloc[start:start + size])
+
+    if entry == 'arrival':
+        data = flights[DEP_DELAY_COLUMNS].assign(WEEK=flights['WEEK'], DEP_DELAY=10.0)
+        result = predict_arrival_delay(ARR_DELAY_MODEL_DIR, data.iloc[:1], year=year)
+        if isinstance(result, dict) and 'error' in result:
+            return result['error']
+        return lambda start, size: predict_arrival_delay(ARR_DELAY_MODEL_DIR, data.iloc[start:start + size], year=year)
+
+    if entry == 'distance':
+        origins, destinations = list(flights['ORIGIN_IATA']), list(flights['DEST_IATA'])
+
+        def run(start, size):
+            if size == 1:
+                return get_airport_distance(origins[start], destinations[start])
+            return get_distances(origins[start:start + size], destinations[start:start + size])
+        return run
+
+    if entry == 'handler':
+        requests = [to_flight_data(row) for row in flights.to_dict('records')]
+
+        def run(start, size):
+            # 单个航班走 /predict-cancellation，多个航班走 /predict-batch
+            if size == 1:
+                status, payload = _call_asgi('POST', '/predict-cancellation', {'flightData': requests[start]})
+            elif size <= prediction_service.MAX_BATCH_SIZE:
+                status, payload = _call_asgi('POST', '/predict-batch', {'flights': requests[start:start + size]})
+            else:
+                raise ValueError(f"batch size above PREDICT_BATCH_MAX ({prediction_service.MAX_BATCH_SIZE})")
+            if status != 200:
+                raise RuntimeError(f"HTTP {status}: {payload}")
+            return payload
+        return run
+
+    raise ValueError(f"Unknown entry point {entry!r}")
+
+
+def _reset_peak_rss():
+    # 写入 5 会把 VmHWM 重置为当前 RSS (Linux)；不支持时峰值从进程启动开始计算
+    try:
+        with open('/proc/self/clear_refs', 'w') as file:
+            file.write('5')
+    except OSError:
+        pass
+
+
+def _peak_rss_bytes():
+    try:
+        with open('/proc/self/status') as file:
+            for line in file:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    # ru_maxrss 在 Linux 上以 KB 为单位，在 macOS 上以字节为单位
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+
+def measure(run, n_rows, batch_size, min_time=1.0, min_repeats=3, max_repeats=200):
+    """
+    Times run(start, batch_size) over consecutive slices of the generated flights after one
+    warm-up call, until min_time seconds have passed (at least min_repeats and at most
+    max_repeats calls).
+
+    Returns:
+    dict: Latency percentiles in ms, rows per second and the peak RSS during the calls
+    """
+    run(0, batch_size)
+    _reset_peak_rss()
+    slices = max(1, n_rows // batch_size)
+    timings = []
+    total_started = time.perf_counter()
+    while len(timings) < max_repeats and (len(timings) < min_repeats or time.perf_counter() - total_started < min_time):
+        start = (len(timings) % slices) * batch_size
+        started = time.perf_counter()
+        run(start, batch_size)
+        timings.append(time.perf_counter() - started)
+
+    timings = np.array(timings) * 1000.0
+    return {
+        "repeats": len(timings),
+        "p50_ms": round(float(np.percentile(timings, 50)), 4),
+        "p90_ms": round(float(np.percentile(timings, 90)), 4),
+        "p99_ms": round(float(np.percentile(timings, 99)), 4),
+        "mean_ms": round(float(timings.mean()), 4),
+        "rows_per_s": round(batch_size * len(timings) / (timings.sum() / 1000.0), 1),
+        "peak_rss_mb": round(_peak_rss_bytes() / 2 ** 20, 1)
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(entries=ENTRIES, batch_sizes=BATCH_SIZES, years=YEARS, seed=0, min_time=1.0):
+    """
+    Benchmarks every entry point on synthetic flights for every batch size and model year.
+    The distance lookup does not depend on the model year and runs once per batch size.
+
+    Returns:
+    dict: Environment description and one result dict per (entry, year, batch_size);
+        cases that cannot run have a "skipped" reason instead of timings
+    """
+    report = {
+        "created": datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "seed": seed,
+        "config": {
+            "CANCELLATION_ENGINE": CANCELLATION_ENGINE,
+            "DEP_DELAY_MODEL_FORMAT": MODEL_FORMAT,
+            "DEP_DELAY_SPARSE_INPUT": SPARSE_INPUT,
+            "FAST_PATH_MAX_FLIGHTS": prediction_service.FAST_PATH_MAX_FLIGHTS,
+            "PREDICTION_CACHE_SIZE": prediction_service.PREDICTION_CACHE_SIZE,
+            "PREDICTION_GRID": os.environ['PREDICTION_GRID'],
+            "MICRO_BATCH_WINDOW_MS": prediction_service.MICRO_BATCH_WINDOW_MS
+        },
+        "results": []
+    }
+    n_rows = max(batch_sizes)
+    for year in years:
+        flights = generate_flights(n_rows, year=year, seed=seed)
+        for entry in entries:
+            if entry == 'distance' and year != years[0]:
+                continue
+            call = _entry_call(entry, year, flights)
+            for batch_size in batch_sizes:
+                case = {"entry": entry, "year": None if entry == 'distance' else year, "batch_size": batch_size}
+                if isinstance(call, str):
+                    case["skipped"] = call
+                else:
+                    try:
+                        case.update(measure(call, n_rows, batch_size, min_time))
+                    except Exception as e:
+                        case["skipped"] = f"{type(e).__name__}: {e}"
+                report["results"].append(case)
+                label = f"{entry:12s} {str(case['year']):>4s} {batch_size:>7d}"
+                if "skipped" in case:
+                    print(f"{label}  skipped: {case['skipped']}", flush=True)
+                else:
+                    print(f"{label}  p50 {case['p50_ms']:10.3f} ms  p99 {case['p99_ms']:10.3f} ms  "
+                          f"{case['rows_per_s']:12.1f} rows/s  {case['peak_rss_mb']:8.1f} MB", flush=True)
+    return report
+
+
+def compare(report, baseline):
+    """
+    Compares the p50 latency of every case with a previous report.
+
+    Returns:
+    list: (case name, baseline p50 ms, current p50 ms, relative change) for cases present in both,
+        sorted from the largest slowdown
+    """
+    key = lambda case: (case['entry'], case['year'], case['batch_size'])
+    previous = {key(case): case for case in baseline['results'] if 'skipped' not in case}
+    changes = []
+    for case in report['results']:
+        if 'skipped' in case or key(case) not in previous:
+            continue
+        before, after = previous[key(case)]['p50_ms'], case['p50_ms']
+        name = f"{case['entry']}/{case['year']}/{case['batch_size']}"
+        changes.append((name, before, after, (after - before) / before if before else 0.0))
+    return sorted(changes, key=lambda change: -change[3])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark every prediction entry point on synthetic flights")
+    parser.add_argument('--entries', nargs='+', choices=ENTRIES, default=ENTRIES)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=BATCH_SIZES)
+    parser.add_argument('--years', type=int, nargs='+', default=YEARS)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--min-time', type=float, default=1.0, help="Seconds to keep repeating each case")
+    parser.add_argument('--output', default='prediction_benchmark.json')
+    parser.add_argument('--baseline', help="Earlier report to compare p50 latencies against")
+    parser.add_argument('--threshold', type=float, default=0.10, help="Relative p50 change reported as a regression")
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    report = run(args.entries, args.batch_sizes, args.years, args.seed, args.min_time)
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent=2)
+    print(f"Report written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            changes = compare(report, json.load(file))
+        regressions = [change for change in changes if change[3] > args.threshold]
+        for name, before, after, change in changes:
+            marker = '  REGRESSION' if change > args.threshold else ''
+            print(f"{name:32s} {before:10.3f} -> {after:10.3f} ms  {change:+7.1%}{marker}")
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,145 @@
+import copy
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+
+class PredictionCache:
+    """
+    Thread-safe LRU cache of prediction responses with a TTL and single-flight
+    deduplication.
+
+    lookup() returns a Future for a key. On a hit it is already resolved. If an
+    identical request is still being computed, the caller shares its Future.
+    Otherwise the caller becomes the leader: its start() callable is invoked
+    once and the result is stored when it completes. Failed computations are
+    not cached, and neither are results rejected by should_cache. The cache
+    keeps its own deep copy of each result and every caller, including the
+    ones coalesced onto a leader, gets a separate copy, so callers may modify
+    what they receive.
+
+    Parameters:
+    max_entries (int): Maximum number of cached responses; least recently used are evicted first
+    ttl_seconds (float): How long a response stays valid
+    should_cache (callable): Optional predicate deciding whether a computed result is stored
+    """
+
+    def __init__(self, max_entries=4096, ttl_seconds=600.0, should_cache=None):
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self.should_cache = should_cache
+        self._entries = OrderedDict()  # key -> (过期时间, 结果)
+        self._in_flight = {}  # key -> 领头请求的 Future
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "coalesced": 0, "evictions": 0, "expirations": 0}
+
+    def _get_locked(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= now:
+            del self._entries[key]
+            self._counters["expirations"] += 1
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _put_locked(self, key, value, now):
+        self._entries[key] = (now + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._counters["evictions"] += 1
+
+    def get(self, key):
+        """Returns the cached response for key, or None (counted as a hit or a miss)."""
+        with self._lock:
+            entry = self._get_locked(key, time.monotonic())
+            self._counters["hits" if entry is not None else "misses"] += 1
+        return copy.deepcopy(entry[1]) if entry is not None else None
+
+    def put(self, key, value):
+        if self.should_cache is not None and not self.should_cache(value):
+            return
+        value = copy.deepcopy(value)
+        with self._lock:
+            self._put_locked(key, value, time.monotonic())
+
+    def lookup(self, key, start):
+        """
+        Returns a Future for the response of key.
+
+        Parameters:
+        key (hashable): Normalized request key
+        start (callable): Returns a Future computing the response; only called on a
+            miss with no identical request in flight
+
+        Returns:
+        Future: Resolves to the response, or to the leader's exception
+        """
+        with self._lock:
+            entry = self._get_locked(key, time.monotonic())
+            if entry is not None:
+                self._counters["hits"] += 1
+                future = Future()
+                future.set_result(copy.deepcopy(entry[1]))
+                return future
+            if key in self._in_flight:
+                self._counters["coalesced"] += 1
+                return self._follow(self._in_flight[key])
+            self._counters["misses"] += 1
+            leader = Future()
+            self._in_flight[key] = leader
+
+        try:
+            source = start()
+        except Exception as e:
+            self._finish(key, leader, None, e)
+            return leader
+        source.add_done_callback(lambda done: self._finish(key, leader, done, done.exception()))
+        return leader
+
+    @staticmethod
+    def _follow(leader):
+        # 合并到领头请求的调用方各自得到结果的副本
+        follower = Future()
+
+        def resolve(done):
+            if done.exception() is None:
+                follower.set_result(copy.deepcopy(done.result()))
+            else:
+                follower.set_exception(done.exception())
+        leader.add_done_callback(resolve)
+        return follower
+
+    def _finish(self, key, leader, done, error):
+        stored = None
+        if error is None and (self.should_cache is None or self.should_cache(done.result())):
+            stored = copy.deepcopy(done.result())
+        with self._lock:
+            self._in_flight.pop(key, None)
+            if stored is not None:
+                self._put_locked(key, stored, time.monotonic())
+        if error is None:
+            leader.set_result(done.result())
+        else:
+            leader.set_exception(error)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """
+        Returns:
+        dict: Hit/miss/coalesced/eviction/expiration counters, hit rate and current size
+        """
+        with self._lock:
+            stats = dict(self._counters)
+            stats.update(entries=len(self._entries), in_flight=len(self._in_flight),
+                         max_entries=self.max_entries, ttl_seconds=self.ttl)
+        lookups = stats["hits"] + stats["misses"] + stats["coalesced"]
+        stats["hit_rate"] = (stats["hits"] + stats["coalesced"]) / lookups if lookups else 0.0
+        return stats
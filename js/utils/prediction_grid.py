@@ -0,0 +1,224 @@
+import os
+import json
+import time
+import logging
+import argparse
+import datetime
+import numpy as np
+from model_registry import MODELS_DIR
+from synthetic_flights import AIRLINES, load_routes
+
+GRID_DIR = os.path.join(MODELS_DIR, 'prediction_grid')
+GRID_YEARS = [2021, 2022, 2023, 2024]
+
+# 构建时每次评分的航线数 (x 航空公司 x 24 小时)
+ROUTE_CHUNK = 64
+
+# 每个网格单元保存的输出
+OUTPUTS = ['cancellation_probability', 'delay_probability', 'predicted_delay_minutes',
+           'delay_ci_lower', 'delay_ci_upper']
+ARRIVAL_OUTPUTS = ['arrival_predicted', 'arrival_probability', 'arrival_minutes',
+                   'arrival_ci_lower', 'arrival_ci_upper', 'arrival_is_weekend',
+                   'arrival_is_late_night', 'arrival_is_morning_rush', 'arrival_is_evening_rush']
+
+
+def _model_files(year):
+    # 网格结果依赖的模型文件，用于判断网格是否过期
+    from pred_cancelled_prob import get_cancellation_model_path
+    from pred_dep_delay import get_network_path
+    from prediction_service import get_model_year
+    model_year = get_model_year(year)
+    arr_dir = os.path.join(MODELS_DIR, 'arr_delay_rf_models', f'year_{model_year}')
+    return [
+        get_cancellation_model_path(model_year),
+        os.path.join(MODELS_DIR, 'dep_delay_nn', 'year_2021', 'resnet_preprocessor_2021.joblib'),
+        get_network_path('classifier', year),
+        get_network_path('regressor', year),
+        os.path.join(arr_dir, f'arr_delay_class_model_{model_year}.joblib'),
+        os.path.join(arr_dir, f'arr_delay_reg_model_{model_year}.joblib')
+    ]
+
+
+def _fingerprint(years):
+    from pred_cancelled_prob import ENGINE
+    from pred_dep_delay import MODEL_FORMAT
+    files = {}
+    for year in years:
+        for path in _model_files(year):
+            stat = os.stat(path) if os.path.exists(path) else None
+            files[os.path.relpath(path, MODELS_DIR)] = [stat.st_size, int(stat.st_mtime)] if stat else None
+    return {"cancellation_engine": ENGINE, "dep_delay_model_format": MODEL_FORMAT, "files": files}
+
+
+def weekday(year, month, day):
+    """Day of week in the models' convention (0=Sunday, ..., 6=Saturday), or None for an invalid date."""
+    try:
+        return (datetime.date(year, month, day).weekday() + 1) % 7
+    except ValueError:
+        return None
+
+
+class PredictionGrid:
+    """
+    Precomputed predictions for every route x airline x departure hour x
+    weekday x year of the top-30 airport network with default weather
+    (no precipitation, no extreme weather), stored as one memory-mapped
+    float32 array of shape (years, routes, airlines, 24, 7, outputs).
+
+    Parameters:
+    directory (str): Directory containing grid.npy and index.json written by build_grid
+    """
+
+    def __init__(self, directory=GRID_DIR):
+        with open(os.path.join(directory, 'index.json')) as file:
+            self.index = json.load(file)
+        self.values = np.load(os.path.join(directory, 'grid.npy'), mmap_mode='r')
+        self.outputs = self.index['outputs']
+        self.arrival_errors = {int(year): error for year, error in self.index['arrival_errors'].items()}
+        self._years = {year: i for i, year in enumerate(self.index['years'])}
+        self._routes = {(origin, dest): (i, distance) for i, (origin, dest, distance) in enumerate(self.index['routes'])}
+        self._airlines = {airline: i for i, airline in enumerate(self.index['airlines'])}
+
+    def is_current(self):
+        """True if the models and the serving formats are the same as when the grid was built."""
+        return self.index['fingerprint'] == _fingerprint(self.index['years'])
+
+    def lookup(self, prediction_data, month, day):
+        """
+        Returns the stored outputs for a normalized flight, or None if the flight is
+        outside the grid (weather, off-hour departure, unknown route/airline/year,
+        or a date whose weekday differs from WEEK).
+
+        Returns:
+        dict: Output name -> value
+        """
+        if prediction_data['PRCP'] != 0 or prediction_data['EXTREME_WEATHER'] != 0:
+            return None
+        dep_time = prediction_data['DEP_TIME']
+        if not (0 <= dep_time < 2400 and dep_time % 100 == 0):
+            return None
+        year = self._years.get(prediction_data['YEAR'])
+        route = self._routes.get((prediction_data['ORIGIN_IATA'], prediction_data['DEST_IATA']))
+        airline = self._airlines.get(prediction_data['MKT_AIRLINE'])
+        if year is None or route is None or airline is None or route[1] != prediction_data['DISTANCE']:
+            return None
+        # 取消模型使用前端的 WEEK，延误模型使用由日期计算的星期，二者一致时才能查表
+        week = prediction_data['WEEK']
+        if week != weekday(prediction_data['YEAR'], month, day):
+            return None
+        return dict(zip(self.outputs, self.values[year, route[0], airline, int(dep_time) // 100, week].tolist()))
+
+
+def load_grid(directory=GRID_DIR):
+    """Returns the PredictionGrid in directory, or None if it has not been built or is out of date."""
+    if not os.path.exists(os.path.join(directory, 'index.json')):
+        return None
+    grid = PredictionGrid(directory)
+    if not grid.is_current():
+        logging.warning(f"Prediction grid in {directory} is out of date; rebuild it with prediction_grid.py")
+        return None
+    return grid
+
+
+def _first_date(year, week):
+    # 该年份五月中第一个星期为 week 的日期，延误模型只使用日期对应的星期
+    for day in range(1, 8):
+        if weekday(year, 5, day) == week:
+            return 5, day
+
+
+def build_grid(years=GRID_YEARS, directory=GRID_DIR):
+    """
+    Scores every grid cell through the live prediction path and writes grid.npy and index.json.
+    Years for which the live path itself fails (e.g. a missing model file) are skipped.
+
+    Returns:
+    str: Path of the grid array
+    """
+    from prediction_service import _predict_year
+
+    routes = []
+    for origin, dest, distance in load_routes():
+        routes.append((origin, dest, distance))
+        routes.append((dest, origin, distance))
+    airlines = list(AIRLINES)
+
+    # 只有存在到达延误模型时才保存到达延误输出
+    from pred_arr_delay import DEFAULT_MODEL_DIR
+    from prediction_service import get_model_year
+    has_arrival = any(os.path.isdir(os.path.join(DEFAULT_MODEL_DIR, f'year_{get_model_year(year)}')) for year in years)
+    outputs = OUTPUTS + (ARRIVAL_OUTPUTS if has_arrival else [])
+
+    # 实时推理本身就会报错的年份 (例如缺少模型文件) 不放入网格，这些请求仍由实时推理返回相同的错误
+    usable_years = []
+    for year in years:
+        month, day = _first_date(year, 0)
+        probe = _predict_year(year, [({"YEAR": year, "WEEK": 0, "MKT_AIRLINE": airlines[0], "ORIGIN_IATA": routes[0][0],
+                                       "DEST_IATA": routes[0][1], "DISTANCE": routes[0][2], "DEP_TIME": 0.0,
+                                       "EXTREME_WEATHER": 0, "PRCP": 0.0}, month, day)])[0]
+        if 'error' in probe or 'delay_error' in probe:
+            logging.warning(f"Skipping {year}: {probe.get('error') or probe['delay_error']}")
+        else:
+            usable_years.append(year)
+    years = usable_years
+
+    os.makedirs(directory, exist_ok=True)
+    grid_path = os.path.join(directory, 'grid.npy')
+    values = np.lib.format.open_memmap(grid_path, mode='w+', dtype=np.float32,
+                                       shape=(len(years), len(routes), len(airlines), 24, 7, len(outputs)))
+    arrival_errors = {}
+
+    for y, year in enumerate(years):
+        for week in range(7):
+            started = time.perf_counter()
+            month, day = _first_date(year, week)
+            for start in range(0, len(routes), ROUTE_CHUNK):
+                chunk = routes[start:start + ROUTE_CHUNK]
+                flights = [({"YEAR": year, "WEEK": week, "MKT_AIRLINE": airline, "ORIGIN_IATA": origin,
+                             "DEST_IATA": dest, "DISTANCE": distance, "DEP_TIME": float(hour * 100),
+                             "EXTREME_WEATHER": 0, "PRCP": 0.0}, month, day)
+                            for origin, dest, distance in chunk for airline in airlines for hour in range(24)]
+                results = _predict_year(year, flights)
+
+                block = np.full((len(flights), len(outputs)), np.nan, dtype=np.float32)
+                for i, result in enumerate(results):
+                    if 'error' in result or 'delay_error' in result:
+                        raise RuntimeError(f"Cannot build the grid for {year}: {result.get('error') or result['delay_error']}")
+                    ci = result['delay_confidence_interval']
+                    block[i, :5] = (result['cancellation_probability'], result['delay_probability'],
+                                    result['predicted_delay_minutes'], ci['lower'], ci['upper'])
+                    if has_arrival and 'arrival_delay' in result:
+                        arrival = result['arrival_delay']
+                        block[i, 5:] = (arrival['predicted'], arrival['probability'], arrival['minutes'],
+                                        arrival['confidence_interval']['lower'], arrival['confidence_interval']['upper'],
+                                        arrival['is_weekend'], arrival['is_late_night_arrival'],
+                                        arrival['is_morning_rush'], arrival['is_evening_rush'])
+                if 'arrival_delay_error' in results[0]:
+                    arrival_errors[year] = results[0]['arrival_delay_error']
+
+                values[y, start:start + len(chunk), :, :, week] = block.reshape(len(chunk), len(airlines), 24, len(outputs))
+            logging.info(f"{year} week {week}: {len(routes) * len(airlines) * 24} cells in {time.perf_counter() - started:.1f}s")
+
+    values.flush()
+    index = {
+        "years": list(years),
+        "routes": [list(route) for route in routes],
+        "airlines": airlines,
+        "outputs": outputs,
+        "arrival_errors": arrival_errors,
+        "fingerprint": _fingerprint(years)
+    }
+    with open(os.path.join(directory, 'index.json'), 'w') as file:
+        json.dump(index, file)
+    return grid_path
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Precompute predictions for the top-30 airport network with default weather")
+    parser.add_argument('--years', type=int, nargs='+', default=GRID_YEARS)
+    parser.add_argument('--output', default=GRID_DIR)
+    args = parser.parse_args()
+
+    path = build_grid(args.years, args.output)
+    print(f"Prediction grid written to {path} ({os.path.getsize(path) / 1e6:.0f} MB)")
@@ -0,0 +1,464 @@
+import os
+import math
+import logging
+from datetime import datetime
+from concurrent.futures import Future
+from lazy_imports import LazyModule
+from pred_cancelled_prob import predict_cancellation_batch, get_airport_distance, get_cancellation_model_path
+from pred_dep_delay import predict_delay, predict_delay_from_features, SPARSE_INPUT
+from pred_arr_delay import predict_arrival_delay, DEFAULT_MODEL_DIR as ARR_DELAY_MODEL_DIR
+from airport_distance import get_distances
+from micro_batcher import MicroBatcher
+from prediction_cache import PredictionCache
+from prediction_grid import load_grid
+from fast_path import cancellation_features, predict_cancellation_rows, dep_delay_vectors, arrival_features
+from metrics import STAGE_SECONDS, PREDICTIONS, ERRORS, register_collector
+
+pd = LazyModule('pandas')
+
+# 可用模型年份列表
+AVAILABLE_YEARS = [2021, 2022, 2023, 2024]
+
+# /predict-batch 单次请求允许的最大航班数
+MAX_BATCH_SIZE = int(os.environ.get('PREDICT_BATCH_MAX', 10000))
+
+# 航班数不超过该值时跳过 pandas，直接由 fast_path 构建模型输入；0 表示关闭
+FAST_PATH_MAX_FLIGHTS = int(os.environ.get('FAST_PATH_MAX_FLIGHTS', 8))
+
+
+def get_model_year(year):
+    """Returns year if a model was trained on it, otherwise the closest available model year."""
+    if year in AVAILABLE_YEARS:
+        return year
+    model_year = min(AVAILABLE_YEARS, key=lambda x: abs(x - year))
+    logging.debug(f"No model for year {year}, using closest available model from {model_year}")
+    return model_year
+
+
+def _number(flight_data, key, default):
+    # 缺失或 null 时使用默认值；无法转换为数字时抛出 ValueError，由调用方按单个航班处理
+    value = flight_data.get(key)
+    if value is None:
+        return default
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        number = float('nan')
+    if not math.isfinite(number):
+        raise ValueError(f"'{key}' must be a number, got {value!r}")
+    return number
+
+
+def _code(flight_data, key):
+    # 机场和航空公司代码必须是字符串 (缺失或 null 时为空字符串)
+    value = flight_data.get(key)
+    if value is None:
+        return ''
+    if not isinstance(value, str):
+        raise ValueError(f"'{key}' must be a string, got {value!r}")
+    return value
+
+
+def normalize_flight(flight_data, resolved_distance=None):
+    """
+    Turns one frontend flightData object into the model input.
+
+    Parameters:
+    flight_data (dict): Keys from the frontend (from, to, airline, flightNumber, distance,
+        depTime, week, year, time, extremeWeather, rainfall)
+    resolved_distance (float): Distance to use when flight_data has none, if already looked up
+
+    Returns:
+    tuple: (prediction_data, month, day), where prediction_data holds the cancellation model
+        columns and month/day come from the time field (1/1 if it is missing)
+
+    Raises:
+    ValueError: If a numeric field cannot be converted or a code is not a string. Checking
+        this per flight keeps one bad flight from failing the whole year group in _predict_year
+    """
+    # 首先尝试使用前端传递的距离值，如果为0或不存在，则通过函数计算
+    distance = _number(flight_data, 'distance', 0.0)
+    if distance == 0:
+        distance = resolved_distance if resolved_distance is not None else \
+            get_airport_distance(flight_data.get('from', ''), flight_data.get('to', ''))
+
+    # 如果航空公司代码为空但是航班号不为空，从航班号中提取航空公司代码
+    airline_code = _code(flight_data, 'airline')
+    if not airline_code and _code(flight_data, 'flightNumber'):
+        airline_code = _code(flight_data, 'flightNumber')[:2]  # 通常航空公司代码是航班号的前两个字符
+    # 如果还是空，使用默认值
+    if not airline_code:
+        airline_code = "DL"  # 使用Delta航空作为默认值
+
+    # 如果年份超过2024，使用2024作为默认值
+    year = min(int(_number(flight_data, 'year', 2024)), 2024)
+
+    # 从time字段提取月和日，如果有的话
+    month, day = 1, 1
+    if flight_data.get('time'):
+        try:
+            dt = datetime.fromisoformat(flight_data.get('time').replace('Z', '+00:00'))
+            month, day = dt.month, dt.day
+        except Exception as e:
+            logging.warning(f"无法从时间字符串解析月/日: {e}")
+
+    prediction_data = {
+        "YEAR": year,
+        "WEEK": int(_number(flight_data, 'week', 1)),
+        "MKT_AIRLINE": airline_code,
+        "ORIGIN_IATA": _code(flight_data, 'from'),
+        "DEST_IATA": _code(flight_data, 'to'),
+        "DISTANCE": distance,
+        "DEP_TIME": _number(flight_data, 'depTime', 0.0),
+        "EXTREME_WEATHER": int(_number(flight_data, 'extremeWeather', 0)),
+        "PRCP": _number(flight_data, 'rainfall', 0.0)
+    }
+    return prediction_data, month, day
+
+
+def _delay_frame(year, flights):
+    # predict_delay 的输入 DataFrame
+    inputs = [prediction_data for prediction_data, _, _ in flights]
+    return pd.DataFrame({
+        'SCH_DEP_TIME': [p['DEP_TIME'] for p in inputs],
+        'ORIGIN_IATA': [p['ORIGIN_IATA'] for p in inputs],
+        'DEST_IATA': [p['DEST_IATA'] for p in inputs],
+        'DISTANCE': [p['DISTANCE'] for p in inputs],
+        'PRCP': [p['PRCP'] for p in inputs],
+        'MONTH': [month for _, month, _ in flights],
+        'DAY': [day for _, _, day in flights],
+        'YEAR': year,
+        'MKT_AIRLINE': [p['MKT_AIRLINE'] for p in inputs],
+        'EXTREME_WEATHER': [p['EXTREME_WEATHER'] for p in inputs]
+    })
+
+
+def _predict_year(year, flights):
+    """
+    Scores flights that share the same (capped) year, running each model once over all of them.
+    Up to FAST_PATH_MAX_FLIGHTS flights skip pandas and go straight to the model inputs
+    (fast_path); a stage falls back to the DataFrame path when a flight is outside what
+    the fast path reproduces exactly.
+
+    Parameters:
+    year (int): Flight year of every row
+    flights (list): (prediction_data, month, day) tuples from normalize_flight
+
+    Returns:
+    list: One response dict per flight, in input order
+    """
+    model_year = get_model_year(year)
+    inputs = [prediction_data for prediction_data, _, _ in flights]
+    fast = len(flights) <= FAST_PATH_MAX_FLIGHTS
+
+    # 取消概率预测
+    with STAGE_SECONDS.time('cancellation'):
+        if fast:
+            cancellation = predict_cancellation_rows(get_cancellation_model_path(model_year),
+                                                     [cancellation_features(p) for p in inputs])
+        else:
+            cancellation = predict_cancellation_batch(get_cancellation_model_path(model_year), pd.DataFrame(inputs))
+    if isinstance(cancellation, dict):
+        ERRORS.inc('cancellation')
+        results = [dict(cancellation) for _ in flights]
+    else:
+        results = cancellation
+
+    for result, prediction_data in zip(results, inputs):
+        # 将模型输入数据包含在响应中
+        result['model_input'] = dict(prediction_data)
+        result['model_input']['IS_REDEYE'] = int(0 <= prediction_data['DEP_TIME'] < 600)
+
+    # 延误预测
+    delay_data = None
+    try:
+        with STAGE_SECONDS.time('dep_delay'):
+            X_processed = dep_delay_vectors(flights, sparse=SPARSE_INPUT) if fast else None
+            if X_processed is not None:
+                delay_probs, delay_times, ci_lower, ci_upper = predict_delay_from_features(year, X_processed)
+            else:
+                delay_data = _delay_frame(year, flights)
+                delay_probs, delay_times, ci_lower, ci_upper = predict_delay(delay_data)
+    except Exception as e:
+        logging.error(f"延误预测错误: {e}")
+        ERRORS.inc('dep_delay')
+        for result in results:
+            result['delay_error'] = str(e)
+        return results
+
+    for i, result in enumerate(results):
+        result['delay_probability'] = float(delay_probs[i][0])
+        result['predicted_delay_minutes'] = float(delay_times[i][0])
+        result['delay_confidence_interval'] = {
+            'lower': float(ci_lower[i][0]),
+            'upper': float(ci_upper[i][0])
+        }
+
+    # 到达延迟预测，使用预测的出发延迟作为输入
+    with STAGE_SECONDS.time('arrival'):
+        arr_delay_input = [arrival_features(p, float(delay_times[i, 0])) for i, p in enumerate(inputs)] if fast else [None]
+        if None in arr_delay_input:
+            if delay_data is None:
+                delay_data = _delay_frame(year, flights)
+            arr_delay_input = delay_data.assign(
+                WEEK=[p['WEEK'] for p in inputs],
+                DEP_DELAY=delay_times[:, 0].astype(float)
+            )
+        try:
+            arr_delay_results = predict_arrival_delay(ARR_DELAY_MODEL_DIR, arr_delay_input, year=model_year)
+        except Exception as e:
+            logging.error(f"到达延迟预测错误: {e}")
+            arr_delay_results = {"error": str(e)}
+
+    if isinstance(arr_delay_results, dict) and "error" in arr_delay_results:
+        logging.warning(f"到达延迟预测错误: {arr_delay_results['error']}")
+        ERRORS.inc('arrival')
+        for result in results:
+            result['arrival_delay_error'] = arr_delay_results['error']
+        return results
+
+    # 单行输入时 predict_arrival_delay 返回一个字典而不是列表
+    if isinstance(arr_delay_results, dict):
+        arr_delay_results = [arr_delay_results]
+    for result, arr_delay_result in zip(results, arr_delay_results):
+        result['arrival_delay'] = {
+            'predicted': arr_delay_result['delay_predicted'],
+            'probability': float(arr_delay_result['delay_probability']),
+            'minutes': float(arr_delay_result['delay_minutes']),
+            'confidence_interval': {
+                'lower': float(arr_delay_result['delay_lower_bound']),
+                'upper': float(arr_delay_result['delay_upper_bound'])
+            },
+            'is_weekend': arr_delay_result['is_weekend'],
+            'is_late_night_arrival': arr_delay_result['is_late_night_arrival'],
+            'is_morning_rush': arr_delay_result['is_morning_rush'],
+            'is_evening_rush': arr_delay_result['is_evening_rush']
+        }
+    return results
+
+
+def _predict_normalized(flights):
+    # 按年份分组，每组内每个模型只运行一次；结果按输入顺序返回
+    results = [None] * len(flights)
+    groups = {}
+    for i, flight in enumerate(flights):
+        groups.setdefault(flight[0]['YEAR'], []).append(i)
+
+    PREDICTIONS.inc('model', amount=len(flights))
+    for year, indices in groups.items():
+        for i, result in zip(indices, _predict_year(year, [flights[i] for i in indices])):
+            results[i] = result
+    return results
+
+
+# 设置 MICRO_BATCH_WINDOW_MS > 0 时，并发的单航班请求先在微批处理器中合并，再一起运行模型
+MICRO_BATCH_WINDOW_MS = float(os.environ.get('MICRO_BATCH_WINDOW_MS', 0))
+MICRO_BATCH_MAX = int(os.environ.get('MICRO_BATCH_MAX', 64))
+
+batcher = MicroBatcher(_predict_normalized, MICRO_BATCH_WINDOW_MS, MICRO_BATCH_MAX) if MICRO_BATCH_WINDOW_MS > 0 else None
+
+
+# 响应中可能出现的三个阶段的错误字段
+ERROR_FIELDS = ('error', 'delay_error', 'arrival_delay_error')
+# 模型文件不存在的错误 (joblib/torch/numpy 打开文件失败，或 predict_arrival_delay 找不到该年份的模型)
+_MISSING_MODEL_MESSAGES = ('No such file or directory', 'not found in')
+
+
+def _is_cacheable(result):
+    # 缺少模型文件在进程运行期间不会自行恢复 (部署新模型后由 TTL 过期)，与正常结果一样缓存；
+    # 其他加载或推理失败可能是暂时的，任一阶段出现这类错误时整个响应都不缓存
+    return all(any(message in result[field] for message in _MISSING_MODEL_MESSAGES)
+               for field in ERROR_FIELDS if field in result)
+
+
+# 预测响应缓存，PREDICTION_CACHE_SIZE=0 时关闭
+PREDICTION_CACHE_SIZE = int(os.environ.get('PREDICTION_CACHE_SIZE', 4096))
+PREDICTION_CACHE_TTL = float(os.environ.get('PREDICTION_CACHE_TTL', 600))
+
+cache = PredictionCache(PREDICTION_CACHE_SIZE, PREDICTION_CACHE_TTL, should_cache=_is_cacheable) \
+    if PREDICTION_CACHE_SIZE > 0 else None
+
+
+@register_collector
+def _collect():
+    # /metrics: 预测缓存和微批处理器已有的计数，抓取时读取
+    collected = []
+    if cache is not None:
+        stats = cache.stats()
+        collected += [
+            ('prediction_cache_lookups_total', 'counter', 'Prediction cache lookups by result',
+             [({'result': 'hit'}, stats['hits']), ({'result': 'miss'}, stats['misses']),
+              ({'result': 'coalesced'}, stats['coalesced'])]),
+            ('prediction_cache_removals_total', 'counter', 'Prediction cache entries dropped, by reason',
+             [({'reason': 'evicted'}, stats['evictions']), ({'reason': 'expired'}, stats['expirations'])]),
+            ('prediction_cache_entries', 'gauge', 'Responses currently in the prediction cache',
+             [({}, stats['entries'])])
+        ]
+    if batcher is not None:
+        stats = batcher.stats()
+        collected += [
+            ('micro_batch_batches_total', 'counter', 'Batches run by the micro-batcher', [({}, stats['batches'])]),
+            ('micro_batch_items_total', 'counter', 'Flights scored by the micro-batcher', [({}, stats['items'])]),
+            ('micro_batch_failed_batches_total', 'counter', 'Micro-batches whose model call raised',
+             [({}, stats['failed_batches'])]),
+            ('micro_batch_queued', 'gauge', 'Flights waiting for the next micro-batch', [({}, stats['queued'])])
+        ]
+    return collected
+
+
+def cache_key(flight):
+    """Cache key of a normalized flight: every model input after defaulting and distance resolution."""
+    prediction_data, month, day = flight
+    return (prediction_data['YEAR'], prediction_data['WEEK'], prediction_data['MKT_AIRLINE'],
+            prediction_data['ORIGIN_IATA'], prediction_data['DEST_IATA'], float(prediction_data['DISTANCE']),
+            prediction_data['DEP_TIME'], prediction_data['EXTREME_WEATHER'], prediction_data['PRCP'], month, day)
+
+
+# 预计算的预测网格 (prediction_grid.py 构建)，默认天气且整点起飞的常见航线直接查表；PREDICTION_GRID=0 时关闭
+grid = load_grid() if os.environ.get('PREDICTION_GRID', '1') != '0' else None
+
+
+def _from_grid(flight):
+    # 从预测网格组装与实时推理相同结构的响应；不在网格内时返回 None
+    prediction_data, month, day = flight
+    values = grid.lookup(prediction_data, month, day)
+    if values is None:
+        return None
+    dep_time = prediction_data['DEP_TIME']
+    result = {
+        "cancellation_probability": values['cancellation_probability'],
+        "is_redeye": bool(0 <= dep_time < 600),
+        "is_weekend": prediction_data['WEEK'] in (0, 6),
+        "is_morning_peak": bool(700 <= dep_time < 1000),
+        "is_evening_peak": bool(1600 <= dep_time < 1900),
+        "model_input": dict(prediction_data, IS_REDEYE=int(0 <= dep_time < 600)),
+        "delay_probability": values['delay_probability'],
+        "predicted_delay_minutes": values['predicted_delay_minutes'],
+        "delay_confidence_interval": {
+            'lower': values['delay_ci_lower'],
+            'upper': values['delay_ci_upper']
+        }
+    }
+    if prediction_data['YEAR'] in grid.arrival_errors:
+        result['arrival_delay_error'] = grid.arrival_errors[prediction_data['YEAR']]
+    elif 'arrival_probability' in values:
+        result['arrival_delay'] = {
+            'predicted': bool(values['arrival_predicted']),
+            'probability': values['arrival_probability'],
+            'minutes': values['arrival_minutes'],
+            'confidence_interval': {
+                'lower': values['arrival_ci_lower'],
+                'upper': values['arrival_ci_upper']
+            },
+            'is_weekend': bool(values['arrival_is_weekend']),
+            'is_late_night_arrival': bool(values['arrival_is_late_night']),
+            'is_morning_rush': bool(values['arrival_is_morning_rush']),
+            'is_evening_rush': bool(values['arrival_is_evening_rush'])
+        }
+    else:
+        return None
+    return result
+
+
+def _score(flight):
+    # 返回单个航班结果的 Future: 启用微批处理时交给批处理器，否则在当前线程中计算
+    if batcher is not None:
+        return batcher.submit(flight)
+    future = Future()
+    try:
+        future.set_result(_predict_normalized([flight])[0])
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+
+def _submit(flight):
+    if grid is not None:
+        result = _from_grid(flight)
+        if result is not None:
+            PREDICTIONS.inc('grid')
+            future = Future()
+            future.set_result(result)
+            return future
+    if cache is None:
+        return _score(flight)
+    return cache.lookup(cache_key(flight), lambda: _score(flight))
+
+
+def predict_single(flight_data):
+    """
+    Cancellation, departure delay and arrival delay prediction for one frontend flightData object.
+    Repeated inputs are answered from the prediction cache, and identical concurrent requests
+    are computed once. With micro-batching enabled, the flight is scored together with other
+    concurrent requests.
+
+    Returns:
+    dict: The /predict-cancellation response
+
+    Raises:
+    ValueError: If the flight data cannot be parsed
+    """
+    flight = normalize_flight(flight_data)
+    logging.debug(f"预测输入数据: {flight[0]}")
+    return _submit(flight).result()
+
+
+def submit_single(flight_data):
+    """
+    Non-blocking predict_single for callers with their own event loop: queues the
+    flight on the micro-batcher and returns a Future for the response dict.
+
+    Raises:
+    RuntimeError: If micro-batching is disabled
+    ValueError: If the flight data cannot be parsed
+    """
+    if batcher is None:
+        raise RuntimeError("Micro-batching is disabled (MICRO_BATCH_WINDOW_MS=0)")
+    return _submit(normalize_flight(flight_data))
+
+
+def predict_batch(flights):
+    """
+    Scores many frontend flightData objects. Flights found in the prediction grid
+    or the prediction cache are answered from them; the rest are grouped by year and every model runs once
+    per group over the whole group.
+
+    Parameters:
+    flights (list): flightData dicts
+
+    Returns:
+    list: One response dict per flight, in input order. A flight that cannot be
+        parsed gets {"error": ...} without failing the rest of the batch
+    """
+    results = [None] * len(flights)
+    # 一次性批量查找所有航班的机场距离；非字符串的机场代码在这里按空字符串查找，
+    # 随后由 normalize_flight 作为该航班的错误返回
+    def code(flight_data, key):
+        value = flight_data.get(key, '') if isinstance(flight_data, dict) else ''
+        return value if isinstance(value, str) else ''
+
+    distances = get_distances([code(f, 'from') for f in flights], [code(f, 'to') for f in flights])
+    pending, parsed = [], []
+    for i, flight_data in enumerate(flights):
+        try:
+            flight = normalize_flight(flight_data, float(distances[i]))
+        except Exception as e:
+            results[i] = {"error": f"Invalid flight data: {str(e)}"}
+            continue
+        if grid is not None:
+            results[i] = _from_grid(flight)
+            if results[i] is not None:
+                PREDICTIONS.inc('grid')
+                continue
+        if cache is not None:
+            results[i] = cache.get(cache_key(flight))
+            if results[i] is not None:
+                continue
+        pending.append(i)
+        parsed.append(flight)
+
+    for i, flight, result in zip(pending, parsed, _predict_normalized(parsed)):
+        results[i] = result
+        if cache is not None:
+            cache.put(cache_key(flight), result)
+    return results
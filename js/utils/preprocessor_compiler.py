@@ -0,0 +1,189 @@
+from collections import namedtuple
+import numpy as np
+from lazy_imports import LazyModule
+
+pd = LazyModule('pandas')
+
+# 预处理结果的稀疏形式: numeric 为标准化后的数值列 (n, n_numeric)，位于输出的第 numeric_offset 列起;
+# active 为每个分类列取值为 1 的输出列号 (n, n_categorical)，未知类别为 n_features
+SparseRows = namedtuple('SparseRows', ['numeric', 'active', 'numeric_offset', 'n_features'])
+
+
+def to_dense(rows, dtype=np.float32):
+    """Expands SparseRows into the (n, n_features) array that CompiledPreprocessor.transform returns."""
+    n = len(rows.numeric)
+    # 多出的一列接收未知类别，最后去掉
+    out = np.zeros((n, rows.n_features + 1), dtype=dtype)
+    out[:, rows.numeric_offset:rows.numeric_offset + rows.numeric.shape[1]] = rows.numeric
+    out[np.arange(n)[:, None], rows.active] = 1
+    return out[:, :rows.n_features]
+
+
+def to_csr(rows):
+    """
+    The one-hot part of SparseRows as a scipy CSR matrix of shape (n, n_features + 1),
+    one stored 1 per categorical feature (the extra last column collects unknown categories).
+    """
+    from scipy.sparse import csr_matrix
+    n, k = rows.active.shape
+    return csr_matrix((np.ones(n * k, dtype=np.float32), rows.active.ravel(), np.arange(0, n * k + 1, k)),
+                      shape=(n, rows.n_features + 1))
+
+
+class CompiledPreprocessor:
+    """
+    A fitted sklearn ColumnTransformer compiled into plain lookup tables and
+    scale vectors, so it can be applied with NumPy only.
+
+    Supports the layout used by the models in this repo: numeric columns
+    through SimpleImputer + StandardScaler, categorical columns through
+    SimpleImputer(strategy='constant') + OneHotEncoder(handle_unknown='ignore'),
+    with the remainder dropped. Output columns are in the same order as
+    ColumnTransformer.transform.
+
+    Parameters:
+    column_transformer (ColumnTransformer): The fitted transformer
+
+    Raises:
+    ValueError: If the transformer uses steps that cannot be compiled
+    """
+
+    def __init__(self, column_transformer):
+        if column_transformer.remainder != 'drop':
+            raise ValueError("Only remainder='drop' can be compiled")
+
+        self.numeric_columns = []
+        self.numeric_offset = None
+        self.categorical_columns = []
+        self.categorical_offsets = []
+        self.categorical_fills = []
+        self.category_index = []  # 每列: {类别值: 在该列 one-hot 块中的位置}
+        self.category_lookup = []  # 同样的映射，用于批量查找的 pandas Index
+        offset = 0
+
+        for name, transformer, columns in column_transformer.transformers_:
+            if transformer == 'drop' or len(columns) == 0:
+                continue
+            steps = dict(transformer.steps) if hasattr(transformer, 'steps') else {name: transformer}
+            kinds = {type(step).__name__: step for step in steps.values()}
+
+            if 'OneHotEncoder' in kinds:
+                encoder = kinds['OneHotEncoder']
+                if encoder.handle_unknown != 'ignore' or encoder.drop_idx_ is not None:
+                    raise ValueError("Only OneHotEncoder(handle_unknown='ignore', drop=None) can be compiled")
+                imputer = kinds.get('SimpleImputer')
+                for j, (column, categories) in enumerate(zip(columns, encoder.categories_)):
+                    self.categorical_columns.append(column)
+                    self.categorical_offsets.append(offset)
+                    self.categorical_fills.append(imputer.statistics_[j] if imputer is not None else None)
+                    self.category_index.append({value: i for i, value in enumerate(categories)})
+                    self.category_lookup.append(pd.Index(categories, dtype=object))
+                    offset += len(categories)
+            elif set(kinds) <= {'SimpleImputer', 'StandardScaler'}:
+                if self.numeric_offset is not None:
+                    raise ValueError("Only one numeric transformer can be compiled")
+                imputer = kinds.get('SimpleImputer')
+                scaler = kinds.get('StandardScaler')
+                n = len(columns)
+                self.numeric_columns = list(columns)
+                self.numeric_offset = offset
+                self.numeric_fill = imputer.statistics_.astype(np.float64) if imputer is not None else np.zeros(n)
+                self.numeric_mean = scaler.mean_ if scaler is not None and scaler.with_mean else np.zeros(n)
+                self.numeric_scale = scaler.scale_ if scaler is not None and scaler.with_std else np.ones(n)
+                offset += n
+            else:
+                raise ValueError(f"Cannot compile transformer '{name}' with steps {list(kinds)}")
+
+        self.n_features = offset
+
+    def _columns(self, data):
+        # 返回 (行数, 按列名取一维数组的函数)
+        if isinstance(data, pd.DataFrame):
+            # 分类列保留为 Categorical，category_positions 直接按编码查找
+            return len(data), lambda column: (data[column].array if isinstance(data[column].dtype, pd.CategoricalDtype)
+                                              else data[column].to_numpy())
+        first = data[self.categorical_columns[0] if self.categorical_columns else self.numeric_columns[0]]
+        return (len(first) if np.ndim(first) else 1), lambda column: np.atleast_1d(data[column])
+
+    def _numeric(self, n, get):
+        # 填充缺失值并标准化后的数值列 (n, n_numeric)，float64
+        numeric = np.empty((n, len(self.numeric_columns)), dtype=np.float64)
+        for j, column in enumerate(self.numeric_columns):
+            numeric[:, j] = get(column)
+        missing = np.isnan(numeric)
+        if missing.any():
+            numeric[missing] = np.broadcast_to(self.numeric_fill, numeric.shape)[missing]
+        return (numeric - self.numeric_mean) / self.numeric_scale
+
+    def transform(self, data, dtype=np.float64):
+        """
+        Applies the compiled preprocessing.
+
+        Parameters:
+        data (DataFrame or dict): Columns by name; dict values may be scalars (one row) or arrays
+        dtype: Output dtype
+
+        Returns:
+        ndarray: Array of shape (n, n_features)
+        """
+        n, get = self._columns(data)
+        out = np.zeros((n, self.n_features), dtype=dtype)
+
+        if self.numeric_columns:
+            start = self.numeric_offset
+            out[:, start:start + len(self.numeric_columns)] = self._numeric(n, get)
+
+        rows = np.arange(n)
+        for j, column in enumerate(self.categorical_columns):
+            positions = self.category_positions(j, get(column))
+            known = positions >= 0
+            out[rows[known], self.categorical_offsets[j] + positions[known]] = 1
+        return out
+
+    def transform_sparse(self, data, dtype=np.float32):
+        """
+        Same as transform, but returns the one-hot part as the index of its active
+        column per categorical feature instead of materializing the zeros.
+
+        Parameters:
+        data (DataFrame or dict): Columns by name, as for transform
+        dtype: Dtype of the numeric block
+
+        Returns:
+        SparseRows: numeric (n, n_numeric) and active (n, n_categorical) int64 output
+            column indices, n_features for unknown categories
+        """
+        n, get = self._columns(data)
+        numeric = self._numeric(n, get).astype(dtype, copy=False) if self.numeric_columns else np.zeros((n, 0), dtype)
+        active = np.empty((n, len(self.categorical_columns)), dtype=np.int64)
+        for j, column in enumerate(self.categorical_columns):
+            positions = self.category_positions(j, get(column))
+            active[:, j] = np.where(positions >= 0, self.categorical_offsets[j] + positions, self.n_features)
+        return SparseRows(numeric, active, self.numeric_offset or 0, self.n_features)
+
+    def category_positions(self, j, values):
+        """
+        Position of each value inside the one-hot block of categorical column j,
+        or -1 for unknown categories. Missing values are imputed first.
+        """
+        fill = self.categorical_fills[j]
+        if isinstance(values, pd.Categorical):
+            # 每个类别只查一次，再按编码取值；编码 -1 (缺失) 对应末尾的填充值
+            lookup = self.category_lookup[j].get_indexer(values.categories.append(pd.Index([fill], dtype=object)))
+            return lookup[values.codes]
+        if len(values) <= 8:
+            # 少量数据时直接查字典，避免 pandas 的固定开销
+            index = self.category_index[j]
+            return np.array([index.get(fill if _is_missing(value) else value, -1) for value in values],
+                            dtype=np.int64)
+
+        values = np.asarray(values, dtype=object)
+        missing = pd.isna(values)
+        if missing.any():
+            values = values.copy()
+            values[missing] = fill
+        return self.category_lookup[j].get_indexer(values)
+
+
+def _is_missing(value):
+    return value is None or value is pd.NA or (isinstance(value, (float, np.floating)) and value != value)
@@ -0,0 +1,92 @@
+import gc
+import os
+import logging
+from metrics import register_collector
+
+# 模型加载模式: 'default' 常规加载; 'mmap' 将模型中的 numpy 数组和权重张量以只读方式映射到内存，
+# 多个 worker 进程可共享同一份物理页面
+LOAD_MODE = os.environ.get('MODEL_LOAD_MODE', 'default')
+
+
+def load_joblib(path):
+    """
+    Loads a joblib artifact, memory-mapping its numpy arrays read-only in 'mmap' mode.
+
+    Note: sklearn trees copy their node arrays into their own buffers when
+    unpickled, so forests are shared between workers through preload-before-fork
+    (copy-on-write) rather than through the file mapping.
+    """
+    import joblib
+
+    if LOAD_MODE == 'mmap':
+        return joblib.load(path, mmap_mode='r')
+    return joblib.load(path)
+
+
+def load_torch_state_dict(path):
+    """Loads a torch state dict, backing its tensors with a read-only file mapping in 'mmap' mode."""
+    import torch
+
+    if LOAD_MODE == 'mmap':
+        return torch.load(path, mmap=True, weights_only=True)
+    return torch.load(path)
+
+
+def preload(years=None):
+    """
+    Loads and warms up every model in the current process before worker
+    processes are forked (e.g. gunicorn --preload), then freezes the garbage
+    collector so that collections in the workers do not touch, and therefore
+    copy, the shared model objects.
+
+    Parameters:
+    years (list): Model years to preload (default: warmup.WARMUP_YEARS)
+    """
+    import warmup
+
+    warmup.warm_up(years)
+    gc.collect()
+    gc.freeze()
+    logging.info(f"Preloaded models in {LOAD_MODE} mode; {gc.get_freeze_count()} objects frozen")
+
+
+def memory_report():
+    """
+    Reports how much of this process's resident memory is shared with other
+    processes and how much is private, read from /proc/self/smaps_rollup (Linux only).
+
+    Returns:
+    dict: Containing (in bytes):
+        - rss: Resident set size
+        - pss: Proportional set size (shared pages divided among the processes using them)
+        - shared: Shared clean + shared dirty pages
+        - private: Private clean + private dirty pages
+    """
+    fields = {}
+    try:
+        with open('/proc/self/smaps_rollup') as file:
+            for line in file:
+                parts = line.split()
+                if len(parts) == 3 and parts[2] == 'kB':
+                    fields[parts[0].rstrip(':')] = int(parts[1]) * 1024
+    except OSError as e:
+        return {"error": f"Memory report not available: {str(e)}"}
+
+    return {
+        "pid": os.getpid(),
+        "load_mode": LOAD_MODE,
+        "rss": fields.get('Rss', 0),
+        "pss": fields.get('Pss', 0),
+        "shared": fields.get('Shared_Clean', 0) + fields.get('Shared_Dirty', 0),
+        "private": fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0)
+    }
+
+
+@register_collector
+def _collect():
+    # /metrics: 当前 worker 的常驻内存，按共享/私有拆分
+    report = memory_report()
+    if 'error' in report:
+        return []
+    return [('process_memory_bytes', 'gauge', 'Resident memory of this worker process (from smaps_rollup)',
+             [({'kind': kind}, report[kind]) for kind in ('rss', 'pss', 'shared', 'private')])]
@@ -0,0 +1,187 @@
+import os
+import re
+import sys
+import json
+import time
+import socket
+import argparse
+import subprocess
+import statistics
+import urllib.request
+from collections import defaultdict
+
+# 启动时间预算 (秒): 命令行工具和健康检查应远低于 1 秒开始响应
+STARTUP_BUDGET_SECONDS = 1.0
+
+# 默认检查的入口模块 (HTTP 服务和命令行工具)
+DEFAULT_MODULES = ['example', 'asgi_app', 'prediction_service', 'bulk_score', 'load_generator',
+                   'prediction_benchmark', 'prediction_grid']
+
+# 只应在对应模型族首次使用时导入的重量级依赖
+HEAVY_PACKAGES = ['torch', 'sklearn', 'scipy', 'joblib', 'pyarrow', 'pandas', 'flask']
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+_IMPORTTIME_LINE = re.compile(r'^import time:\s*(\d+) \|\s*(\d+) \| ( *)(\S+)')
+
+
+def _env(warmup=False):
+    # 导入分析时关闭后台预热，否则预热线程会在解释器退出前开始加载模型；服务器沿用调用方的设置
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [_HERE, os.environ.get('PYTHONPATH')])))
+    if not warmup:
+        env.setdefault('WARMUP_YEARS', '')
+    return env
+
+
+def import_profile(module, repeats=3):
+    """
+    Imports module in fresh interpreters, once with -X importtime for the breakdown and
+    repeats times without it for the wall-clock figures.
+
+    Parameters:
+    module (str): Module name in js/utils, e.g. 'example'
+    repeats (int): Number of plain runs; the median is reported
+
+    Returns:
+    dict: Median process wall time (interpreter start to exit) and import time in seconds,
+        the heavy packages the import loaded, self time per top-level package and
+        cumulative time per module of this repo, both in ms and sorted descending
+
+    Raises:
+    RuntimeError: If the module cannot be imported
+    """
+    code = (f"import sys, time, json\nstarted = time.perf_counter()\nimport {module}\n"
+            f"print(json.dumps([time.perf_counter() - started, [name for name in {HEAVY_PACKAGES!r} if name in sys.modules]]))")
+    process_seconds, import_seconds = [], []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        result = subprocess.run([sys.executable, '-c', code], cwd=_HERE, env=_env(), capture_output=True, text=True)
+        process_seconds.append(time.perf_counter() - started)
+        if result.returncode != 0:
+            raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+        seconds, heavy = json.loads(result.stdout.strip().splitlines()[-1])
+        import_seconds.append(seconds)
+
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f"import {module}"], cwd=_HERE, env=_env(),
+                            capture_output=True, text=True)
+    packages, own = defaultdict(int), {}
+    for line in result.stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if match is None:
+            continue
+        self_us, cumulative_us, name = int(match.group(1)), int(match.group(2)), match.group(4)
+        packages[name.split('.')[0]] += self_us
+        if os.path.exists(os.path.join(_HERE, name + '.py')):
+            own[name] = cumulative_us
+
+    def ms(values):
+        return {name: round(us / 1000, 1) for name, us in sorted(values.items(), key=lambda item: -item[1])}
+
+    return {
+        "module": module,
+        "process_seconds": round(statistics.median(process_seconds), 3),
+        "import_seconds": round(statistics.median(import_seconds), 3),
+        "heavy_packages": heavy,
+        "package_self_ms": ms(packages),
+        "repo_module_cumulative_ms": ms(own)
+    }
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _server_command(server, port):
+    if server == 'flask':
+        # 不使用 example.py 的 debug 模式，其重载器会再启动一个进程
+        return [sys.executable, '-c', f"import example; example.app.run(port={port})"]
+    return [sys.executable, '-m', 'uvicorn', 'asgi_app:app', '--app-dir', _HERE, '--port', str(port),
+            '--log-level', 'warning']
+
+
+def _wait_for(url, process, timeout):
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        if process.poll() is not None:
+            return None
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                if response.status == 200:
+                    return time.perf_counter()
+        except OSError:
+            pass
+        time.sleep(0.01)
+    return None
+
+
+def server_startup(server, ready=False, timeout=300):
+    """
+    Starts a server process and measures how long it takes until /health (and optionally
+    /ready) answers 200. Warm-up follows the caller's WARMUP_YEARS, so the same call shows
+    both the default background warm-up and the lazy mode (WARMUP_YEARS= ).
+
+    Parameters:
+    server (str): 'flask' (example.py) or 'asgi' (uvicorn asgi_app:app)
+    ready (bool): Also wait for /ready, i.e. for the warm-up to finish
+    timeout (float): Seconds to wait for each endpoint
+
+    Returns:
+    dict: Seconds from process start to the first 200 of /health and /ready (None if it
+        did not answer in time)
+    """
+    port = _free_port()
+    started = time.perf_counter()
+    process = subprocess.Popen(_server_command(server, port), cwd=_HERE, env=_env(warmup=True),
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        health = _wait_for(f'http://127.0.0.1:{port}/health', process, timeout)
+        result = {"server": server, "health_seconds": round(health - started, 3) if health else None}
+        if ready:
+            ready_at = _wait_for(f'http://127.0.0.1:{port}/ready', process, timeout)
+            result["ready_seconds"] = round(ready_at - started, 3) if ready_at else None
+        return result
+    finally:
+        process.terminate()
+        process.wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Show import time per module and server start-up time")
+    parser.add_argument('modules', nargs='*', default=DEFAULT_MODULES, help="Modules in js/utils to import")
+    parser.add_argument('--top', type=int, default=8, help="Packages and repo modules listed per module")
+    parser.add_argument('--serve', nargs='*', choices=['flask', 'asgi'], default=[],
+                        help="Also time how long these servers take to answer /health")
+    parser.add_argument('--ready', action='store_true', help="With --serve, also wait for /ready")
+    parser.add_argument('--budget', type=float, default=STARTUP_BUDGET_SECONDS,
+                        help="Exit with status 1 if a process or /health takes longer than this many seconds")
+    parser.add_argument('--output', help="Also write the results as JSON")
+    args = parser.parse_args()
+
+    results, over_budget = {"imports": [], "servers": []}, []
+    for module in args.modules:
+        profile = import_profile(module)
+        results["imports"].append(profile)
+        print(f"{module:22s} process {profile['process_seconds']:.2f} s  import {profile['import_seconds']:.2f} s  "
+              f"heavy: {', '.join(profile['heavy_packages']) or '-'}")
+        for title, values in (("packages (self)", profile['package_self_ms']),
+                              ("repo modules (cumulative)", profile['repo_module_cumulative_ms'])):
+            top = list(values.items())[:args.top]
+            print(f"    {title}: " + ', '.join(f"{name} {value:.0f} ms" for name, value in top))
+        if profile['process_seconds'] > args.budget:
+            over_budget.append(module)
+
+    for server in args.serve:
+        startup = server_startup(server, args.ready)
+        results["servers"].append(startup)
+        print(f"{server:22s} /health after {startup['health_seconds']} s" +
+              (f", /ready after {startup['ready_seconds']} s" if args.ready else ''))
+        if startup['health_seconds'] is None or startup['health_seconds'] > args.budget:
+            over_budget.append(server)
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+    if over_budget:
+        print(f"Over the {args.budget} s budget: {', '.join(over_budget)}")
+        sys.exit(1)
@@ -0,0 +1,64 @@
+import csv
+import numpy as np
+from model_registry import MODELS_DIR
+
+# 模型训练数据中出现的营销航空公司
+AIRLINES = ['AA', 'AS', 'B6', 'DL', 'F9', 'G4', 'NK', 'UA', 'WN']
+
+
+def load_routes():
+    """Returns the (origin, destination, distance) tuples of the top-30 airport network with a known distance."""
+    with open(f"{MODELS_DIR}/top30_airport_distances.csv", mode='r') as file:
+        return [(row['Origin'], row['Destination'], float(row['Distance']))
+                for row in csv.DictReader(file) if row['Distance']]
+
+
+def generate_flights(n, year=2024, seed=0):
+    """
+    Generates random but realistic flights for benchmarks and model comparisons.
+
+    Routes come from the top-30 airport network (in either direction), dates
+    from May of the given year, departure times from 05:00 to 23:59, and
+    precipitation/extreme weather are mostly zero like the real data.
+
+    Parameters:
+    n (int): Number of flights
+    year (int): Flight year
+    seed (int): Random seed
+
+    Returns:
+    DataFrame: One row per flight with the columns used by predict_delay,
+        predict_flight_cancellation (WEEK, DEP_TIME) and predict_arrival_delay
+    """
+    # pandas 只在生成数据时需要；load_routes 和 AIRLINES 的使用者 (负载生成器、预测网格) 不必导入它
+    import pandas as pd
+
+    rng = np.random.default_rng(seed)
+    routes = load_routes()
+    route_idx = rng.integers(0, len(routes), n)
+    flip = rng.random(n) < 0.5
+    origin = np.array([routes[i][0] for i in route_idx], dtype=object)
+    dest = np.array([routes[i][1] for i in route_idx], dtype=object)
+    origin[flip], dest[flip] = dest[flip], origin[flip]
+    distance = np.array([routes[i][2] for i in route_idx])
+
+    day = rng.integers(1, 32, n)
+    dates = pd.to_datetime(pd.DataFrame({'year': year, 'month': 5, 'day': day}))
+    dep_time = rng.integers(5, 24, n) * 100 + rng.integers(0, 60, n)
+    prcp = np.where(rng.random(n) < 0.7, 0.0, np.round(rng.exponential(0.3, n), 2))
+
+    return pd.DataFrame({
+        'SCH_DEP_TIME': dep_time.astype(float),
+        'DEP_TIME': dep_time.astype(float),
+        'ORIGIN_IATA': origin,
+        'DEST_IATA': dest,
+        'DISTANCE': distance,
+        'PRCP': prcp,
+        'MONTH': 5,
+        'DAY': day,
+        'YEAR': year,
+        # 0=Sunday, 1=Monday, ..., 6=Saturday
+        'WEEK': ((dates.dt.weekday + 1) % 7).to_numpy(),
+        'MKT_AIRLINE': rng.choice(AIRLINES, n),
+        'EXTREME_WEATHER': (rng.random(n) < 0.05).astype(int)
+    })
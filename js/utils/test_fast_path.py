@@ -0,0 +1,161 @@
+import logging
+import numpy as np
+import pandas as pd
+import pytest
+from pandas.testing import assert_frame_equal
+import pred_cancelled_prob
+from pred_dep_delay import prepare_features
+from pred_arr_delay import prepare_arrival_features, ARRIVAL_CATEGORICAL_FEATURES, ARRIVAL_NUMERIC_FEATURES
+from prediction_service import normalize_flight, get_model_year, _delay_frame
+from synthetic_flights import generate_flights
+from fast_path import (HUBS, WEST_COAST, EAST_COAST, CENTRAL, cancellation_features, predict_cancellation_rows,
+                       dep_delay_vectors, arrival_features)
+
+# 每个种子生成的航班数；性质在所有种子的全部航班上检查
+FLIGHTS_PER_SEED = 25
+SEEDS = range(8)
+
+# 负距离在两条路径上都得到 NaN 的 LOG_DISTANCE
+pytestmark = pytest.mark.filterwarnings('ignore:invalid value encountered in log1p:RuntimeWarning')
+
+AIRPORTS = sorted(HUBS | WEST_COAST | EAST_COAST | CENTRAL) + ['BNA', 'AUS', 'ZZZ', 'jfk', '']
+MISSING = object()
+
+
+def _pick(rng, choices):
+    choice = choices[int(rng.integers(len(choices)))]
+    return choice(rng) if callable(choice) else choice
+
+
+def _random_flight_data(rng):
+    # 任意的前端 flightData: 每个字段可能缺失、为 null、为零、超出范围，或是数字字符串
+    fields = {
+        "from": [MISSING, None, lambda r: str(r.choice(AIRPORTS))],
+        "to": [MISSING, None, lambda r: str(r.choice(AIRPORTS))],
+        "airline": [MISSING, None, '', 'AA', 'DL', 'UA', 'WN', 'B6', 'XX'],
+        "flightNumber": [MISSING, None, '', 'AS123', 'F9'],
+        "distance": [MISSING, None, 0, '0', -5, 300, 500, 1500, '2475', 12000.5,
+                     lambda r: float(r.uniform(0, 3000)), lambda r: int(r.integers(1, 3000))],
+        "depTime": [MISSING, None, 0, 559, 600, 959, 1000, 1859, 2359, 2400, -1, '1345', 2400.5,
+                    lambda r: float(r.uniform(-100, 2500)), lambda r: int(r.integers(0, 24) * 100 + r.integers(0, 60))],
+        "week": [MISSING, None, 0, 6, 7, -1, 3.0, '3', '6', lambda r: int(r.integers(0, 7))],
+        "year": [MISSING, None, 1650, 1700, 2019, 2021, 2022, 2023, 2024, 2026, '2023', 2024.0],
+        "time": [MISSING, None, '', 'not a date', '2024-05-15T13:45:00Z', '2023-02-29T10:00:00Z',
+                 '2024-02-29T23:59', lambda r: f"2024-{int(r.integers(1, 13)):02d}-{int(r.integers(1, 29)):02d}T10:00"],
+        "extremeWeather": [MISSING, None, 0, 1, '1'],
+        "rainfall": [MISSING, None, 0, 0.0, 0.1, 0.5, 1.0, 25.0, -0.005, -0.01, -1.0, '0.2',
+                     lambda r: float(r.exponential(0.3))]
+    }
+    flight_data = {}
+    for key, choices in fields.items():
+        value = _pick(rng, choices)
+        if value is not MISSING:
+            flight_data[key] = value
+    return flight_data
+
+
+def _random_flights(seed):
+    # 经过 normalize_flight 的航班 (与服务相同)；无法解析的 flightData 在两条路径之前就被拒绝，跳过
+    rng = np.random.default_rng(seed)
+    flights = []
+    while len(flights) < FLIGHTS_PER_SEED:
+        try:
+            flights.append(normalize_flight(_random_flight_data(rng)))
+        except ValueError:
+            continue
+    return rng, flights
+
+
+def _with_string_week(rng, flight):
+    # 直接调用特征函数时 WEEK 也可能是字符串 (星期名称或其他文本)
+    prediction_data, month, day = flight
+    week = _pick(rng, ['Sun', 'Saturday', 'Mon', 'Wed', '3', 'holiday'])
+    return dict(prediction_data, WEEK=week), month, day
+
+
+@pytest.fixture(autouse=True)
+def quiet_logs():
+    # 到达延误模型缺失时每次预测都会记录警告
+    logging.disable(logging.WARNING)
+    yield
+    logging.disable(logging.NOTSET)
+
+
+def _check_cancellation(prediction_data):
+    expected = pred_cancelled_prob.create_cancellation_features(pd.DataFrame([prediction_data]))
+    actual = pd.DataFrame([cancellation_features(prediction_data)])[list(expected.columns)]
+    assert_frame_equal(actual, expected, check_exact=True, check_dtype=False)
+
+    model_path = pred_cancelled_prob.get_cancellation_model_path(get_model_year(prediction_data['YEAR']))
+    expected = pred_cancelled_prob.predict_cancellation_batch(model_path, pd.DataFrame([prediction_data]))
+    assert predict_cancellation_rows(model_path, [cancellation_features(prediction_data)]) == expected
+
+
+def _check_dep_delay(flight):
+    try:
+        expected = prepare_features(_delay_frame(flight[0]['YEAR'], [flight]))
+    except Exception:
+        expected = None
+    for dtype in (np.float64, np.float32):
+        actual = dep_delay_vectors([flight], dtype=dtype)
+        if actual is None:
+            continue
+        # 快速路径只在能逐位复现 pandas 路径时给出结果
+        assert expected is not None, "fast path scored a flight the pandas path rejects"
+        assert actual.dtype == dtype
+        np.testing.assert_array_equal(actual, expected.astype(dtype))
+    return dep_delay_vectors([flight]) is not None
+
+
+def _check_arrival(flight, dep_delay):
+    prediction_data = flight[0]
+    actual = arrival_features(prediction_data, dep_delay)
+    if actual is None:
+        return False
+    columns = ARRIVAL_CATEGORICAL_FEATURES + ARRIVAL_NUMERIC_FEATURES
+    expected = prepare_arrival_features(_delay_frame(prediction_data['YEAR'], [flight]).assign(
+        WEEK=prediction_data['WEEK'], DEP_DELAY=dep_delay))[columns]
+    assert_frame_equal(pd.DataFrame([actual], columns=columns), expected.astype(object),
+                       check_exact=True, check_dtype=False)
+    return True
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_cancellation_matches_pandas_path(seed):
+    rng, flights = _random_flights(seed)
+    for flight in flights:
+        _check_cancellation(flight[0])
+        _check_cancellation(_with_string_week(rng, flight)[0])
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_dep_delay_inputs_match_pandas_path(seed):
+    rng, flights = _random_flights(seed)
+    for flight in flights:
+        _check_dep_delay(flight)
+        _check_dep_delay(_with_string_week(rng, flight))
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_arrival_features_match_pandas_path(seed):
+    rng, flights = _random_flights(seed)
+    for flight in flights:
+        dep_delay = _pick(rng, [0.0, -12.5, float('nan'), None, lambda r: float(r.normal(15, 30))])
+        _check_arrival(flight, dep_delay)
+        _check_arrival(_with_string_week(rng, flight), dep_delay)
+        # 归一化之后仍可能缺失的数值和机场 (例如直接构造的 prediction_data)
+        prediction_data, month, day = flight
+        key = _pick(rng, ['DEP_TIME', 'PRCP', 'DISTANCE', 'ORIGIN_IATA', 'DEST_IATA'])
+        _check_arrival((dict(prediction_data, **{key: _pick(rng, [None, float('nan')])}), month, day), dep_delay)
+
+
+def test_typical_flights_take_the_fast_path():
+    # 常见输入不应回退到 pandas，否则上面的等价性检查形同虚设
+    flights = generate_flights(200, seed=3)
+    for row in flights.to_dict('records'):
+        flight = normalize_flight({"from": row['ORIGIN_IATA'], "to": row['DEST_IATA'], "airline": row['MKT_AIRLINE'],
+                                   "distance": row['DISTANCE'], "depTime": row['DEP_TIME'], "week": row['WEEK'],
+                                   "year": row['YEAR'], "time": f"2024-05-{row['DAY']:02d}T10:00",
+                                   "extremeWeather": row['EXTREME_WEATHER'], "rainfall": row['PRCP']})
+        assert _check_dep_delay(flight)
+        assert _check_arrival(flight, 12.0)
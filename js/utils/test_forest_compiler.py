@@ -0,0 +1,107 @@
+import os
+import copy
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.compose import ColumnTransformer
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.impute import SimpleImputer
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OneHotEncoder, StandardScaler
+import forest_compiler
+from forest_compiler import CompiledForest, compile_forest, check_parity, LOCKSTEP_MAX_ROWS
+
+
+def _flights(n, seed):
+    # 与取消模型相同的布局: 数值列 (含缺失值) 和字符串分类列 (含缺失值和训练时未见过的类别)
+    rng = np.random.default_rng(seed)
+    data = pd.DataFrame({
+        'DISTANCE': rng.uniform(100, 3000, n),
+        'PRCP': np.where(rng.random(n) < 0.7, 0.0, rng.exponential(0.3, n)),
+        'DEP_TIME': rng.integers(0, 2400, n).astype(float),
+        'MKT_AIRLINE': rng.choice(['AA', 'DL', 'UA', 'WN', 'B6'], n).astype(object),
+        'ORIGIN_IATA': rng.choice(['ATL', 'JFK', 'LAX', 'ORD', 'DEN', 'SEA'], n).astype(object),
+    })
+    data.loc[rng.random(n) < 0.05, 'PRCP'] = np.nan
+    data.loc[rng.random(n) < 0.05, 'MKT_AIRLINE'] = np.nan
+    return data
+
+
+@pytest.fixture(scope='module')
+def pipeline():
+    train = _flights(3000, seed=0)
+    rng = np.random.default_rng(1)
+    target = ((train['PRCP'].fillna(0) > 0.4) | (train['DEP_TIME'] > 2100) |
+              (train['MKT_AIRLINE'] == 'B6')) ^ (rng.random(len(train)) < 0.1)
+    preprocessor = ColumnTransformer([
+        ('num', Pipeline([('imputer', SimpleImputer(strategy='median')), ('scaler', StandardScaler())]),
+         ['DISTANCE', 'PRCP', 'DEP_TIME']),
+        ('cat', Pipeline([('imputer', SimpleImputer(strategy='constant', fill_value='missing')),
+                          ('onehot', OneHotEncoder(handle_unknown='ignore'))]),
+         ['MKT_AIRLINE', 'ORIGIN_IATA'])
+    ])
+    # 不限制叶子大小，树的深度参差不齐，覆盖叶子向下复制到最底层的情况
+    forest = RandomForestClassifier(n_estimators=30, max_depth=9, random_state=0)
+    return Pipeline([('preprocessor', preprocessor), ('classifier', forest)]).fit(train, target)
+
+
+@pytest.fixture(scope='module')
+def scoring_flights():
+    flights = _flights(4000, seed=2)
+    flights.loc[::97, 'ORIGIN_IATA'] = 'ZZZ'
+    return flights
+
+
+def test_single_rows_match_predict_proba(pipeline, scoring_flights):
+    compiled = compile_forest(pipeline)
+    for i in range(0, len(scoring_flights), 40):
+        row = scoring_flights.iloc[[i]]
+        expected = pipeline.predict_proba(row)
+        np.testing.assert_allclose(compiled.predict_proba(row), expected, rtol=0, atol=1e-12)
+        # 服务按字典传入单个航班的标量
+        as_dict = {column: row[column].iloc[0] for column in row.columns}
+        np.testing.assert_allclose(compiled.predict_proba(as_dict), expected, rtol=0, atol=1e-12)
+
+
+def test_large_batch_matches_predict_proba(pipeline, scoring_flights):
+    compiled = compile_forest(pipeline)
+    assert len(scoring_flights) > LOCKSTEP_MAX_ROWS
+    np.testing.assert_allclose(compiled.predict_proba(scoring_flights), pipeline.predict_proba(scoring_flights),
+                               rtol=0, atol=1e-12)
+    assert check_parity(pipeline, compiled, scoring_flights) <= 1e-12
+
+
+def test_lockstep_and_per_tree_traversal_agree(pipeline, scoring_flights):
+    compiled = compile_forest(pipeline)
+    X = compiled.preprocessor.transform(scoring_flights.iloc[:LOCKSTEP_MAX_ROWS], dtype=np.float32)
+    np.testing.assert_allclose(compiled._traverse_lockstep(X), compiled._traverse_per_tree(X), rtol=0, atol=1e-12)
+
+
+def test_check_parity_raises_on_mismatch(pipeline, scoring_flights):
+    compiled = copy.deepcopy(compile_forest(pipeline))
+    compiled.leaf_value = compiled.leaf_value[:, ::-1].copy()
+    with pytest.raises(ValueError, match="differs from sklearn"):
+        check_parity(pipeline, compiled, scoring_flights.iloc[:100])
+
+
+def test_too_deep_forest_is_rejected(pipeline, monkeypatch):
+    monkeypatch.setattr(forest_compiler, 'MAX_COMPILED_DEPTH', 3)
+    with pytest.raises(ValueError, match="too deep"):
+        CompiledForest(pipeline)
+
+
+@pytest.mark.parametrize('year', [2021, 2023, 2024])
+def test_shipped_cancellation_models(year):
+    import joblib
+    from pred_cancelled_prob import get_cancellation_model_path, create_cancellation_features, CANCELLATION_FEATURES
+    from synthetic_flights import generate_flights
+
+    model_path = get_cancellation_model_path(year)
+    if not os.path.exists(model_path):
+        pytest.skip(f"No cancellation model for {year}")
+    pipeline = joblib.load(model_path)
+    compiled = compile_forest(pipeline)
+    flights = create_cancellation_features(generate_flights(2000, year=year, seed=year))[CANCELLATION_FEATURES]
+    assert check_parity(pipeline, compiled, flights) == 0.0
+    for i in range(0, 2000, 250):
+        np.testing.assert_array_equal(compiled.predict_proba(flights.iloc[[i]]), pipeline.predict_proba(flights.iloc[[i]]))
@@ -0,0 +1,80 @@
+import threading
+from concurrent.futures import Future
+import pytest
+from prediction_cache import PredictionCache
+from prediction_service import _is_cacheable
+
+MISSING_CANCELLATION = "Failed to load model: [Errno 2] No such file or directory: 'models/cancelled_prob/May2022_model.joblib'"
+MISSING_ARRIVAL = "Models for year 2022 not found in models/arr_delay_rf_models/year_2022"
+
+
+def _response():
+    return {"cancellation_probability": 0.05, "delay_confidence_interval": {"lower": 0.0, "upper": 110.0}}
+
+
+def _resolved(value):
+    future = Future()
+    future.set_result(value)
+    return future
+
+
+@pytest.mark.parametrize('result', [
+    _response(),
+    {"error": MISSING_CANCELLATION, "arrival_delay_error": MISSING_ARRIVAL},
+    dict(_response(), arrival_delay_error=MISSING_ARRIVAL),
+    dict(_response(), delay_error="[Errno 2] No such file or directory: 'resnet_classifier_2022.pth'"),
+])
+def test_missing_models_are_cached(result):
+    assert _is_cacheable(result)
+
+
+@pytest.mark.parametrize('result', [
+    {"error": "Prediction failed: boom", "arrival_delay_error": MISSING_ARRIVAL},
+    {"error": MISSING_CANCELLATION, "arrival_delay_error": "Failed to load models: truncated file"},
+    dict(_response(), delay_error="RuntimeError: out of memory"),
+    dict(_response(), arrival_delay_error="Prediction failed: boom"),
+])
+def test_transient_failures_are_not_cached(result):
+    assert not _is_cacheable(result)
+
+
+def test_callers_get_their_own_copy():
+    cache = PredictionCache()
+    leader = cache.lookup('key', lambda: _resolved(_response())).result()
+    leader["delay_confidence_interval"]["upper"] = -1.0
+
+    hit = cache.lookup('key', lambda: pytest.fail("computed twice")).result()
+    assert hit == _response()
+    hit["cancellation_probability"] = 1.0
+    assert cache.get('key') == _response()
+
+    value = _response()
+    cache.put('other', value)
+    value["delay_confidence_interval"]["lower"] = 5.0
+    assert cache.get('other') == _response()
+
+
+def test_coalesced_callers_get_their_own_copy():
+    cache = PredictionCache()
+    source = Future()
+    leader = cache.lookup('key', lambda: source)
+    follower = cache.lookup('key', lambda: pytest.fail("computed twice"))
+    threading.Thread(target=source.set_result, args=(_response(),)).start()
+
+    leader.result()["delay_confidence_interval"]["upper"] = -1.0
+    assert follower.result() == _response()
+    assert follower.result() is not leader.result()
+    assert cache.stats()["coalesced"] == 1
+
+
+def test_coalesced_callers_see_the_leaders_error():
+    cache = PredictionCache()
+    source = Future()
+    leader = cache.lookup('key', lambda: source)
+    follower = cache.lookup('key', lambda: pytest.fail("computed twice"))
+    source.set_exception(RuntimeError("boom"))
+
+    for future in (leader, follower):
+        with pytest.raises(RuntimeError, match="boom"):
+            future.result()
+    assert cache.get('key') is None
@@ -0,0 +1,138 @@
+import os
+import time
+import logging
+import threading
+from lazy_imports import LazyModule
+from pred_cancelled_prob import predict_flight_cancellation, get_cancellation_model_path
+from pred_dep_delay import predict_delay
+from pred_arr_delay import predict_arrival_delay, DEFAULT_MODEL_DIR as ARR_DELAY_MODEL_DIR
+
+pd = LazyModule('pandas')
+
+# 启动时预热的年份，逗号分隔；设置为空字符串可关闭预热
+WARMUP_YEARS = [int(y) for y in os.environ.get('WARMUP_YEARS', '2021,2022,2023,2024').split(',') if y.strip()]
+
+# 预热用的示例航班 (JFK -> LAX)
+_SAMPLE_FLIGHT = {
+    'SCH_DEP_TIME': 1345.0,
+    'ORIGIN_IATA': 'JFK',
+    'DEST_IATA': 'LAX',
+    'DISTANCE': 2475.0,
+    'PRCP': 0.0,
+    'MONTH': 5,
+    'DAY': 15,
+    'MKT_AIRLINE': 'AA',
+    'EXTREME_WEATHER': 0,
+    'WEEK': 3
+}
+
+_status_lock = threading.Lock()
+_status = {
+    "ready": False,
+    "years": WARMUP_YEARS,
+    "completed": [],
+    "errors": {},
+    "elapsed_seconds": None
+}
+
+
+def get_status():
+    """Returns a snapshot of the warm-up progress for the /ready endpoint."""
+    with _status_lock:
+        return {
+            "ready": _status["ready"],
+            "years": list(_status["years"]),
+            "completed": list(_status["completed"]),
+            "errors": dict(_status["errors"]),
+            "elapsed_seconds": _status["elapsed_seconds"]
+        }
+
+
+def _record(step, error=None):
+    with _status_lock:
+        if error is None:
+            _status["completed"].append(step)
+        else:
+            _status["errors"][step] = error
+            logging.warning(f"Warm-up step {step} failed: {error}")
+
+
+def _warm_year(year):
+    # 随机森林: 加载模型并执行一次 predict_proba
+    flight = dict(_SAMPLE_FLIGHT, YEAR=year, DEP_TIME=_SAMPLE_FLIGHT['SCH_DEP_TIME'])
+    result = predict_flight_cancellation(get_cancellation_model_path(year), flight)
+    _record(f"cancelled_prob/{year}", result.get("error"))
+
+    # ResNet: 加载预处理器和两个网络，执行一次前向传播
+    try:
+        delay_data = pd.DataFrame([dict(_SAMPLE_FLIGHT, YEAR=year)])
+        _, delay_times, _, _ = predict_delay(delay_data)
+        _record(f"dep_delay_nn/{year}")
+    except Exception as e:
+        _record(f"dep_delay_nn/{year}", str(e))
+        return
+
+    # 到达延误随机森林
+    arr_input = dict(_SAMPLE_FLIGHT, YEAR=year, DEP_DELAY=float(delay_times[0][0]))
+    result = predict_arrival_delay(ARR_DELAY_MODEL_DIR, arr_input, year=year)
+    _record(f"arr_delay/{year}", result.get("error") if isinstance(result, dict) else None)
+
+    _warm_fast_path(year)
+
+
+def _warm_fast_path(year):
+    # 小请求走的快速路径不经过 pandas，另有自己的对象 (编译后的预处理器、特征表、稀疏输入的网络)；
+    # 按请求的顺序各运行一次，使它们在 /ready 之前 (以及 preload 的 fork 之前) 就已建好
+    import prediction_service
+    from fast_path import cancellation_features, predict_cancellation_rows, dep_delay_vectors, arrival_features
+    from pred_dep_delay import predict_delay_from_features, SPARSE_INPUT
+
+    if prediction_service.FAST_PATH_MAX_FLIGHTS < 1:
+        return
+    # 不带距离，按请求的方式查一次机场距离表
+    prediction_data, month, day = prediction_service.normalize_flight({
+        "from": _SAMPLE_FLIGHT['ORIGIN_IATA'], "to": _SAMPLE_FLIGHT['DEST_IATA'], "airline": _SAMPLE_FLIGHT['MKT_AIRLINE'],
+        "depTime": _SAMPLE_FLIGHT['SCH_DEP_TIME'], "week": _SAMPLE_FLIGHT['WEEK'], "year": year,
+        "time": f"{year}-{_SAMPLE_FLIGHT['MONTH']:02d}-{_SAMPLE_FLIGHT['DAY']:02d}T13:45:00"
+    })
+    try:
+        # 缺失的取消模型已在 cancelled_prob 步骤中记录，这里只需建好编译后的预处理器
+        predict_cancellation_rows(get_cancellation_model_path(year), [cancellation_features(prediction_data)])
+        X_processed = dep_delay_vectors([(prediction_data, month, day)], sparse=SPARSE_INPUT)
+        _, delay_times, _, _ = predict_delay_from_features(year, X_processed)
+        arrival_features(prediction_data, float(delay_times[0, 0]))
+        _record(f"fast_path/{year}")
+    except Exception as e:
+        _record(f"fast_path/{year}", str(e))
+
+
+def warm_up(years=None):
+    """
+    Preloads every model for the given years and runs one dummy prediction
+    through each of them, on both the DataFrame path and the fast path for
+    small requests, so the first real request does not pay for
+    deserialization or lazy initialization.
+
+    Parameters:
+    years (list): Model years to warm up (default: WARMUP_YEARS)
+    """
+    years = WARMUP_YEARS if years is None else years
+    start = time.perf_counter()
+    with _status_lock:
+        _status.update(ready=False, years=list(years), completed=[], errors={}, elapsed_seconds=None)
+
+    for year in years:
+        _warm_year(year)
+
+    with _status_lock:
+        # 缺失的模型文件只记录在 errors 中，不阻塞就绪状态
+        _status["ready"] = True
+        _status["elapsed_seconds"] = round(time.perf_counter() - start, 3)
+    logging.info(f"Warm-up finished in {_status['elapsed_seconds']}s for years {years}")
+
+
+def start_warmup(years=None):
+    """Runs warm_up in a daemon thread so the server can report progress on /ready."""
+    thread = threading.Thread(target=warm_up, args=(years,), name="model-warmup", daemon=True)
+    thread.start()
+    return thread